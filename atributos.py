@@ -0,0 +1,56 @@
+"""
+Atributos que define prompt_api.txt y conversión del formato `atributo: valor`
+"""
+
+import re
+from typing import Dict, List
+
+
+# Orden de salida definido en prompt_api.txt
+ATTRIBUTE_NAMES: List[str] = [
+    'Tipo', 'Detalles', 'Bolsillos', 'Composición', 'Número de piezas',
+    'Género', 'Corte', 'Características especiales', 'Tipo de cierre',
+    'Color del armazón', 'Largo', 'Color', 'Estilo', 'ColorAgrupador',
+    'Tipo de producto', 'Tipo de cuello', 'Material', 'Cintura',
+    'Tipo de manga', 'Ocasión', 'Tipo de estampado', 'Otros'
+]
+
+MISSING_VALUE = 'nan'
+
+# Nombres más largos primero para que "Tipo de producto" gane a "Tipo"
+_ATTRIBUTE_PATTERN = re.compile(
+    r'(?:^|,)\s*(' + '|'.join(re.escape(name) for name in sorted(ATTRIBUTE_NAMES, key=len, reverse=True)) + r')\s*:\s*'
+)
+
+
+def parse_attributes(text: str) -> Dict[str, str]:
+    """
+    Convierte `Tipo: nan, Detalles: cintura elástica, ...` en diccionario.
+
+    Los valores pueden contener comas: cada valor llega hasta el siguiente
+    nombre de atributo conocido.
+    """
+    if not isinstance(text, str) or text.startswith('ERROR'):
+        return {}
+
+    text = text.strip().strip('`').strip()
+    matches = list(_ATTRIBUTE_PATTERN.finditer(text))
+
+    attributes: Dict[str, str] = {}
+    for i, match in enumerate(matches):
+        end = matches[i + 1].start() if i + 1 < len(matches) else len(text)
+        value = text[match.end():end].strip().rstrip(',').strip()
+        attributes[match.group(1)] = value
+    return attributes
+
+
+def format_attributes(attributes: Dict[str, str]) -> str:
+    """Serializa un diccionario en el formato de salida del prompt (orden fijo)."""
+    return ', '.join(
+        f"{name}: {attributes.get(name) or MISSING_VALUE}" for name in ATTRIBUTE_NAMES
+    )
+
+
+def is_missing(value) -> bool:
+    """True si el valor representa un atributo no encontrado."""
+    return value is None or str(value).strip().lower() in ('', 'nan', 'none', 'null')
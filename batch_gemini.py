@@ -0,0 +1,185 @@
+"""
+Modo batch de Gemini para backfills nocturnos
+Genera el JSONL de requests, sube imágenes por la Files API, envía el job,
+consulta su estado con backoff e ingiere los resultados por id.
+
+Todas las funciones reciben el cliente como parámetro, de modo que se pueden
+apuntar a un servidor local que imite los endpoints de batch
+(ver GEMINI_BASE_URL en extraer_atributos.py).
+"""
+
+import json
+import time
+import logging
+from pathlib import Path
+from typing import Dict, Iterable, Optional, Tuple
+
+from google import genai
+from google.genai import types
+
+from motor_async import get_mime_type
+from uso_tokens import TokenUsage
+
+
+logger = logging.getLogger(__name__)
+
+
+TERMINAL_STATES = {
+    'JOB_STATE_SUCCEEDED',
+    'JOB_STATE_PARTIALLY_SUCCEEDED',
+    'JOB_STATE_FAILED',
+    'JOB_STATE_CANCELLED',
+    'JOB_STATE_EXPIRED',
+}
+SUCCESS_STATES = {'JOB_STATE_SUCCEEDED', 'JOB_STATE_PARTIALLY_SUCCEEDED'}
+
+
+def job_state(job: types.BatchJob) -> str:
+    """Nombre del estado del job (enum o string según el cliente)."""
+    return getattr(job.state, 'name', str(job.state))
+
+
+def upload_image(client: genai.Client, image_path: Path) -> types.File:
+    """Sube una imagen por la Files API."""
+    return client.files.upload(
+        file=str(image_path),
+        config=types.UploadFileConfig(mime_type=get_mime_type(image_path))
+    )
+
+
+def build_batch_requests(
+    client: genai.Client,
+    items: Iterable[Tuple[str, Path]],
+    prompt: str,
+    output_jsonl: Path,
+    prompts: Optional[Dict[str, str]] = None
+) -> int:
+    """
+    Escribe una línea JSONL por producto pendiente.
+
+    Args:
+        items: Pares (id del producto, ruta de la imagen)
+        prompt: Texto del prompt
+        output_jsonl: Archivo de requests a generar
+        prompts: Prompt propio por id de producto (reemplaza a `prompt`)
+
+    Returns:
+        Número de requests escritas
+    """
+    uploaded: Dict[Path, types.File] = {}
+    written = 0
+
+    with open(output_jsonl, 'w', encoding='utf-8') as f:
+        for product_id, image_path in items:
+            # Coppel repite la misma foto en varios SKUs: subir una vez
+            if image_path not in uploaded:
+                uploaded[image_path] = upload_image(client, image_path)
+            image_file = uploaded[image_path]
+
+            line = {
+                'key': product_id,
+                'request': {
+                    'contents': [{
+                        'role': 'user',
+                        'parts': [
+                            {'file_data': {'file_uri': image_file.uri, 'mime_type': image_file.mime_type}},
+                            {'text': (prompts or {}).get(product_id, prompt)}
+                        ]
+                    }]
+                }
+            }
+            f.write(json.dumps(line, ensure_ascii=False) + '\n')
+            written += 1
+
+    logger.info(f"Batch: {written} requests escritas en {output_jsonl} ({len(uploaded)} imágenes subidas)")
+    return written
+
+
+def submit_batch(
+    client: genai.Client,
+    model_name: str,
+    requests_jsonl: Path,
+    display_name: str
+) -> types.BatchJob:
+    """Sube el JSONL de requests y crea el job de batch."""
+    requests_file = client.files.upload(
+        file=str(requests_jsonl),
+        config=types.UploadFileConfig(display_name=display_name, mime_type='jsonl')
+    )
+    job = client.batches.create(
+        model=model_name,
+        src=requests_file.name,
+        config={'display_name': display_name}
+    )
+    logger.info(f"Batch enviado: {job.name}")
+    return job
+
+
+def wait_for_batch(
+    client: genai.Client,
+    job_name: str,
+    initial_delay: float = 30,
+    max_delay: float = 600,
+    timeout: Optional[float] = None
+) -> types.BatchJob:
+    """Consulta el job con backoff exponencial hasta que llegue a un estado final."""
+    start_time = time.time()
+    delay = initial_delay
+
+    while True:
+        job = client.batches.get(name=job_name)
+        state = job_state(job)
+        logger.info(f"Batch {job_name}: {state}")
+
+        if state in TERMINAL_STATES:
+            return job
+
+        if timeout is not None and time.time() - start_time + delay > timeout:
+            raise TimeoutError(f"Batch {job_name} sigue en {state} tras {timeout}s")
+
+        time.sleep(delay)
+        delay = min(max_delay, delay * 2)
+
+
+def response_text(response: Dict) -> str:
+    """Concatena el texto de la primera candidata de una respuesta en JSON."""
+    candidates = response.get('candidates') or []
+    if not candidates:
+        feedback = response.get('promptFeedback') or response.get('prompt_feedback') or {}
+        return f"ERROR_API_FATAL: Sin candidatas ({feedback.get('blockReason', feedback.get('block_reason', 'desconocido'))})"
+
+    parts = (candidates[0].get('content') or {}).get('parts') or []
+    text = ''.join(part.get('text', '') for part in parts)
+    return text.strip().replace('\n', ' ')
+
+
+def download_batch_results(client: genai.Client, job: types.BatchJob) -> Dict[str, Tuple[str, TokenUsage]]:
+    """
+    Descarga los resultados del job.
+
+    Returns:
+        Diccionario id → (atributos o mensaje de error, uso de tokens de la solicitud)
+    """
+    if job_state(job) not in SUCCESS_STATES:
+        raise RuntimeError(f"Batch {job.name} terminó en {job_state(job)}: {job.error}")
+
+    content = client.files.download(file=job.dest.file_name)
+    if isinstance(content, bytes):
+        content = content.decode('utf-8')
+
+    results: Dict[str, Tuple[str, TokenUsage]] = {}
+    for line in content.splitlines():
+        if not line.strip():
+            continue
+        record = json.loads(line)
+        key = str(record.get('key'))
+        response = record.get('response') or {}
+        usage = TokenUsage.from_json(response.get('usageMetadata'))
+
+        if record.get('error'):
+            results[key] = (f"ERROR_API_FATAL: {record['error']}", usage)
+        else:
+            results[key] = (response_text(response), usage)
+
+    logger.info(f"Batch {job.name}: {len(results)} resultados descargados")
+    return results
@@ -0,0 +1,156 @@
+"""
+Bitácora append-only (JSONL) de resultados de extracción
+Cada producto terminado se escribe como un registro durable; el CSV final
+se construye compactando la bitácora en un solo paso.
+"""
+
+import os
+import json
+import logging
+from pathlib import Path
+from datetime import datetime
+from typing import Any, Dict, Iterator, List
+
+import pandas as pd
+
+
+logger = logging.getLogger(__name__)
+
+
+class ResultJournal:
+    """Bitácora JSONL de resultados, un registro por producto terminado"""
+
+    def __init__(self, path: Path, fsync: bool = True):
+        self.path = Path(path)
+        self.fsync = fsync
+        self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def append(self, index: Any, product_id: str, attributes: str, **extra):
+        """Agrega un registro y lo fuerza a disco."""
+        if self._file is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._file = open(self.path, 'a', encoding='utf-8')
+
+        # Índices numpy → tipos nativos para que coincidan al recargar
+        if hasattr(index, 'item'):
+            index = index.item()
+
+        record = {
+            'index': index,
+            'id': product_id,
+            'attributes': attributes,
+            'timestamp': datetime.now().isoformat(),
+            **{key: value for key, value in extra.items() if value is not None}
+        }
+        self._file.write(json.dumps(record, ensure_ascii=False, default=str) + '\n')
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def iter_records(self) -> Iterator[Dict[str, Any]]:
+        """Itera los registros; ignora una última línea truncada por un corte abrupto."""
+        if not self.path.exists():
+            return
+
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line_number, line in enumerate(f, start=1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    logger.warning(f"Bitácora {self.path}: línea {line_number} corrupta, se ignora")
+
+    def load(self) -> Dict[Any, Dict[str, Any]]:
+        """Último registro por índice de fila (el más reciente gana)."""
+        return {record['index']: record for record in self.iter_records()}
+
+
+def resolve_records(journal: ResultJournal, product_ids: pd.Series) -> Dict[Any, Dict[str, Any]]:
+    """
+    Último registro de cada fila del CSV, ubicada por id del producto.
+
+    El índice guardado solo se respeta si esa fila sigue teniendo el mismo id;
+    si el CSV se editó, reordenó o se insertaron filas, el registro se mueve a
+    la fila con su id. Los registros cuyo id ya no está en el CSV (o aparece
+    en varias filas) se descartan con un aviso.
+
+    Args:
+        product_ids: Índice de fila → id del producto
+    """
+    rows_by_id: Dict[str, List[Any]] = {}
+    for index, product_id in product_ids.items():
+        rows_by_id.setdefault(str(product_id), []).append(index)
+
+    resolved: Dict[Any, Dict[str, Any]] = {}
+    relocated = skipped = 0
+    for record in journal.iter_records():
+        record_id = str(record.get('id'))
+        index = record.get('index')
+        if index not in product_ids.index or str(product_ids[index]) != record_id:
+            candidates = rows_by_id.get(record_id, [])
+            if len(candidates) != 1:
+                skipped += 1
+                continue
+            index = candidates[0]
+            relocated += 1
+        resolved[index] = record
+
+    if relocated:
+        logger.info(f"Bitácora {journal.path}: {relocated} registros reubicados por id (el CSV cambió de orden)")
+    if skipped:
+        logger.warning(f"Bitácora {journal.path}: {skipped} registros sin una fila única con su id en el CSV, se ignoran")
+    return resolved
+
+
+def apply_journal(
+    df: pd.DataFrame,
+    journal: ResultJournal,
+    attributes_column: str,
+    product_ids: pd.Series
+) -> int:
+    """
+    Aplica los registros de la bitácora sobre el DataFrame (por id del producto).
+
+    Returns:
+        Número de filas actualizadas
+    """
+    records = resolve_records(journal, product_ids)
+    for index, record in records.items():
+        df.at[index, attributes_column] = record['attributes']
+    return len(records)
+
+
+def compact_journal(
+    df: pd.DataFrame,
+    journal: ResultJournal,
+    output_csv: Path,
+    attributes_column: str,
+    product_ids: pd.Series
+) -> pd.DataFrame:
+    """Construye el CSV final aplicando la bitácora en un solo paso de escritura."""
+    applied = apply_journal(df, journal, attributes_column, product_ids)
+    df.to_csv(output_csv, index=False, encoding='utf-8')
+    logger.info(f"Bitácora compactada: {applied} registros → {output_csv}")
+    return df
+
+
+def flagged_rows(journal: ResultJournal, product_ids: pd.Series) -> Dict[Any, List[str]]:
+    """Índice → atributos irreparables, para las filas cuyo último registro trae `invalid`."""
+    return {
+        index: record['invalid']
+        for index, record in resolve_records(journal, product_ids).items()
+        if record.get('invalid')
+    }
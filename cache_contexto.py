@@ -0,0 +1,62 @@
+"""
+Context caching explícito de Gemini para la parte estática del prompt
+El prefijo (reglas y listas cerradas) se registra una vez por corrida con TTL
+y cada llamada lo referencia por nombre.
+"""
+
+import logging
+from typing import Optional
+
+from google import genai
+from google.genai import types
+
+
+logger = logging.getLogger(__name__)
+
+
+def create_context_cache(
+    client: genai.Client,
+    model_name: str,
+    static_prefix: str,
+    ttl_seconds: int = 3600,
+    display_name: str = 'prompt-atributos'
+) -> Optional[str]:
+    """
+    Registra el prefijo estático como cached content.
+
+    Returns:
+        Nombre del cached content, o None si el modelo no admite caché
+        (por ejemplo modelos experimentales o prefijos demasiado cortos)
+    """
+    try:
+        cached = client.caches.create(
+            model=model_name,
+            config=types.CreateCachedContentConfig(
+                display_name=display_name,
+                contents=[types.Content(role='user', parts=[types.Part.from_text(text=static_prefix)])],
+                ttl=f"{ttl_seconds}s"
+            )
+        )
+        logger.info(f"Context cache creado: {cached.name} (TTL {ttl_seconds}s)")
+        return cached.name
+    except Exception as e:
+        logger.warning(f"No se pudo crear el context cache, se enviará el prompt completo: {e}")
+        return None
+
+
+def delete_context_cache(client: genai.Client, name: Optional[str]):
+    """Elimina el cached content al terminar la corrida (el TTL lo haría de todos modos)."""
+    if not name:
+        return
+    try:
+        client.caches.delete(name=name)
+        logger.info(f"Context cache eliminado: {name}")
+    except Exception as e:
+        logger.warning(f"No se pudo eliminar el context cache {name}: {e}")
+
+
+def cached_token_count(usage_metadata) -> int:
+    """Tokens de entrada servidos desde el context cache según `usage_metadata`."""
+    if usage_metadata is None:
+        return 0
+    return getattr(usage_metadata, 'cached_content_token_count', None) or 0
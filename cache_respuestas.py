@@ -0,0 +1,98 @@
+"""
+Caché en disco de respuestas de Gemini direccionada por contenido
+La llave es SHA-256 de los bytes de la imagen + hash del prompt + modelo,
+así que SKUs con la misma foto y reintentos tras una caída no vuelven a pagar.
+"""
+
+import time
+import hashlib
+import sqlite3
+import logging
+from pathlib import Path
+from typing import Optional
+
+
+logger = logging.getLogger(__name__)
+
+
+def sha256_hex(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def make_cache_key(image_bytes: bytes, prompt: str, model_name: str) -> str:
+    """Llave de caché: hash de imagen, hash de prompt y modelo."""
+    parts = [sha256_hex(image_bytes), sha256_hex(prompt.encode('utf-8')), model_name]
+    return sha256_hex('|'.join(parts).encode('utf-8'))
+
+
+class ResponseCache:
+    """Caché SQLite de respuestas con desalojo LRU por tamaño total"""
+
+    def __init__(self, path: Path, max_bytes: int = 200 * 1024 * 1024):
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+
+        self._conn = sqlite3.connect(str(self.path))
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute(
+            '''CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                model TEXT NOT NULL,
+                response TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created REAL NOT NULL,
+                last_access REAL NOT NULL
+            )'''
+        )
+        self._conn.execute('CREATE INDEX IF NOT EXISTS idx_last_access ON responses(last_access)')
+        self._conn.commit()
+
+    def get(self, key: str) -> Optional[str]:
+        row = self._conn.execute('SELECT response FROM responses WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self._conn.execute('UPDATE responses SET last_access = ? WHERE key = ?', (time.time(), key))
+        self._conn.commit()
+        return row[0]
+
+    def put(self, key: str, model_name: str, response: str):
+        now = time.time()
+        size = len(response.encode('utf-8'))
+        self._conn.execute(
+            'INSERT OR REPLACE INTO responses (key, model, response, size, created, last_access) '
+            'VALUES (?, ?, ?, ?, ?, ?)',
+            (key, model_name, response, size, now, now)
+        )
+        self._conn.commit()
+        self.evict()
+
+    def total_bytes(self) -> int:
+        return self._conn.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+
+    def evict(self):
+        """Elimina las entradas menos usadas hasta bajar del 90% de `max_bytes`."""
+        total = self.total_bytes()
+        if total <= self.max_bytes:
+            return
+
+        target = int(self.max_bytes * 0.9)
+        removed = 0
+        for key, size in self._conn.execute(
+            'SELECT key, size FROM responses ORDER BY last_access ASC'
+        ).fetchall():
+            if total <= target:
+                break
+            self._conn.execute('DELETE FROM responses WHERE key = ?', (key,))
+            total -= size
+            removed += 1
+
+        self._conn.commit()
+        logger.info(f"Caché: {removed} entradas desalojadas ({total} bytes restantes)")
+
+    def close(self):
+        self._conn.close()
@@ -0,0 +1,85 @@
+"""
+Cascada de modelos: uno pequeño y rápido primero, el grande solo si hace falta
+Una fila sube al siguiente nivel cuando su resultado no pasa la validación de
+listas cerradas, le faltan atributos obligatorios o contradice los metadatos
+del CSV.
+"""
+
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from atributos import parse_attributes
+from cobertura_solicitudes import percentile
+from validacion import check_metadata, validate_record
+
+
+# USD por millón de tokens (entrada, salida); la salida incluye thinking
+MODEL_PRICES: Dict[str, Tuple[float, float]] = {
+    'gemini-2.5-flash-lite': (0.10, 0.40),
+    'gemini-2.5-flash': (0.30, 2.50),
+    'gemini-2.5-pro': (1.25, 10.00),
+    'gemini-2.0-flash': (0.10, 0.40),
+}
+
+# Errores que justifican probar con el modelo más grande
+ESCALATABLE_ERRORS = ('ERROR_API_FATAL', 'ERROR_JSON', 'ERROR_EMPAQUETADO')
+
+
+def estimate_cost(model_name: str, input_tokens: int, output_tokens: int) -> Optional[float]:
+    """Costo en USD según MODEL_PRICES; None si el modelo no tiene precio conocido."""
+    prices = MODEL_PRICES.get(model_name)
+    if prices is None:
+        return None
+    return (input_tokens * prices[0] + output_tokens * prices[1]) / 1_000_000
+
+
+def escalation_reasons(
+    attributes: str,
+    record: Optional[Dict[str, str]],
+    metadata: Dict[str, str],
+    closed_lists: Dict[str, List[str]],
+    invalid: Optional[Dict[str, str]] = None
+) -> List[str]:
+    """
+    Motivos para escalar una fila al siguiente modelo.
+
+    Los errores permanentes o locales (imagen faltante, bloqueo de seguridad)
+    no escalan: otro modelo no los resolvería. `invalid` son los valores que
+    el normalizador no pudo mapear a la lista cerrada (ya reemplazados por
+    `nan` en el registro).
+    """
+    if attributes.startswith('ERROR'):
+        return [attributes[:80]] if attributes.startswith(ESCALATABLE_ERRORS) else []
+
+    if record is None:
+        record = parse_attributes(attributes)
+    reasons = [f"{name}: '{value}' fuera de la lista cerrada" for name, value in (invalid or {}).items()]
+    return reasons + validate_record(record, closed_lists) + check_metadata(record, metadata, closed_lists)
+
+
+@dataclass
+class TierStats:
+    """Resultados de un nivel de la cascada"""
+    model_name: str
+    rows: int = 0
+    escalated: int = 0
+    api_calls: int = 0
+    input_tokens: int = 0
+    output_tokens: int = 0
+    latencies: List[float] = field(default_factory=list)
+    elapsed: float = 0.0
+
+    @property
+    def mean_latency(self) -> float:
+        return sum(self.latencies) / len(self.latencies) if self.latencies else 0.0
+
+    @property
+    def cost(self) -> Optional[float]:
+        return estimate_cost(self.model_name, self.input_tokens, self.output_tokens)
+
+    def describe(self) -> str:
+        cost = f"${self.cost:.4f}" if self.cost is not None else "costo desconocido"
+        return (f"{self.model_name}: {self.rows} filas, {self.escalated} escaladas, "
+                f"{self.api_calls} llamadas, latencia media {self.mean_latency:.1f}s "
+                f"(p90 {percentile(self.latencies, 90):.1f}s), "
+                f"{self.input_tokens:,} tokens entrada / {self.output_tokens:,} salida, {cost}")
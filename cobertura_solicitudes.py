@@ -0,0 +1,150 @@
+"""
+Solicitudes con cobertura (hedging) contra la latencia de cola de Gemini
+Si una llamada sigue en curso después del p90 de latencia observado, se
+envía un duplicado, se toma la primera respuesta y se cancela la otra. Un
+presupuesto limita la cuota extra que consumen los duplicados.
+"""
+
+import math
+import asyncio
+import logging
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional
+
+
+logger = logging.getLogger(__name__)
+
+
+def percentile(values: List[float], q: float) -> float:
+    """Percentil por rango más cercano (q entre 0 y 100)."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, math.ceil(q / 100 * len(ordered)) - 1))
+    return ordered[rank]
+
+
+class HedgePolicy:
+    """
+    Política de cobertura con latencia en vivo.
+
+    Lleva una ventana de latencias de las llamadas originales para calcular
+    el umbral de cobertura y registra, por llamada, la latencia efectiva y
+    la que habría tenido sin cobertura. Cuando gana el duplicado la original
+    se cancela, así que esa latencia se estima con la media de la ventana
+    condicionada a superar el tiempo transcurrido.
+    """
+
+    def __init__(
+        self,
+        quantile: float = 90,
+        budget_fraction: float = 0.05,
+        min_samples: int = 10,
+        min_delay: float = 1.0,
+        window: int = 200
+    ):
+        self.quantile = quantile
+        self.budget_fraction = budget_fraction
+        self.min_samples = min_samples
+        self.min_delay = min_delay
+        self._window: Deque[float] = deque(maxlen=window)
+
+        self.calls = 0
+        self.hedges_sent = 0
+        self.hedge_wins = 0
+        self.latencies: List[float] = []
+        self.unhedged_latencies: List[float] = []
+
+    def hedge_delay(self) -> Optional[float]:
+        """Umbral de cobertura (p90 en vivo); None mientras no haya muestras suficientes."""
+        if len(self._window) < self.min_samples:
+            return None
+        return max(self.min_delay, percentile(list(self._window), self.quantile))
+
+    def _can_hedge(self) -> bool:
+        """True si el duplicado cabe en el presupuesto de cuota extra."""
+        return self.hedges_sent + 1 <= self.budget_fraction * self.calls
+
+    async def run(
+        self,
+        make_call: Callable[[], Awaitable[Any]],
+        make_hedge: Optional[Callable[[], Awaitable[Any]]] = None
+    ) -> Any:
+        """
+        Ejecuta `make_call` y, si tarda más que el umbral, un duplicado
+        (`make_hedge`, por defecto el mismo callable).
+
+        Returns:
+            La primera respuesta exitosa; si ambas fallan, propaga el error
+            de la original
+        """
+        loop = asyncio.get_running_loop()
+        self.calls += 1
+        start = loop.time()
+        primary = asyncio.ensure_future(make_call())
+        tasks = [primary]
+
+        try:
+            delay = self.hedge_delay()
+            if delay is not None:
+                await asyncio.wait({primary}, timeout=delay)
+
+            if primary.done() or delay is None or not self._can_hedge():
+                result = await primary
+                elapsed = loop.time() - start
+                self._record(elapsed, elapsed)
+                return result
+
+            self.hedges_sent += 1
+            logger.info(f"Cobertura: llamada sin respuesta tras {delay:.1f}s, enviando duplicado")
+            hedge = asyncio.ensure_future((make_hedge or make_call)())
+            tasks.append(hedge)
+
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        elapsed = loop.time() - start
+                        unhedged = elapsed
+                        if task is hedge:
+                            self.hedge_wins += 1
+                            unhedged = self._expected_latency_beyond(elapsed)
+                        self._record(elapsed, unhedged)
+                        return task.result()
+            return primary.result()
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    def _expected_latency_beyond(self, elapsed: float) -> float:
+        """Media de las latencias de la ventana mayores que `elapsed` (o `elapsed` si no hay)."""
+        slower = [latency for latency in self._window if latency > elapsed]
+        return sum(slower) / len(slower) if slower else elapsed
+
+    def _record(self, latency: float, unhedged: float):
+        self.latencies.append(latency)
+        self.unhedged_latencies.append(unhedged)
+        self._window.append(unhedged)
+
+    def summary(self, makespan: float) -> Dict[str, float]:
+        """
+        Estadísticas de la corrida.
+
+        Las cifras sin cobertura son estimaciones: la latencia de las llamadas
+        canceladas sale de la ventana y el makespan se escala por la razón
+        entre latencias totales.
+        """
+        total = sum(self.latencies)
+        unhedged_total = sum(self.unhedged_latencies)
+        makespan_unhedged = makespan * unhedged_total / total if total else makespan
+        return {
+            'calls': self.calls,
+            'hedges_sent': self.hedges_sent,
+            'hedge_wins': self.hedge_wins,
+            'p99': percentile(self.latencies, 99),
+            'p99_unhedged': percentile(self.unhedged_latencies, 99),
+            'makespan': makespan,
+            'makespan_unhedged': makespan_unhedged,
+        }
@@ -0,0 +1,132 @@
+"""
+Cola de reintentos diferidos para la extracción
+Los productos que fallan salen del flujo principal y esperan su turno con
+backoff exponencial con jitter, mientras el resto sigue procesándose. Cada
+clase de error tiene su propio presupuesto de reintentos; los errores
+permanentes se registran una sola vez.
+"""
+
+import heapq
+import random
+import asyncio
+import itertools
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+from control_concurrencia import is_quota_error, retry_delay_from_error
+
+
+# Clases de error
+QUOTA = 'cuota'
+SERVER = 'servidor'
+TIMEOUT = 'timeout'
+SAFETY = 'seguridad'
+BAD_IMAGE = 'imagen'
+OTHER = 'otro'
+
+# Clases que no tiene sentido reintentar ni en esta corrida ni en otra
+PERMANENT_CLASSES = {SAFETY, BAD_IMAGE}
+
+
+class BlockedResponseError(Exception):
+    """El modelo no devolvió texto (el mensaje lleva el motivo de bloqueo o de término)."""
+
+
+@dataclass
+class Failure:
+    """Resultado fallido de un intento"""
+    error_class: str
+    message: str
+    retry_delay: Optional[float] = None
+
+
+def classify_error(error: BaseException) -> Failure:
+    """Clasifica una excepción de la API en una clase de error."""
+    message = str(error)
+    code = getattr(error, 'code', None)
+    upper = message.upper()
+
+    if is_quota_error(error):
+        return Failure(QUOTA, message, retry_delay_from_error(error))
+    if any(reason in upper for reason in ('SAFETY', 'PROHIBITED_CONTENT', 'BLOCKLIST')):
+        return Failure(SAFETY, message)
+    if isinstance(error, asyncio.TimeoutError) or 'Timeout' in type(error).__name__ \
+            or 'DEADLINE_EXCEEDED' in upper or code == 504:
+        return Failure(TIMEOUT, message)
+    if (isinstance(code, int) and code >= 500) or 'INTERNAL' in upper or 'UNAVAILABLE' in upper:
+        return Failure(SERVER, message)
+    if (code == 400 or 'INVALID_ARGUMENT' in upper) and 'IMAGE' in upper:
+        return Failure(BAD_IMAGE, message)
+    return Failure(OTHER, message)
+
+
+@dataclass
+class RetryPolicy:
+    """Presupuestos y backoff por clase de error"""
+    budgets: Dict[str, int] = field(default_factory=lambda: {
+        QUOTA: 8,
+        SERVER: 5,
+        TIMEOUT: 4,
+        SAFETY: 0,
+        BAD_IMAGE: 0,
+        OTHER: 2,
+    })
+    base_delays: Dict[str, float] = field(default_factory=lambda: {
+        QUOTA: 10.0,
+        SERVER: 5.0,
+        TIMEOUT: 5.0,
+        OTHER: 5.0,
+    })
+    max_delay: float = 300.0
+
+    def can_retry(self, failure: Failure, attempts: Dict[str, int]) -> bool:
+        return attempts.get(failure.error_class, 0) < self.budgets.get(failure.error_class, 0)
+
+    def delay(self, failure: Failure, attempt: int) -> float:
+        """Backoff exponencial con jitter completo; nunca menor al RetryInfo del servidor."""
+        base = self.base_delays.get(failure.error_class, 5.0)
+        ceiling = min(self.max_delay, base * (2 ** attempt))
+        delay = random.uniform(base / 2, ceiling)
+        if failure.retry_delay:
+            delay = max(delay, failure.retry_delay)
+        return delay
+
+    @staticmethod
+    def final_message(failure: Failure) -> str:
+        """
+        Texto que se guarda cuando ya no hay reintentos.
+
+        Los errores permanentes usan ERROR_PERMANENTE_* para que una corrida
+        posterior no los vuelva a enviar; los transitorios agotados quedan como
+        ERROR_API_FATAL y sí se reintentan en la siguiente corrida.
+        """
+        if failure.error_class in PERMANENT_CLASSES:
+            return f"ERROR_PERMANENTE_{failure.error_class.upper()}: {failure.message}"
+        return f"ERROR_API_FATAL: [{failure.error_class}] {failure.message}"
+
+
+class RetryQueue:
+    """Cola de prioridad por instante de disponibilidad"""
+
+    def __init__(self):
+        self._heap: List[Tuple[float, int, Any]] = []
+        self._counter = itertools.count()
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    def push(self, item: Any, delay: float):
+        loop = asyncio.get_running_loop()
+        heapq.heappush(self._heap, (loop.time() + delay, next(self._counter), item))
+
+    def pop_ready(self) -> Optional[Any]:
+        """Saca el siguiente elemento cuyo tiempo de espera ya venció."""
+        if self._heap and self._heap[0][0] <= asyncio.get_running_loop().time():
+            return heapq.heappop(self._heap)[2]
+        return None
+
+    def next_ready_in(self) -> Optional[float]:
+        """Segundos hasta que el siguiente elemento esté listo."""
+        if not self._heap:
+            return None
+        return max(0.0, self._heap[0][0] - asyncio.get_running_loop().time())
@@ -0,0 +1,285 @@
+"""
+Cola de trabajo persistente en SQLite con asignaciones temporales (leases)
+Cada producto (por id) tiene un estado (pendiente, asignado, hecho,
+fallido), un contador de intentos y, mientras está asignado, un dueño y una
+expiración.
+Varios procesos extractores en la misma máquina toman trabajo de la misma
+cola sin duplicar llamadas; si uno muere, solo se pierden sus asignaciones en
+vuelo, que vuelven a estar disponibles al expirar.
+"""
+
+import os
+import time
+import socket
+import sqlite3
+import logging
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+
+logger = logging.getLogger(__name__)
+
+# Estados de un producto en la cola
+PENDING = 'pendiente'
+LEASED = 'asignado'
+DONE = 'hecho'
+FAILED = 'fallido'
+
+# Resultados que pueden volver a intentarse en otra asignación
+RETRYABLE_PREFIXES = ('ERROR_API_FATAL',)
+
+# Límite de variables por sentencia en versiones viejas de SQLite
+_MAX_VARIABLES = 900
+
+# Subir al cambiar el esquema; una cola de otra versión se vuelve a sembrar
+SCHEMA_VERSION = '2'
+
+
+def input_signature(path: Path) -> str:
+    """Firma del CSV de entrada (ruta, tamaño y fecha de modificación)."""
+    stat = Path(path).stat()
+    return f"{Path(path).resolve()}|{stat.st_size}|{stat.st_mtime_ns}"
+
+
+class WorkQueue:
+    """
+    Cola de productos en SQLite compartida entre procesos.
+
+    Las transacciones que asignan trabajo usan BEGIN IMMEDIATE, así que dos
+    procesos nunca toman el mismo producto. Una asignación vence tras
+    `lease_seconds` sin renovarse (`renew`); las vencidas se pueden volver
+    a tomar.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        lease_seconds: float = 900,
+        max_attempts: int = 3,
+        worker_id: Optional[str] = None
+    ):
+        self.path = Path(path)
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+        self._last_renew = time.time()
+
+        self._conn = sqlite3.connect(str(self.path), timeout=30, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)')
+        self._transaction(self._migrate)
+        self._conn.execute(
+            '''CREATE TABLE IF NOT EXISTS work (
+                product_id TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                lease_owner TEXT,
+                lease_expires REAL,
+                error TEXT,
+                updated REAL NOT NULL
+            )'''
+        )
+        self._conn.execute('CREATE INDEX IF NOT EXISTS idx_status ON work(status)')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _transaction(self, body: Callable[[], Any]) -> Any:
+        """Ejecuta `body` dentro de BEGIN IMMEDIATE (bloqueo de escritura entre procesos)."""
+        self._conn.execute('BEGIN IMMEDIATE')
+        try:
+            result = body()
+        except BaseException:
+            self._conn.execute('ROLLBACK')
+            raise
+        self._conn.execute('COMMIT')
+        return result
+
+    def _meta(self, key: str) -> Optional[str]:
+        row = self._conn.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return row[0] if row is not None else None
+
+    def _signature(self) -> Optional[str]:
+        return self._meta('signature')
+
+    def _migrate(self):
+        """Descarta una cola con otro esquema (p. ej. la indexada por posición de fila)."""
+        if self._meta('schema') == SCHEMA_VERSION:
+            return
+        self._conn.execute('DROP TABLE IF EXISTS work')
+        self._conn.execute('DELETE FROM meta')
+        self._conn.execute("INSERT INTO meta (key, value) VALUES ('schema', ?)", (SCHEMA_VERSION,))
+
+    def seed(self, signature: str, rows: Callable[[], Iterable[Tuple[str, bool]]]) -> Optional[int]:
+        """
+        Sincroniza la cola con el CSV si no corresponde a `signature`.
+
+        `rows` da (id del producto, pendiente) para cada fila del CSV y solo
+        se evalúa cuando hace falta sembrar, así que un arranque con la cola
+        ya sembrada no recorre el CSV. Los productos que vuelven a estar
+        pendientes se reabren aunque estuvieran hechos o fallidos; los
+        asignados a otro proceso se respetan. Los que ya no están en el CSV
+        (editado o reordenado) se quitan para que no queden pendientes para
+        siempre.
+
+        Returns:
+            Productos pendientes sembrados, o None si la cola ya estaba al día
+        """
+        if self._signature() == signature:
+            return None
+        # Se calcula fuera de la transacción para no bloquear a los demás procesos
+        current = [(str(product_id), bool(pending)) for product_id, pending in rows()]
+        pending = list(dict.fromkeys(product_id for product_id, is_pending in current if is_pending))
+
+        def _seed():
+            if self._signature() == signature:
+                return None
+            now = time.time()
+            self._conn.execute('CREATE TEMP TABLE IF NOT EXISTS current_ids (product_id TEXT PRIMARY KEY)')
+            self._conn.execute('DELETE FROM current_ids')
+            self._conn.executemany(
+                'INSERT OR IGNORE INTO current_ids (product_id) VALUES (?)',
+                [(product_id,) for product_id, _ in current]
+            )
+            dropped = self._conn.execute(
+                'DELETE FROM work WHERE product_id NOT IN (SELECT product_id FROM current_ids)'
+            ).rowcount
+            if dropped:
+                logger.info(f"Cola {self.path}: {dropped} productos que ya no están en el CSV, eliminados")
+            self._conn.executemany(
+                'INSERT INTO work (product_id, status, updated) VALUES (?, ?, ?) '
+                'ON CONFLICT(product_id) DO UPDATE SET status = excluded.status, attempts = 0, '
+                'error = NULL, updated = excluded.updated WHERE work.status != ?',
+                [(product_id, PENDING, now, LEASED) for product_id in pending]
+            )
+            self._conn.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES ('signature', ?)", (signature,)
+            )
+            return len(pending)
+
+        return self._transaction(_seed)
+
+    def open_ids(self) -> List[str]:
+        """Productos pendientes o asignados (los de una asignación vencida incluidos)."""
+        return [row[0] for row in self._conn.execute(
+            'SELECT product_id FROM work WHERE status IN (?, ?)', (PENDING, LEASED)
+        )]
+
+    def try_lease(self, product_ids: Sequence[str]) -> List[str]:
+        """
+        Toma los productos de `product_ids` que estén libres (pendientes o
+        con la asignación vencida).
+
+        Returns:
+            Productos asignados a este proceso, en el orden de `product_ids`
+        """
+        product_ids = [str(product_id) for product_id in product_ids]
+
+        def _lease():
+            now = time.time()
+            leased = []
+            for start in range(0, len(product_ids), _MAX_VARIABLES):
+                chunk = product_ids[start:start + _MAX_VARIABLES]
+                placeholders = ','.join('?' * len(chunk))
+                free = {row[0] for row in self._conn.execute(
+                    f'SELECT product_id FROM work WHERE product_id IN ({placeholders}) '
+                    f'AND (status = ? OR (status = ? AND lease_expires < ?))',
+                    (*chunk, PENDING, LEASED, now)
+                )}
+                claimed = list(dict.fromkeys(product_id for product_id in chunk if product_id in free))
+                self._conn.executemany(
+                    'UPDATE work SET status = ?, lease_owner = ?, lease_expires = ?, '
+                    'attempts = attempts + 1, updated = ? WHERE product_id = ?',
+                    [(LEASED, self.worker_id, now + self.lease_seconds, now, product_id) for product_id in claimed]
+                )
+                leased.extend(claimed)
+            return leased
+
+        return self._transaction(_lease)
+
+    def renew(self, min_interval: float = 0):
+        """Extiende las asignaciones en vuelo de este proceso (como mucho una vez por `min_interval`)."""
+        now = time.time()
+        if now - self._last_renew < min_interval:
+            return
+        self._last_renew = now
+        self._conn.execute(
+            'UPDATE work SET lease_expires = ?, updated = ? WHERE status = ? AND lease_owner = ?',
+            (now + self.lease_seconds, now, LEASED, self.worker_id)
+        )
+
+    def complete(self, product_id: str, attributes: str):
+        """
+        Cierra la asignación de un producto según su resultado: los errores
+        transitorios agotados vuelven a pendiente hasta `max_attempts`
+        asignaciones; el resto queda hecho.
+        """
+        now = time.time()
+        if attributes.startswith(RETRYABLE_PREFIXES):
+            self._conn.execute(
+                'UPDATE work SET status = CASE WHEN attempts >= ? THEN ? ELSE ? END, '
+                'lease_owner = NULL, lease_expires = NULL, error = ?, updated = ? WHERE product_id = ?',
+                (self.max_attempts, FAILED, PENDING, attributes[:500], now, str(product_id))
+            )
+        else:
+            self._conn.execute(
+                'UPDATE work SET status = ?, lease_owner = NULL, lease_expires = NULL, error = NULL, '
+                'updated = ? WHERE product_id = ?',
+                (DONE, now, str(product_id))
+            )
+
+    def release_owned(self) -> int:
+        """Devuelve a pendiente las asignaciones de este proceso (p. ej. tras Ctrl-C)."""
+        cursor = self._conn.execute(
+            'UPDATE work SET status = ?, lease_owner = NULL, lease_expires = NULL, '
+            'attempts = MAX(attempts - 1, 0), updated = ? WHERE status = ? AND lease_owner = ?',
+            (PENDING, time.time(), LEASED, self.worker_id)
+        )
+        return cursor.rowcount
+
+    def counts(self) -> Dict[str, int]:
+        """Productos por estado."""
+        counts = {PENDING: 0, LEASED: 0, DONE: 0, FAILED: 0}
+        for status, count in self._conn.execute('SELECT status, COUNT(*) FROM work GROUP BY status'):
+            counts[status] = count
+        return counts
+
+    def is_finished(self) -> bool:
+        """True si no quedan productos pendientes ni asignados."""
+        counts = self.counts()
+        return counts[PENDING] == 0 and counts[LEASED] == 0
+
+    def close(self):
+        self._conn.close()
+
+
+def leased_jobs(
+    queue: WorkQueue,
+    jobs: Sequence[Any],
+    batch_size: int = 16,
+    renew_every: float = 60
+) -> Iterator[Any]:
+    """
+    Itera los trabajos preparados (con atributo `product_id`) tomando su
+    asignación en la cola por lotes, en el mismo orden. Los que tiene otro
+    proceso se omiten; al final se hace una segunda pasada por las
+    asignaciones vencidas de procesos caídos.
+    """
+    remaining = list(jobs)
+    for sweep in range(2):
+        skipped = []
+        for start in range(0, len(remaining), batch_size):
+            batch = remaining[start:start + batch_size]
+            leased = set(queue.try_lease([job.product_id for job in batch]))
+            for job in batch:
+                if str(job.product_id) in leased:
+                    yield job
+                else:
+                    skipped.append(job)
+            queue.renew(renew_every)
+        remaining = skipped
+        if not remaining:
+            return
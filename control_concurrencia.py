@@ -0,0 +1,152 @@
+"""
+Control de concurrencia adaptativo (AIMD) guiado por errores de cuota
+Sube el límite de requests en vuelo de forma aditiva mientras las llamadas
+tienen éxito y lo recorta de forma multiplicativa ante 429 /
+RESOURCE_EXHAUSTED, respetando el RetryInfo que envíe el servidor.
+"""
+
+import re
+import time
+import asyncio
+import logging
+from collections import deque
+from typing import Any, Deque, Optional
+
+
+logger = logging.getLogger(__name__)
+
+
+_RETRY_DELAY_PATTERN = re.compile(r"retryDelay['\"]?\s*[:=]\s*['\"]?(\d+(?:\.\d+)?)s")
+
+
+def is_quota_error(error: Any) -> bool:
+    """True para 429 / RESOURCE_EXHAUSTED (acepta excepción o mensaje)."""
+    if getattr(error, 'code', None) == 429:
+        return True
+    message = str(error)
+    return '429' in message or 'RESOURCE_EXHAUSTED' in message
+
+
+def retry_delay_from_error(error: Any) -> Optional[float]:
+    """
+    Segundos de espera que indica el RetryInfo del error, si lo trae.
+
+    Busca primero en los detalles estructurados de google.genai.errors.APIError
+    y luego en el texto del mensaje.
+    """
+    details = getattr(error, 'details', None)
+    if isinstance(details, dict):
+        for detail in (details.get('error') or {}).get('details') or []:
+            if isinstance(detail, dict) and str(detail.get('@type', '')).endswith('RetryInfo'):
+                delay = str(detail.get('retryDelay', '')).rstrip('s')
+                try:
+                    return float(delay)
+                except ValueError:
+                    pass
+
+    match = _RETRY_DELAY_PATTERN.search(str(error))
+    return float(match.group(1)) if match else None
+
+
+class AIMDController:
+    """
+    Límite de concurrencia AIMD para código asyncio.
+
+    `acquire`/`release` delimitan cada request; `on_success` y
+    `on_quota_error` alimentan el lazo de control.
+    """
+
+    def __init__(
+        self,
+        initial_limit: float = 2,
+        min_limit: float = 1,
+        max_limit: float = 32,
+        additive_increase: float = 1.0,
+        decrease_factor: float = 0.5,
+        decrease_cooldown: float = 5.0
+    ):
+        self.limit = float(initial_limit)
+        self.min_limit = float(min_limit)
+        self.max_limit = float(max_limit)
+        self.additive_increase = additive_increase
+        self.decrease_factor = decrease_factor
+        self.decrease_cooldown = decrease_cooldown
+
+        self.in_flight = 0
+        self.peak_limit = self.limit
+        self.successes = 0
+        self.quota_errors = 0
+        self.decreases = 0
+
+        self._paused_until = 0.0
+        self._last_decrease = float('-inf')
+        self._waiters: Deque[asyncio.Future] = deque()
+
+    @classmethod
+    def fixed(cls, limit: int) -> 'AIMDController':
+        """Controlador con límite fijo (sin adaptación)."""
+        return cls(initial_limit=limit, min_limit=limit, max_limit=limit)
+
+    @property
+    def current_limit(self) -> int:
+        return max(1, int(self.limit))
+
+    async def acquire(self):
+        """Espera un lugar libre y que no haya una pausa de cuota vigente."""
+        while True:
+            wait = self._paused_until - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+                continue
+
+            if self.in_flight < self.current_limit:
+                self.in_flight += 1
+                return
+
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            try:
+                await waiter
+            finally:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+
+    def release(self):
+        self.in_flight -= 1
+        self._wake()
+
+    def on_success(self):
+        """Aumento aditivo: ≈ +1 al límite por cada ventana completa de éxitos."""
+        self.successes += 1
+        previous = self.current_limit
+        self.limit = min(self.max_limit, self.limit + self.additive_increase / self.limit)
+        self.peak_limit = max(self.peak_limit, self.limit)
+        if self.current_limit > previous:
+            self._wake()
+
+    def on_quota_error(self, retry_delay: Optional[float] = None):
+        """
+        Recorte multiplicativo (una vez por `decrease_cooldown`, para que una
+        ráfaga de 429 de la misma ventana no colapse el límite) y pausa global
+        si el servidor indicó un retry delay.
+        """
+        self.quota_errors += 1
+        now = time.monotonic()
+
+        if now - self._last_decrease >= self.decrease_cooldown:
+            self.limit = max(self.min_limit, self.limit * self.decrease_factor)
+            self._last_decrease = now
+            self.decreases += 1
+            logger.info(f"AIMD: cuota excedida, límite de concurrencia → {self.limit:.2f}")
+
+        if retry_delay:
+            self._paused_until = max(self._paused_until, now + retry_delay)
+
+    def _wake(self):
+        """Despierta a los que esperan mientras haya lugares libres."""
+        free = self.current_limit - self.in_flight
+        while free > 0 and self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                free -= 1
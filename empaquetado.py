@@ -0,0 +1,94 @@
+"""
+Empaquetado de varios productos en una sola llamada a generate_content
+Las instrucciones compartidas van una sola vez; cada producto aporta su id,
+su bloque de metadatos y su imagen. El modelo responde un arreglo JSON
+con un registro por id que luego se separa en filas.
+"""
+
+import re
+import json
+import logging
+from dataclasses import dataclass
+from typing import Dict, List
+
+from google.genai import types
+
+
+logger = logging.getLogger(__name__)
+
+
+PACKED_INSTRUCTIONS = (
+    "**MODO DE VARIOS PRODUCTOS:** A continuación se incluyen {count} productos, cada uno con su id, "
+    "sus metadatos y su imagen. Aplica las reglas anteriores a cada producto por separado, sin mezclar "
+    "información entre productos.\n"
+    "Responde ÚNICAMENTE con un arreglo JSON con un objeto por producto, en este formato:\n"
+    '[{{"id": "<id del producto>", "atributos": "<atributos en el formato de salida indicado>"}}]'
+)
+
+
+@dataclass
+class PackedItem:
+    """Producto dentro de un paquete"""
+    product_id: str
+    image_bytes: bytes
+    mime_type: str
+    product_prompt: str
+
+
+def build_packed_contents(items: List[PackedItem], static_prefix: str = '') -> List[types.Part]:
+    """
+    Construye el contenido de una llamada empaquetada.
+
+    Args:
+        items: Productos del paquete
+        static_prefix: Instrucciones compartidas; vacío si ya van en el context cache
+    """
+    parts = []
+    if static_prefix:
+        parts.append(types.Part.from_text(text=static_prefix))
+    parts.append(types.Part.from_text(text=PACKED_INSTRUCTIONS.format(count=len(items))))
+
+    for item in items:
+        parts.append(types.Part.from_text(text=f"### Producto id={item.product_id}\n{item.product_prompt}"))
+        parts.append(types.Part.from_bytes(data=item.image_bytes, mime_type=item.mime_type))
+
+    return parts
+
+
+def _strip_code_fence(text: str) -> str:
+    """Quita un bloque ```json ... ``` alrededor de la respuesta."""
+    return re.sub(r'^```(?:json)?\s*|\s*```$', '', text.strip()).strip()
+
+
+def split_packed_response(text: str, product_ids: List[str]) -> Dict[str, str]:
+    """
+    Separa la respuesta de un paquete en atributos por id.
+
+    Los ids que falten o no se puedan leer reciben un error para que se
+    vuelvan a procesar.
+    """
+    try:
+        records = json.loads(_strip_code_fence(text))
+        if isinstance(records, dict):
+            records = [records]
+    except json.JSONDecodeError as e:
+        logger.warning(f"Respuesta empaquetada no es JSON válido: {e}")
+        return {pid: f"ERROR_EMPAQUETADO: respuesta no es JSON ({e})" for pid in product_ids}
+
+    results: Dict[str, str] = {}
+    for record in records:
+        if not isinstance(record, dict):
+            continue
+        product_id = str(record.get('id', ''))
+        attributes = record.get('atributos', '')
+        if isinstance(attributes, dict):
+            # Salida estructurada: se conserva el registro como JSON
+            attributes = json.dumps(attributes, ensure_ascii=False)
+        if product_id in product_ids and attributes:
+            results[product_id] = str(attributes).strip().replace('\n', ' ')
+
+    for product_id in product_ids:
+        if product_id not in results:
+            results[product_id] = "ERROR_EMPAQUETADO: el modelo no devolvió este id"
+
+    return results
@@ -0,0 +1,209 @@
+"""
+Enrutador de prompts por familia de producto
+Cada familia (ropa superior, accesorios, carriolas, juguetes...) recibe un
+prefijo compacto con solo las listas cerradas que le aplican; los atributos
+que no aplican se piden como `nan`. Los prefijos renderizados se cachean.
+"""
+
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from google import genai
+from google.genai import types
+
+from atributos import MISSING_VALUE, is_missing
+from cache_contexto import create_context_cache, delete_context_cache
+from esquema_respuesta import build_response_schema
+from plantilla_prompt import SECTION_SEPARATOR
+
+
+GENERAL_FAMILY = 'general'
+
+# Tipos de producto (lista cerrada de prompt_api.txt) por familia
+PRODUCT_FAMILIES: Dict[str, Tuple[str, ...]] = {
+    'ropa_superior': (
+        'Playera', 'Sudadera', 'Chamarra', 'Suéter', 'Chaleco', 'Gabardina', 'Bralette', 'Capa',
+    ),
+    'ropa_inferior': (
+        'Pantalón', 'Short', 'Leggings', 'Falda', 'Bóxer', 'Pantaleta', 'Traje De Baño',
+    ),
+    'ropa_completa': (
+        'Bodysuit', 'Mameluco', 'Pañalero', 'Pijama', 'Conjunto', 'Vestido', 'Jumper', 'Baby Doll', 'Set',
+    ),
+    'accesorios': (
+        'Babero', 'Calcetines', 'Gorro', 'Guantes', 'Tobimedias', 'Tobillera', 'Zapatos', 'Pantuflas',
+        'Cinturón', 'Broches Para Cabello', 'Arracadas', 'Broqueles', 'Mochila', 'Pañalera', 'Bolsa',
+        'Bolsa De Viaje', 'Bolsa Transportadora', 'Cangurera', 'Cosmetiquera', 'Llavero', 'Accesorios',
+        'Pechera', 'Cinta', 'Collarín',
+    ),
+    'equipo': (
+        'Carriola', 'Andadera', 'Andador', 'Autoasiento', 'Portabebé', 'Sistema De Viaje', 'Corral',
+        'Colecho', 'Columpio', 'Mecedora', 'Bouncer', 'Asiento', 'Bañera', 'Cubrecarriola',
+        'Nido Para Bebé', 'Carrito',
+    ),
+    'juguetes': (
+        'Juguete', 'Juguete antiestrés', 'Juguete didáctico', 'Juguete interactivo', 'Peluche', 'Muñeca',
+        'Muñeco', 'Sonaja', 'Mordedera', 'Triciclo', 'Vehículo', 'Correpasillo', 'Juego', 'Juego De Mesa',
+        'Abecedario didáctico', 'Arenero', 'Carpa infantil',
+    ),
+    'hogar': (
+        'Almohada', 'Cobertor', 'Cojín', 'Colchoneta', 'Edredón', 'Frazada', 'Manta', 'Manta De Apego',
+        'Sábana', 'Toalla', 'Saco Para Dormir', 'Bolsa Para Dormir', 'Biberón', 'Vaso', 'Plato',
+        'Bebedero', 'Chupón', 'Extractor De Leche', 'Pañales', 'Pañal Reusable', 'Toallitas Húmedas',
+        'Protector', 'Alcancía', 'Calentador',
+    ),
+}
+
+# Atributos de lista cerrada que aplican a cada familia
+FAMILY_ATTRIBUTES: Dict[str, Tuple[str, ...]] = {
+    'ropa_superior': (
+        'Género', 'Tipo de cierre', 'ColorAgrupador', 'Tipo de producto', 'Tipo de cuello',
+        'Tipo de manga', 'Ocasión', 'Tipo de estampado', 'Estilo', 'Otros',
+    ),
+    'ropa_inferior': (
+        'Género', 'Corte', 'Tipo de cierre', 'ColorAgrupador', 'Tipo de producto', 'Cintura',
+        'Ocasión', 'Tipo de estampado', 'Estilo', 'Otros',
+    ),
+    'ropa_completa': (
+        'Género', 'Tipo de cierre', 'ColorAgrupador', 'Tipo de producto', 'Tipo de cuello', 'Cintura',
+        'Tipo de manga', 'Ocasión', 'Tipo de estampado', 'Estilo', 'Otros',
+    ),
+    'accesorios': (
+        'Género', 'Tipo de cierre', 'ColorAgrupador', 'Tipo de producto', 'Tipo de estampado', 'Estilo', 'Otros',
+    ),
+    'equipo': (
+        'Tipo', 'Color del armazón', 'Género', 'ColorAgrupador', 'Tipo de producto', 'Estilo', 'Otros',
+    ),
+    'juguetes': (
+        'Tipo', 'Género', 'ColorAgrupador', 'Tipo de producto', 'Estilo', 'Otros',
+    ),
+    'hogar': (
+        'Género', 'ColorAgrupador', 'Tipo de producto', 'Tipo de estampado', 'Estilo', 'Otros',
+    ),
+}
+
+# Palabras de la columna de categoría que bastan para elegir familia
+CATEGORY_KEYWORDS: Dict[str, str] = {
+    'juguete': 'juguetes',
+    'carriola': 'equipo',
+    'autoasiento': 'equipo',
+    'calzado': 'accesorios',
+    'zapato': 'accesorios',
+}
+
+_PRODUCT_TYPE_TO_FAMILY = {
+    product_type.lower(): family
+    for family, product_types in PRODUCT_FAMILIES.items()
+    for product_type in product_types
+}
+
+_CLOSED_LIST_LINE = re.compile(r'^\*\*([^*\n]+?):\*\*\s*\[\[.*?\]\]\n?', re.MULTILINE | re.DOTALL)
+
+
+@dataclass
+class PromptRoute:
+    """Prefijo, esquema y context cache de una familia"""
+    family: str
+    prefix: str
+    response_schema: Optional[types.Schema] = None
+    cached_content: Optional[str] = None
+
+
+def product_family(product_type: Optional[str] = None, category: Optional[str] = None) -> str:
+    """Familia del producto según su tipo de producto o, en su defecto, su categoría."""
+    if not is_missing(product_type):
+        family = _PRODUCT_TYPE_TO_FAMILY.get(str(product_type).strip().lower())
+        if family:
+            return family
+    if not is_missing(category):
+        category = str(category).lower()
+        for keyword, family in CATEGORY_KEYWORDS.items():
+            if keyword in category:
+                return family
+    return GENERAL_FAMILY
+
+
+@lru_cache(maxsize=None)
+def render_static_prefix(static_prefix: str, family: str) -> str:
+    """
+    Prefijo estático de una familia: quita las listas cerradas que no aplican
+    y añade la instrucción de usar `nan` en esos atributos.
+    """
+    relevant = FAMILY_ATTRIBUTES.get(family)
+    if relevant is None:
+        return static_prefix
+
+    removed: List[str] = []
+
+    def _filter(match: re.Match) -> str:
+        name = match.group(1).strip()
+        if name in relevant:
+            return match.group(0)
+        removed.append(name)
+        return ''
+
+    prefix = _CLOSED_LIST_LINE.sub(_filter, static_prefix)
+    if removed:
+        prefix += (f"{SECTION_SEPARATOR}**Atributos que no aplican a esta categoría "
+                   f"(responde `{MISSING_VALUE}`):** {', '.join(removed)}")
+    return prefix
+
+
+def route_closed_lists(closed_lists: Dict[str, List[str]], family: str) -> Dict[str, List[str]]:
+    """Listas cerradas de la familia; los atributos que no aplican solo admiten `nan`."""
+    relevant = FAMILY_ATTRIBUTES.get(family)
+    if relevant is None:
+        return closed_lists
+    return {
+        name: values if name in relevant else [MISSING_VALUE]
+        for name, values in closed_lists.items()
+    }
+
+
+def build_routes(
+    static_prefix: str,
+    closed_lists: Dict[str, List[str]],
+    families: Iterable[str],
+    structured_output: bool = True
+) -> Dict[str, PromptRoute]:
+    """Rutas para las familias presentes en la corrida (la general usa el prompt completo)."""
+    routes = {}
+    for family in sorted(set(families)):
+        if family == GENERAL_FAMILY:
+            continue
+        schema = build_response_schema(route_closed_lists(closed_lists, family)) if structured_output else None
+        routes[family] = PromptRoute(
+            family=family,
+            prefix=render_static_prefix(static_prefix, family) + SECTION_SEPARATOR,
+            response_schema=schema
+        )
+    return routes
+
+
+def needs_full_prefix(routes: Dict[str, PromptRoute], job_routes: Iterable[Optional[str]], pack_size: int = 1) -> bool:
+    """
+    True si algún trabajo usará el prefijo completo: sin ruta (familia
+    general o enrutador apagado) o, con empaquetado, paquetes que mezclan
+    familias.
+    """
+    job_routes = set(job_routes)
+    if any(route not in routes for route in job_routes):
+        return True
+    return pack_size > 1 and len(job_routes) > 1
+
+
+def attach_context_caches(client: genai.Client, model_name: str, routes: Dict[str, PromptRoute], ttl_seconds: int):
+    """Registra un context cache por ruta (los prefijos cortos pueden quedar sin caché)."""
+    for route in routes.values():
+        route.cached_content = create_context_cache(
+            client, model_name, route.prefix, ttl_seconds, display_name=f"prompt-atributos-{route.family}"
+        )
+
+
+def release_context_caches(client: genai.Client, routes: Dict[str, PromptRoute]):
+    """Elimina los context caches de las rutas."""
+    for route in routes.values():
+        delete_context_cache(client, route.cached_content)
+        route.cached_content = None
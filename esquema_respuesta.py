@@ -0,0 +1,82 @@
+"""
+Salida estructurada (JSON con enums) para la extracción de atributos
+El esquema se construye a partir de las listas cerradas de prompt_api.txt,
+de modo que el modelo solo puede devolver valores válidos para Género,
+Corte, Tipo de cuello, etc.
+"""
+
+import json
+from typing import Dict, List, Optional, Tuple
+
+from google.genai import types
+
+from atributos import ATTRIBUTE_NAMES, MISSING_VALUE, format_attributes
+
+
+# Listas del prompt que no son categorías reales (notas para el modelo)
+OPEN_ATTRIBUTES = {'Otros'}
+
+
+def build_response_schema(closed_lists: Dict[str, List[str]]) -> types.Schema:
+    """Esquema de un registro con los 22 atributos; los de lista cerrada llevan enum."""
+    properties = {}
+    for name in ATTRIBUTE_NAMES:
+        values = closed_lists.get(name)
+        if values and name not in OPEN_ATTRIBUTES:
+            enum = list(dict.fromkeys(values + [MISSING_VALUE]))
+            properties[name] = types.Schema(type=types.Type.STRING, enum=enum)
+        else:
+            properties[name] = types.Schema(type=types.Type.STRING)
+
+    return types.Schema(
+        type=types.Type.OBJECT,
+        properties=properties,
+        required=list(ATTRIBUTE_NAMES),
+        property_ordering=list(ATTRIBUTE_NAMES)
+    )
+
+
+def restrict_schema(record_schema: types.Schema, attributes: List[str]) -> types.Schema:
+    """Esquema de registro reducido a `attributes` (los que faltan por extraer)."""
+    return types.Schema(
+        type=types.Type.OBJECT,
+        properties={name: record_schema.properties[name] for name in attributes},
+        required=list(attributes),
+        property_ordering=list(attributes)
+    )
+
+
+def build_packed_schema(record_schema: types.Schema) -> types.Schema:
+    """Esquema de la respuesta empaquetada: arreglo de {id, atributos}."""
+    return types.Schema(
+        type=types.Type.ARRAY,
+        items=types.Schema(
+            type=types.Type.OBJECT,
+            properties={
+                'id': types.Schema(type=types.Type.STRING),
+                'atributos': record_schema
+            },
+            required=['id', 'atributos'],
+            property_ordering=['id', 'atributos']
+        )
+    )
+
+
+def parse_structured_response(text: str) -> Tuple[str, Optional[Dict[str, str]]]:
+    """
+    Convierte la respuesta JSON en el registro de atributos.
+
+    Returns:
+        (atributos en formato `atributo: valor`, registro) o (error, None)
+    """
+    if text.startswith('ERROR'):
+        return text, None
+    try:
+        record = json.loads(text)
+    except json.JSONDecodeError as e:
+        return f"ERROR_JSON: {e}", None
+    if not isinstance(record, dict):
+        return "ERROR_JSON: la respuesta no es un objeto", None
+
+    record = {name: str(record.get(name) or MISSING_VALUE) for name in ATTRIBUTE_NAMES}
+    return format_attributes(record), record
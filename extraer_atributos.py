@@ -1,20 +1,62 @@
 """
 Script para extraer atributos de productos usando Gemini
-Versión corregida que funciona con google.generativeai
+Usa el cliente asíncrono de google-genai con varias solicitudes en vuelo
 """
 
 import os
 import time
+import asyncio
 import logging
+import argparse
 from pathlib import Path
-from typing import Optional
+from collections import Counter
+from dataclasses import replace
+from typing import Dict, Iterable, List, Optional, Tuple
 from datetime import datetime
 
 import pandas as pd
-import google.generativeai as genai
+from google import genai
+from google.genai import types
 from tqdm import tqdm
 from dotenv import load_dotenv
 
+from atributos import ATTRIBUTE_NAMES, format_attributes, is_missing, parse_attributes
+from batch_gemini import (
+    SUCCESS_STATES, build_batch_requests, download_batch_results, job_state, submit_batch, wait_for_batch
+)
+from bitacora import ResultJournal, apply_journal, compact_journal, flagged_rows
+from cache_contexto import create_context_cache, delete_context_cache
+from cache_respuestas import ResponseCache
+from cascada_modelos import TierStats, escalation_reasons
+from cobertura_solicitudes import HedgePolicy
+from cola_reintentos import PERMANENT_CLASSES, RetryPolicy, classify_error
+from cola_trabajo import WorkQueue, input_signature, leased_jobs
+from control_concurrencia import AIMDController
+from motor_async import AsyncExtractionEngine, ExtractionJob, TokenBucket, get_mime_type
+from enrutador_prompt import (
+    attach_context_caches, build_routes, needs_full_prefix, product_family, release_context_caches
+)
+from esquema_respuesta import build_response_schema, parse_structured_response
+from fragmentos import merge_shard_records, parse_shard, shard_of, shard_path
+from matriz_atributos import export_attribute_matrix
+from perfiles_generacion import GENERATION_PROFILES, get_profile
+from limitador_compartido import SharedRateLimiter, shared_limiter_path
+from pool_claves import ClientPool, load_api_keys
+from uso_tokens import RunUsage, count_prompt_tokens
+from planificador_cuota import (
+    DailyQuota, deadline_capacity, gate_jobs, parse_duration, prioritize, priority_values, quota_capacity,
+    run_windows
+)
+from plantilla_prompt import (
+    SECTION_SEPARATOR, MetadataTemplate, parse_closed_lists, render_known_attributes, render_rule_hints, split_prompt
+)
+from preprocesamiento_imagenes import ImagePreprocessConfig, preprocess_image
+from reglas_atributos import known_attributes, merge_known_attributes, missing_attributes
+from reparacion_parcial import find_repair_targets, repair_groups
+from validacion import (
+    EXACT, FUZZY, INVALID, NAME_COLUMNS, NORMALIZED, ClosedListIndex, normalize_attribute_column
+)
+
 
 # Configuración del logging
 logging.basicConfig(
@@ -36,12 +78,108 @@ class Config:
     IMAGE_DIRECTORY = Path('images')
     INPUT_CSV = Path('productos.csv')
     OUTPUT_CSV = Path('productos_con_atributos.csv')
+    JOURNAL_FILE = Path('productos_con_atributos.jsonl')
+    BATCH_REQUESTS_FILE = Path('batch_requests.jsonl')
+    CACHE_FILE = Path('cache_respuestas.sqlite')
+
+    # Matriz de atributos columnar (requiere pyarrow y scipy; None para omitirla)
+    MATRIX_PARQUET = Path('matriz_atributos.parquet')
+    MATRIX_NPZ = Path('matriz_atributos_onehot.npz')
+    MATRIX_CODES = Path('matriz_atributos_codigos.json')
 
     # API Configuration
-    GEMINI_MODEL = 'gemini-2.0-flash-exp'
+    GEMINI_MODEL = 'gemini-2.5-flash'
+    GENERATION_PROFILE = 'balanced'  # fast | balanced | accurate
     MAX_RETRIES = 5
-    BASE_DELAY = 5
-    RATE_LIMIT_DELAY = 1.5
+
+    # Concurrencia y cuotas (AIMD: arranca en MAX_CONCURRENT y se adapta a la cuota)
+    MAX_CONCURRENT = 4
+    ADAPTIVE_CONCURRENCY = True
+    MIN_CONCURRENT = 1
+    MAX_CONCURRENT_LIMIT = 32
+    REQUESTS_PER_MINUTE = 10  # Por API key
+    TOKENS_PER_MINUTE = 250_000  # Por API key
+    IMAGE_TOKENS_ESTIMATE = 258  # Tokens aproximados por imagen
+    PACK_SIZE = 1  # Productos por llamada (1 = un producto por request)
+    STRUCTURED_OUTPUT = True  # JSON con enums de las listas cerradas
+
+    # Limitador compartido: todos los procesos de la máquina con la misma clave
+    # (extractor, timing.py, notebook) consumen del mismo saldo por minuto
+    SHARED_RATE_LIMIT = True
+    SHARED_RATE_LIMIT_DIRECTORY = None  # None = directorio temporal del sistema
+
+    # Contabilidad de tokens: count_tokens antes de empezar y resumen por corrida
+    PREFLIGHT_COUNT_TOKENS = True
+    USAGE_LOG = Path('uso_tokens.jsonl')  # None = no guardar el resumen de cada corrida
+
+    # Pool de API keys (GEMINI_API_KEYS=clave1,clave2 en .env): una clave que
+    # acumula errores de cuota seguidos se aparta un tiempo
+    KEY_QUOTA_ERROR_THRESHOLD = 2
+    KEY_COOLDOWN_SECONDS = 60.0
+
+    # Caché de respuestas (imagen + prompt + modelo)
+    CACHE_ENABLED = True
+    CACHE_MAX_BYTES = 200 * 1024 * 1024
+
+    # Context caching del prefijo estático del prompt
+    CONTEXT_CACHE_ENABLED = True
+    CONTEXT_CACHE_TTL = 3600  # segundos
+
+    # Preprocesamiento de imágenes (None para enviar la original)
+    IMAGE_PREPROCESS = ImagePreprocessConfig(max_side=1024, crop_borders=True, image_format='JPEG', quality=85)
+
+    # Plantilla de metadatos por fila (None = bloque fijo de prompt_api.txt)
+    METADATA_TEMPLATE = MetadataTemplate()
+
+    # Enrutador de prompts: cada familia de producto recibe solo sus listas cerradas
+    PROMPT_ROUTING = True
+
+    # Reglas por palabras clave: lo que infieren del nombre va al prompt como pista corregible
+    RULES_ENABLED = True
+
+    # Normalizador de listas cerradas: repara localmente mayúsculas, acentos y
+    # errores menores; solo las filas irreparables se marcan para re-extracción
+    NORMALIZE_OUTPUT = True
+    FUZZY_CUTOFF = 0.8
+    REEXTRACT_INVALID = True
+
+    # Reparación parcial: las filas marcadas solo vuelven a pedir los atributos
+    # que fallaron; con REPAIR_VALIDATE también las que no pasan la validación
+    PARTIAL_REPAIR = True
+    REPAIR_VALIDATE = False
+
+    # Cascada de modelos: el pequeño procesa todo, GEMINI_MODEL solo lo que no valida
+    CASCADE_ENABLED = False
+    CASCADE_FIRST_MODEL = 'gemini-2.5-flash-lite'
+
+    # Cobertura de latencia (hedging): duplicar llamadas más lentas que el p90
+    HEDGING_ENABLED = False
+    HEDGE_QUANTILE = 90
+    HEDGE_BUDGET = 0.05  # Fracción máxima de llamadas extra
+
+    # Reintentos diferidos por clase de error (cuota, 5xx, timeout, seguridad, imagen)
+    RETRY_POLICY = RetryPolicy()
+
+    # Cola de trabajo SQLite: varios procesos extractores sobre el mismo CSV
+    WORK_QUEUE_ENABLED = False
+    WORK_QUEUE_FILE = Path('cola_trabajo.sqlite')
+    LEASE_SECONDS = 900  # Debe superar la duración de una llamada con sus reintentos
+    QUEUE_MAX_ATTEMPTS = 3  # Asignaciones por producto antes de quedar fallido
+
+    # Planificador de cuota diaria (None = sin tope por día; p. ej. 250 RPD en el nivel gratuito de 2.5 Flash)
+    REQUESTS_PER_DAY = None
+    QUOTA_STATE_FILE = Path('cuota_diaria.json')
+    PRIORITY_COLUMN = 'prioridad'  # Mayor primero (SKUs nuevos, más vendidos...); opcional en el CSV
+    DEADLINE_SECONDS = None  # Presupuesto de tiempo de la corrida (--deadline)
+    ESTIMATED_CALL_SECONDS = 8.0  # Latencia supuesta por llamada para estimar qué cabe en el presupuesto
+
+    # Fragmentación entre máquinas (cada una con su API key): fragmento SHARD_INDEX de SHARD_COUNT
+    SHARD_INDEX = 0
+    SHARD_COUNT = 1
+
+    # Batch API (backfills sin latencia interactiva)
+    BATCH_POLL_INITIAL_DELAY = 30
+    BATCH_POLL_MAX_DELAY = 600
 
     # Columnas CSV
     ID_COLUMN = 'id'
@@ -66,53 +204,235 @@ def load_prompt(file_path: Path) -> str:
         raise
 
 
+def estimate_request_tokens(prompt_text: str, config: Config) -> int:
+    """Estimación gruesa de tokens de entrada por request (≈4 caracteres por token)."""
+    return len(prompt_text) // 4 + config.IMAGE_TOKENS_ESTIMATE
+
+
+def preflight_request_tokens(
+    client: genai.Client,
+    model_name: str,
+    job: ExtractionJob,
+    prefix: str,
+    config: Config
+) -> Optional[int]:
+    """Tokens de entrada de una request real (imagen como se enviará + prompt) según count_tokens."""
+    image_path = job.image_path
+    if config.IMAGE_PREPROCESS is not None:
+        image_path = preprocess_image(image_path, config.IMAGE_PREPROCESS)
+    contents = [
+        types.Part.from_bytes(data=image_path.read_bytes(), mime_type=get_mime_type(image_path)),
+        types.Part.from_text(text=prefix + job.prompt)
+    ]
+    return count_prompt_tokens(client, model_name, contents)
+
+
 def process_image_with_gemini(
+    client: genai.Client,
     image_path: Path,
     prompt_text: str,
     model_name: str = Config.GEMINI_MODEL,
-    max_retries: int = Config.MAX_RETRIES,
-    base_delay: int = Config.BASE_DELAY
+    max_retries: int = Config.MAX_RETRIES
 ) -> str:
     """
-    Procesa una imagen con Gemini API.
+    Procesa una imagen con Gemini API de forma síncrona (una sola llamada).
     """
     if not image_path.exists():
         return f"ERROR_IMAGEN: Archivo no encontrado en {image_path}"
 
     # Leer imagen
     try:
-        from PIL import Image
-        image = Image.open(image_path)
+        image_bytes = image_path.read_bytes()
     except Exception as e:
         return f"ERROR_LECTURA: {str(e)}"
 
-    # Reintentos con backoff exponencial
+    contents = [
+        types.Part.from_bytes(data=image_bytes, mime_type=get_mime_type(image_path)),
+        types.Part.from_text(text=prompt_text)
+    ]
+
+    # Reintentos con backoff exponencial con jitter; los errores permanentes no se reintentan
     for attempt in range(max_retries):
         try:
-            model = genai.GenerativeModel(model_name)
-            response = model.generate_content([prompt_text, image])
+            response = client.models.generate_content(
+                model=model_name,
+                contents=contents
+            )
             return response.text.strip().replace('\n', ' ')
 
         except Exception as e:
-            error_message = str(e)
-            logger.warning(f"Intento {attempt + 1}/{max_retries} falló: {error_message}")
+            failure = classify_error(e)
+            logger.warning(f"Intento {attempt + 1}/{max_retries} falló [{failure.error_class}]: {failure.message}")
+
+            if failure.error_class in PERMANENT_CLASSES:
+                return Config.RETRY_POLICY.final_message(failure)
 
             if attempt < max_retries - 1:
-                sleep_time = base_delay * (2 ** attempt)
-                logger.info(f"Esperando {sleep_time}s antes de reintentar...")
+                sleep_time = Config.RETRY_POLICY.delay(failure, attempt)
+                logger.info(f"Esperando {sleep_time:.1f}s antes de reintentar...")
                 time.sleep(sleep_time)
             else:
-                return f"ERROR_API_FATAL: {error_message}"
+                return f"ERROR_API_FATAL: {failure.message}"
 
     return "ERROR_INESPERADO: Bucle de reintento fallido"
 
 
+def get_product_id(row: pd.Series, idx, config: Config) -> str:
+    """Id del producto; usa el índice de fila si la columna falta o está vacía."""
+    product_id = row.get(config.ID_COLUMN, '')
+    if pd.isna(product_id) or str(product_id).strip() == '':
+        return str(idx)
+    return str(product_id)
+
+
+def product_ids(df: pd.DataFrame, config: Config) -> pd.Series:
+    """Id de cada fila (como `get_product_id`, en bloque): índice de fila → id."""
+    fallback = pd.Series(df.index.astype(str), index=df.index)
+    if config.ID_COLUMN not in df.columns:
+        return fallback
+    ids = df[config.ID_COLUMN]
+    text = ids.astype(str)
+    return text.where(~(ids.isna() | (text.str.strip() == '')), fallback)
+
+
+def load_dataframe(input_csv: Path, config: Config, whole: bool = False) -> pd.DataFrame:
+    """
+    Carga el CSV de entrada asegurando la columna de atributos como texto.
+
+    Con fragmentación solo quedan las filas del fragmento (con su índice
+    original), salvo que se pida el CSV completo con `whole`.
+    """
+    df = pd.read_csv(input_csv)
+    if config.ATTRIBUTES_COLUMN not in df.columns:
+        df[config.ATTRIBUTES_COLUMN] = ''
+    df[config.ATTRIBUTES_COLUMN] = df[config.ATTRIBUTES_COLUMN].fillna('').astype(str)
+    if config.SHARD_COUNT > 1 and not whole:
+        shards = [shard_of(get_product_id(row, idx, config), config.SHARD_COUNT) for idx, row in df.iterrows()]
+        df = df[[shard == config.SHARD_INDEX for shard in shards]]
+    return df
+
+
+def use_shard(config: Config, shard_index: int, shard_count: int):
+    """Configura un fragmento: filas por hash de id y bitácora, CSV y cola propios."""
+    config.SHARD_INDEX = shard_index
+    config.SHARD_COUNT = shard_count
+    config.JOURNAL_FILE = shard_path(config.JOURNAL_FILE, shard_index, shard_count)
+    config.OUTPUT_CSV = shard_path(config.OUTPUT_CSV, shard_index, shard_count)
+    config.WORK_QUEUE_FILE = shard_path(config.WORK_QUEUE_FILE, shard_index, shard_count)
+    config.BATCH_REQUESTS_FILE = shard_path(config.BATCH_REQUESTS_FILE, shard_index, shard_count)
+    config.MATRIX_PARQUET = None  # La matriz se exporta al unir los fragmentos
+
+
+def pending_rows(df: pd.DataFrame, config: Config, flagged: Iterable = ()) -> pd.Series:
+    """
+    Filas a procesar: sin resultado, con un error transitorio agotado
+    (ERROR_API_FATAL) o marcadas por el normalizador (`flagged`).
+    Los ERROR_PERMANENTE_* no se vuelven a enviar.
+    """
+    attributes = df[config.ATTRIBUTES_COLUMN].str.strip()
+    pending = (attributes.str.len() == 0) | attributes.str.startswith('ERROR_API_FATAL')
+    if config.REEXTRACT_INVALID:
+        pending |= df.index.isin(list(flagged))
+    return pending
+
+
+def normalize_results(
+    attributes: pd.Series,
+    closed_lists: Dict[str, List[str]],
+    config: Config
+) -> Tuple[pd.Series, pd.Series, pd.DataFrame]:
+    """Normaliza una columna de resultados contra las listas cerradas del prompt."""
+    index = ClosedListIndex(closed_lists, config.FUZZY_CUTOFF)
+    return normalize_attribute_column(attributes.fillna('').astype(str), index)
+
+
+def print_normalization_stats(methods: pd.DataFrame, invalid: pd.Series):
+    """Imprime cuántas celdas se repararon y cuántas filas quedan marcadas."""
+    counts = methods.stack().value_counts()
+    repaired = counts.get(NORMALIZED, 0) + counts.get(FUZZY, 0)
+    flagged = int((invalid.str.len() > 0).sum())
+    print(f"\n🧹 Normalizador: {counts.get(EXACT, 0)} valores exactos, {repaired} reparados "
+          f"({counts.get(NORMALIZED, 0)} mayúsculas/acentos, {counts.get(FUZZY, 0)} difusos), "
+          f"{counts.get(INVALID, 0)} irreparables en {flagged} filas marcadas para re-extracción")
+
+
+def make_rate_limiter(config: Config, fingerprint: str, model_name: str):
+    """Limitador de una clave y un modelo: compartido entre procesos o local."""
+    if config.SHARED_RATE_LIMIT:
+        path = shared_limiter_path(fingerprint, model_name, config.SHARED_RATE_LIMIT_DIRECTORY)
+        return SharedRateLimiter(path, config.REQUESTS_PER_MINUTE, config.TOKENS_PER_MINUTE)
+    return TokenBucket(config.REQUESTS_PER_MINUTE, config.TOKENS_PER_MINUTE)
+
+
+def first_tier_model(config: Config) -> str:
+    """Modelo que recibe todos los productos (el pequeño si hay cascada)."""
+    return config.CASCADE_FIRST_MODEL if config.CASCADE_ENABLED else config.GEMINI_MODEL
+
+
+def daily_quota_for(config: Config) -> Optional[DailyQuota]:
+    """Estado de cuota diaria si hay tope configurado."""
+    if not config.REQUESTS_PER_DAY:
+        return None
+    return DailyQuota(config.QUOTA_STATE_FILE, config.REQUESTS_PER_DAY)
+
+
+def export_matrix(df: pd.DataFrame, closed_lists: Dict[str, List[str]], config: Config):
+    """Exporta la matriz de atributos si está configurada y hay dependencias."""
+    if config.MATRIX_PARQUET is None:
+        return
+    try:
+        matrix = export_attribute_matrix(
+            df, config.ATTRIBUTES_COLUMN, closed_lists,
+            config.MATRIX_PARQUET, config.MATRIX_NPZ, config.MATRIX_CODES, config.ID_COLUMN
+        )
+    except ImportError as e:
+        print(f"\n⚠️  Matriz de atributos omitida ({e.name} no instalado): uv sync --extra matriz")
+        return
+    filled = int(matrix[ATTRIBUTE_NAMES].notna().to_numpy().sum())
+    print(f"\n🧮 Matriz de atributos: {len(matrix)} filas × {len(ATTRIBUTE_NAMES)} atributos "
+          f"({filled:,} valores) → {config.MATRIX_PARQUET}, {config.MATRIX_NPZ}")
+
+
+def print_engine_stats(
+    config: Config,
+    engine: AsyncExtractionEngine,
+    controller: AIMDController,
+    hedging: Optional[HedgePolicy],
+    elapsed: float
+):
+    """Imprime las estadísticas de una corrida del motor."""
+    if engine.api_calls and (engine.cached_content or engine.context_cache_hits):
+        print(f"\n🧊 Context cache: {engine.context_cache_hits}/{engine.api_calls} llamadas, "
+              f"{engine.cached_tokens:,} tokens de entrada servidos desde caché")
+
+    if config.ADAPTIVE_CONCURRENCY:
+        print(f"\n🔀 Concurrencia AIMD: límite final {controller.limit:.1f} (máx. {controller.peak_limit:.1f}), "
+              f"{controller.quota_errors} errores de cuota, {controller.decreases} recortes")
+
+    if hedging is not None:
+        stats = hedging.summary(elapsed)
+        print(f"\n🛡️  Cobertura: {stats['hedges_sent']} duplicados de {stats['calls']} llamadas "
+              f"({stats['hedge_wins']} ganaron)")
+        print(f"   p99: {stats['p99']:.1f}s (≈{stats['p99_unhedged']:.1f}s sin cobertura), "
+              f"makespan: {stats['makespan']:.0f}s (≈{stats['makespan_unhedged']:.0f}s sin cobertura)")
+
+    if engine.retries or engine.final_failures:
+        retried = ', '.join(f"{name}: {count}" for name, count in engine.retries.items()) or 'ninguno'
+        failed = ', '.join(f"{name}: {count}" for name, count in engine.final_failures.items()) or 'ninguno'
+        print(f"\n🔁 Reintentos diferidos: {retried} | fallos definitivos: {failed}")
+
+    if engine.coalesced:
+        print(f"\n🗃️  {engine.coalesced} llamadas unidas en vuelo")
+
+
 def run_extraction(
     config: Config,
+    client: genai.Client,
     input_csv: Path,
     output_csv: Path,
     prompt_file: Path,
-    image_dir: Path
+    image_dir: Path,
+    client_pool: Optional[ClientPool] = None
 ):
     """Ejecuta el proceso de extracción de atributos."""
 
@@ -120,23 +440,65 @@ def run_extraction(
     print("🚀 EXTRACCIÓN DE ATRIBUTOS CON GEMINI")
     print("=" * 60)
 
-    # Cargar prompt
+    # Con varias claves el ritmo total es la suma de sus cuotas por minuto
+    key_count = len(client_pool) if client_pool is not None else 1
+    requests_per_minute = config.REQUESTS_PER_MINUTE * key_count
+    if client_pool is not None:
+        client_pool.reset()
+
+    # Cargar prompt: prefijo estático + bloque por producto
     prompt = load_prompt(prompt_file)
+    prompt_parts = split_prompt(prompt)
 
     # Cargar CSV
     if not input_csv.exists():
         print(f"❌ Error: No se encontró {input_csv}")
         return None
 
-    df = pd.read_csv(input_csv)
+    df = load_dataframe(input_csv, config)
     print(f"\n✅ CSV cargado: {len(df)} productos")
 
-    # Asegurar columna de atributos
-    if config.ATTRIBUTES_COLUMN not in df.columns:
-        df[config.ATTRIBUTES_COLUMN] = ''
+    # Reanudar desde la bitácora
+    journal = ResultJournal(config.JOURNAL_FILE)
+    ids = product_ids(df, config)
+    resumed = apply_journal(df, journal, config.ATTRIBUTES_COLUMN, ids)
+    if resumed:
+        print(f"📒 Reanudando: {resumed} resultados recuperados de {config.JOURNAL_FILE}")
+    flagged = flagged_rows(journal, ids)
+    if flagged and config.REEXTRACT_INVALID:
+        print(f"🧹 Marcados por el normalizador para re-extracción: {len(flagged)}")
+    closed_lists = parse_closed_lists(prompt)
+
+    # Filas que solo necesitan volver a pedir algunos atributos
+    def find_targets(frame: pd.DataFrame) -> dict:
+        if not config.PARTIAL_REPAIR or not (config.REPAIR_VALIDATE or (flagged and config.REEXTRACT_INVALID)):
+            return {}
+        return find_repair_targets(
+            frame, config.ATTRIBUTES_COLUMN, closed_lists,
+            flagged if config.REEXTRACT_INVALID else None, validate=config.REPAIR_VALIDATE
+        )
 
     # Contar pendientes
-    rows_to_process = df[config.ATTRIBUTES_COLUMN].str.len() == 0
+    queue = None
+    if config.WORK_QUEUE_ENABLED:
+        # La cola se siembra una sola vez por versión del CSV; los demás procesos
+        # (y los arranques posteriores) toman de ella sin volver a recorrerlo
+        queue = WorkQueue(config.WORK_QUEUE_FILE, config.LEASE_SECONDS, config.QUEUE_MAX_ATTEMPTS)
+
+        def _rows():
+            mask = pending_rows(df, config, flagged) | df.index.isin(list(find_targets(df)))
+            return zip(ids, mask)
+
+        seeded = queue.seed(input_signature(input_csv), _rows)
+        if seeded is not None:
+            print(f"🗂️  Cola {config.WORK_QUEUE_FILE} sembrada con {seeded} productos")
+        rows_to_process = ids.isin(queue.open_ids())
+        repair_targets = find_targets(df[rows_to_process])
+        counts = queue.counts()
+        print(f"🗂️  Cola: " + ', '.join(f"{status}: {count}" for status, count in counts.items()))
+    else:
+        repair_targets = find_targets(df)
+        rows_to_process = pending_rows(df, config, flagged) | df.index.isin(list(repair_targets))
     total_to_process = rows_to_process.sum()
 
     print(f"📊 A procesar: {total_to_process}")
@@ -144,85 +506,738 @@ def run_extraction(
 
     if total_to_process == 0:
         print("\n✨ ¡Todos los productos ya están procesados!")
+        if queue is not None:
+            queue.close()
+        if resumed:
+            compact_journal(df, journal, output_csv, config.ATTRIBUTES_COLUMN, ids)
+            export_matrix(df, closed_lists, config)
         return df
 
-    print(f"\n⏱️  Tiempo estimado: {total_to_process * 3 // 60} minutos")
-    print(f"💰 Costo: $0.00 (gratis)")
+    print(f"\n⏱️  Tiempo estimado: {total_to_process // (requests_per_minute * config.PACK_SIZE)} minutos")
+    print(f"🔀 Concurrencia: {config.MAX_CONCURRENT} requests en vuelo, {requests_per_minute} RPM"
+          f"{f' ({key_count} API keys)' if key_count > 1 else ''}, {config.PACK_SIZE} producto(s) por request")
     print("\n" + "=" * 60)
 
-    # Procesar productos
-    processed_count = 0
-
-    for idx, row in tqdm(df.iterrows(), total=len(df), desc="Procesando"):
-        # Saltar si ya está procesado
-        if df.at[idx, config.ATTRIBUTES_COLUMN]:
-            continue
+    # Preparar trabajos
+    closed_index = ClosedListIndex(closed_lists, config.FUZZY_CUTOFF) if config.NORMALIZE_OUTPUT else None
+    invalid_rows: List = []  # Filas con valores que el normalizador no pudo reparar
+    jobs = []
+    hinted = 0
+    # Bloque de metadatos de cada fila, renderizado en bloque antes de la corrida
+    metadata_blocks = None
+    prompt_version = None
+    if config.METADATA_TEMPLATE is not None:
+        metadata_blocks = config.METADATA_TEMPLATE.render(df[rows_to_process])
+        prompt_version = config.METADATA_TEMPLATE.prompt_version(prompt_parts.static_prefix)
+        print(f"🧩 Plantilla de metadatos {prompt_version}")
 
-        product_id = row.get(config.ID_COLUMN, idx)
+    for idx, row in df[rows_to_process].iterrows():
+        product_id = get_product_id(row, idx, config)
         image_filename = row.get(config.IMAGE_COLUMN, '')
 
-        if not image_filename:
-            df.at[idx, config.ATTRIBUTES_COLUMN] = "ERROR_SIN_IMAGEN"
+        if pd.isna(image_filename) or not image_filename:
+            if queue is None or queue.try_lease([product_id]):
+                df.at[idx, config.ATTRIBUTES_COLUMN] = "ERROR_SIN_IMAGEN"
+                journal.append(idx, product_id, "ERROR_SIN_IMAGEN")
+                if queue is not None:
+                    queue.complete(product_id, "ERROR_SIN_IMAGEN")
             continue
 
-        image_path = image_dir / image_filename
+        product_prompt = metadata_blocks[idx] if metadata_blocks is not None else prompt_parts.product_suffix
+        hints = {}
+        if idx in repair_targets:
+            # Reparación parcial: se conserva el registro y solo se piden los atributos que fallaron
+            target = repair_targets[idx]
+            known = target.known
+            product_prompt += SECTION_SEPARATOR + render_known_attributes(target.visible_known, list(target.failing))
+        else:
+            # Pistas de las reglas sobre el nombre: el modelo extrae todo y puede corregirlas
+            known = {}
+            if config.RULES_ENABLED:
+                hints = known_attributes(' '.join(
+                    str(row[column]) for column in NAME_COLUMNS if column in row and not pd.isna(row[column])
+                ))
+                if hints:
+                    product_prompt += SECTION_SEPARATOR + render_rule_hints(hints)
+                    hinted += 1
 
-        # Procesar con Gemini
-        attributes = process_image_with_gemini(image_path, prompt)
+        family = None
+        if config.PROMPT_ROUTING:
+            # El tipo conocido o del catálogo manda; la pista de las reglas solo si falta
+            product_type = known.get('Tipo de producto') or row.get('Tipo de producto')
+            if is_missing(product_type):
+                product_type = hints.get('Tipo de producto')
+            family = product_family(product_type, row.get('categoria', row.get('category')))
 
-        # Guardar resultado
-        df.at[idx, config.ATTRIBUTES_COLUMN] = attributes
+        jobs.append(ExtractionJob(
+            index=idx,
+            product_id=product_id,
+            image_path=image_dir / image_filename,
+            prompt=product_prompt,
+            known_attributes=known,
+            route=family,
+            # La respuesta anterior de esta fila se rechazó: no servirla otra vez desde la caché
+            refresh=idx in repair_targets or (config.REEXTRACT_INVALID and idx in flagged)
+        ))
 
-        # Log
-        if attributes.startswith("ERROR"):
-            print(f"\n❌ {product_id}: {attributes[:80]}")
-        else:
-            print(f"\n✅ {product_id}: {attributes[:80]}...")
+    if hinted:
+        print(f"📐 Con pistas de las reglas en el prompt: {hinted}")
+    if repair_targets:
+        groups = repair_groups(repair_targets.values())
+        print(f"🩹 Reparación parcial: {len(repair_targets)} filas en {len(groups)} grupos de atributos")
+        for failing, count in groups.most_common(5):
+            print(f"   {count} × {', '.join(failing)}")
+
+    # Prioridad y presupuesto: cuota diaria restante y límite de tiempo
+    priorities = priority_values(df, config.PRIORITY_COLUMN)
+    jobs = prioritize(jobs, priorities)
+    daily_quota = daily_quota_for(config)
+    deadline = time.time() + config.DEADLINE_SECONDS if config.DEADLINE_SECONDS else None
+    model_name = first_tier_model(config)
+    budget = None
+    if daily_quota is not None:
+        remaining = daily_quota.remaining(model_name)
+        budget = quota_capacity(remaining, config.PACK_SIZE)
+        print(f"📅 Cuota diaria de {model_name}: {daily_quota.used(model_name)}/{daily_quota.daily_cap} "
+              f"solicitudes usadas, caben ≈{budget} productos hoy")
+    if config.DEADLINE_SECONDS:
+        capacity = deadline_capacity(
+            config.DEADLINE_SECONDS, requests_per_minute, config.MAX_CONCURRENT,
+            config.PACK_SIZE, config.ESTIMATED_CALL_SECONDS
+        )
+        print(f"⏳ Límite de tiempo {config.DEADLINE_SECONDS / 60:.0f} min: caben ≈{capacity} productos")
+        budget = capacity if budget is None else min(budget, capacity)
+    if budget is not None and len(jobs) > budget:
+        print(f"📅 Se programan los {budget} de mayor prioridad; {len(jobs) - budget} quedan para la siguiente ventana")
+        jobs = jobs[:budget]
+
+    # Prompts compactos por familia de producto
+    routes = {}
+    if config.PROMPT_ROUTING:
+        families = Counter(job.route for job in jobs)
+        routes = build_routes(
+            prompt_parts.static_prefix, closed_lists, families, structured_output=config.STRUCTURED_OUTPUT
+        )
+        print("🧭 Prompts por familia: " + ', '.join(f"{family}: {count}" for family, count in families.most_common()))
+    if config.PACK_SIZE > 1:
+        # Paquetes homogéneos (misma familia y mismos atributos pedidos) sin romper la prioridad
+        jobs.sort(key=lambda job: (
+            -priorities.get(job.index, 0.0), job.route or '', missing_attributes(job.known_attributes)
+        ))
+
+    # Tokens de entrada por request: count_tokens sobre el primer producto, o la estimación local
+    request_tokens = estimate_request_tokens(prompt, config)
+    preflight_tokens = None
+    sample = next((job for job in jobs if job.image_path.exists()), None)
+    if config.PREFLIGHT_COUNT_TOKENS and sample is not None:
+        route = routes.get(sample.route)
+        prefix = route.prefix if route is not None else prompt_parts.static_prefix + SECTION_SEPARATOR
+        preflight_tokens = preflight_request_tokens(client, first_tier_model(config), sample, prefix, config)
+        if preflight_tokens:
+            print(f"🔢 count_tokens: {preflight_tokens:,} tokens de entrada por request "
+                  f"(estimación local {request_tokens:,})")
+            request_tokens = preflight_tokens
+
+    pbar = tqdm(total=len(jobs), desc="Procesando")
+
+    response_schema = build_response_schema(closed_lists) if config.STRUCTURED_OUTPUT else None
+    cache = ResponseCache(config.CACHE_FILE, config.CACHE_MAX_BYTES) if config.CACHE_ENABLED else None
+
+    # Cascada: el modelo pequeño procesa todo y el grande solo las filas escaladas
+    if config.CASCADE_ENABLED:
+        tiers = [config.CASCADE_FIRST_MODEL, config.GEMINI_MODEL]
+    else:
+        tiers = [config.GEMINI_MODEL]
+    tier_stats: List[TierStats] = []
+    run_usage = RunUsage()
+    run_usage.rows = len(jobs)
+    first_results = {}  # índice → (atributos, registro, inválidos) del nivel anterior
+
+    try:
+        with journal:
+            for tier, model_name in enumerate(tiers):
+                if not jobs:
+                    break
+                is_last = tier == len(tiers) - 1
+                escalated: List[ExtractionJob] = []
+                stats = TierStats(model_name, rows=len(jobs))
+                if len(tiers) > 1:
+                    print(f"\n🪜 Nivel {tier + 1}/{len(tiers)}: {model_name} ({len(jobs)} productos)")
+
+                def on_result(job: ExtractionJob, attributes: str):
+                    record = None
+                    if engine.returns_json:
+                        attributes, record = parse_structured_response(attributes)
+                    attributes, record = merge_known_attributes(attributes, record, job.known_attributes)
+
+                    # Reparar valores fuera de lista sin otra llamada a la API
+                    invalid = {}
+                    if closed_index is not None and not attributes.startswith("ERROR"):
+                        record, invalid = closed_index.normalize_record(
+                            record if record is not None else parse_attributes(attributes)
+                        )
+                        attributes = format_attributes(record)
+
+                    if not is_last:
+                        metadata = df.loc[job.index].to_dict()
+                        reasons = escalation_reasons(attributes, record, metadata, closed_lists, invalid)
+                        if reasons:
+                            logger.info(f"{job.product_id}: escalado ({'; '.join(reasons)})")
+                            first_results[job.index] = (attributes, record, invalid)
+                            escalated.append(job)
+                            if queue is not None:
+                                queue.renew(60)
+                            return
+                    elif attributes.startswith("ERROR") and job.index in first_results:
+                        # El modelo grande falló: conservar la respuesta del nivel anterior
+                        attributes, record, invalid = first_results[job.index]
+                    if attributes.startswith("ERROR") and job.index in repair_targets:
+                        # La reparación falló: el registro anterior se conserva (y sigue marcado)
+                        print(f"\n⚠️  {job.product_id}: reparación fallida, se conserva el registro ({attributes[:60]})")
+                        if queue is not None:
+                            queue.complete(job.product_id, attributes)
+                        pbar.update(1)
+                        return
+                    if invalid:
+                        invalid_rows.append(job.index)
+
+                    # Guardar resultado
+                    df.at[job.index, config.ATTRIBUTES_COLUMN] = attributes
+
+                    # Log
+                    if attributes.startswith("ERROR"):
+                        print(f"\n❌ {job.product_id}: {attributes[:80]}")
+                    else:
+                        print(f"\n✅ {job.product_id}: {attributes[:80]}...")
+
+                    # Registro durable en la bitácora (sin reescribir el CSV)
+                    journal.append(
+                        job.index, job.product_id, attributes, record=record,
+                        model=model_name if len(tiers) > 1 else None,
+                        prompt_version=prompt_version,
+                        invalid=sorted(invalid) or None,
+                        source='reparacion' if job.index in repair_targets else None,
+                        usage=job.usage.as_record() if job.usage is not None else None
+                    )
+                    if queue is not None:
+                        queue.complete(job.product_id, attributes)
+                        queue.renew(60)
+                    pbar.update(1)
+
+                cached_content = None
+                # Las context caches viven en un proyecto: con varias claves no se comparten
+                if config.CONTEXT_CACHE_ENABLED and key_count == 1:
+                    # El prefijo completo solo se cachea si algún trabajo lo va a leer (su almacenamiento se cobra)
+                    if needs_full_prefix(routes, (job.route for job in jobs), config.PACK_SIZE):
+                        cached_content = create_context_cache(
+                            client, model_name, prompt_parts.static_prefix, config.CONTEXT_CACHE_TTL
+                        )
+                    attach_context_caches(client, model_name, routes, config.CONTEXT_CACHE_TTL)
+                if config.ADAPTIVE_CONCURRENCY:
+                    controller = AIMDController(
+                        initial_limit=config.MAX_CONCURRENT,
+                        min_limit=config.MIN_CONCURRENT,
+                        max_limit=config.MAX_CONCURRENT_LIMIT
+                    )
+                else:
+                    controller = AIMDController.fixed(config.MAX_CONCURRENT)
+                hedging = HedgePolicy(config.HEDGE_QUANTILE, config.HEDGE_BUDGET) if config.HEDGING_ENABLED else None
+                engine = AsyncExtractionEngine(
+                    client=client,
+                    model_name=model_name,
+                    max_concurrent=config.MAX_CONCURRENT,
+                    # Con pool de claves el ritmo lo lleva el limitador de cada clave
+                    rate_limiter=None if client_pool is not None else TokenBucket(
+                        config.REQUESTS_PER_MINUTE, config.TOKENS_PER_MINUTE
+                    ),
+                    retry_policy=config.RETRY_POLICY,
+                    estimated_tokens=request_tokens,
+                    cache=cache,
+                    prompt_prefix=prompt_parts.static_prefix + SECTION_SEPARATOR,
+                    cached_content=cached_content,
+                    image_preprocess=config.IMAGE_PREPROCESS,
+                    pack_size=config.PACK_SIZE,
+                    image_tokens=config.IMAGE_TOKENS_ESTIMATE,
+                    response_schema=response_schema,
+                    profile=get_profile(config.GENERATION_PROFILE),
+                    controller=controller,
+                    hedging=hedging,
+                    routes=routes,
+                    daily_quota=daily_quota,
+                    client_pool=client_pool
+                )
+                tier_start = time.time()
+                try:
+                    source = jobs
+                    if queue is not None and tier == 0:
+                        # Solo se envían los productos cuya asignación se obtiene en la cola
+                        source = leased_jobs(queue, jobs, batch_size=config.PACK_SIZE * config.MAX_CONCURRENT)
+                    if tier == 0 and (daily_quota is not None or deadline is not None):
+                        # Se deja de enviar antes del tope diario o del límite de tiempo (las
+                        # filas escaladas sí se terminan para no perder el resultado del nivel 1)
+                        source = gate_jobs(source, daily_quota, model_name, deadline)
+                    asyncio.run(engine.run(source, on_result))
+                finally:
+                    delete_context_cache(client, cached_content)
+                    release_context_caches(client, routes)
+
+                stats.elapsed = time.time() - tier_start
+                stats.escalated = len(escalated)
+                stats.api_calls = engine.api_calls
+                stats.input_tokens = engine.input_tokens
+                stats.output_tokens = engine.output_tokens
+                stats.latencies = engine.call_latencies
+                tier_stats.append(stats)
+                run_usage.add(model_name, engine.usage)
+                print_engine_stats(config, engine, controller, hedging, stats.elapsed)
 
-        processed_count += 1
+                # Las filas escaladas pasan al siguiente nivel sin el historial de reintentos
+                jobs = [replace(job, attempts={}) for job in escalated]
+    finally:
+        pbar.close()
+        if cache is not None:
+            cache.close()
+        if queue is not None:
+            # Tras Ctrl-C o un error, las asignaciones en vuelo vuelven a pendiente
+            released = queue.release_owned()
+            if released:
+                print(f"\n🗂️  {released} asignaciones devueltas a la cola")
 
-        # Guardar checkpoint cada producto
-        df.to_csv(output_csv, index=False, encoding='utf-8')
+    if cache is not None:
+        print(f"\n🗃️  Caché: {cache.hits} aciertos")
 
-        # Rate limiting
-        time.sleep(config.RATE_LIMIT_DELAY)
+    if invalid_rows:
+        print(f"\n🧹 {len(invalid_rows)} filas con valores irreparables, "
+              f"marcadas para re-extracción en la próxima corrida")
+
+    if client_pool is not None and len(client_pool) > 1:
+        print(f"\n🔑 Uso por API key:")
+        for line in client_pool.describe():
+            print(f"   {line}")
+
+    if run_usage.by_model:
+        print(f"\n🧾 Tokens de la corrida:")
+        for line in run_usage.describe():
+            print(f"   {line}")
+        cost = run_usage.cost
+        if cost is not None and run_usage.rows:
+            print(f"   Total ${cost:.4f} (≈${cost / run_usage.rows * 1000:.2f} por 1000 productos)")
+        if config.USAGE_LOG is not None:
+            run_usage.save(
+                config.USAGE_LOG, prompt_version=prompt_version, pack_size=config.PACK_SIZE,
+                preflight_tokens=preflight_tokens, profile=config.GENERATION_PROFILE
+            )
+
+    if config.CASCADE_ENABLED and tier_stats:
+        first = tier_stats[0]
+        print(f"\n🪜 Cascada: {first.escalated}/{first.rows} filas escaladas ({first.escalated / first.rows:.0%})")
+        for stats in tier_stats:
+            print(f"   {stats.describe()}")
+
+    # Compactar la bitácora en el CSV final (con cola, solo el último proceso en terminar)
+    if queue is not None:
+        finished = queue.is_finished()
+        counts = queue.counts()
+        queue.close()
+        if not finished:
+            print(f"\n🗂️  Otros procesos siguen trabajando ({counts}); "
+                  f"el último en terminar compacta (o usa --compactar)")
+            return df
+    compact_journal(df, journal, output_csv, config.ATTRIBUTES_COLUMN, ids)
+    export_matrix(df, closed_lists, config)
 
     # Estadísticas finales
     print("\n" + "=" * 60)
     print("✨ PROCESO COMPLETADO")
     print("=" * 60)
 
-    successful = len(df[~df[config.ATTRIBUTES_COLUMN].str.startswith('ERROR', na=False)])
-    errors = len(df[df[config.ATTRIBUTES_COLUMN].str.startswith('ERROR', na=False)])
+    attributes = df[config.ATTRIBUTES_COLUMN].fillna('').str.strip()
+    errors = int(attributes.str.startswith('ERROR').sum())
+    unprocessed = int((attributes.str.len() == 0).sum())
+    successful = len(df) - errors - unprocessed
 
     print(f"\n📊 RESULTADOS:")
     print(f"✅ Exitosos: {successful}")
     print(f"❌ Errores: {errors}")
+    if unprocessed:
+        print(f"📅 Pendientes para la siguiente ventana: {unprocessed}")
     print(f"📁 Guardado en: {output_csv}")
 
     return df
 
 
+def run_batch_extraction(
+    config: Config,
+    client: genai.Client,
+    input_csv: Path,
+    output_csv: Path,
+    prompt_file: Path,
+    image_dir: Path,
+    job_name: Optional[str] = None
+) -> Optional[pd.DataFrame]:
+    """
+    Extracción con la Batch API: genera requests, envía el job, espera e ingiere.
+
+    Si se pasa `job_name` se omite el envío y solo se espera/ingiere ese job.
+    """
+    print("=" * 60)
+    print("🌙 EXTRACCIÓN EN MODO BATCH")
+    print("=" * 60)
+
+    if not input_csv.exists():
+        print(f"❌ Error: No se encontró {input_csv}")
+        return None
+
+    df = load_dataframe(input_csv, config)
+    journal = ResultJournal(config.JOURNAL_FILE)
+    ids = product_ids(df, config)
+    apply_journal(df, journal, config.ATTRIBUTES_COLUMN, ids)
+
+    # id → índice de fila para ingerir resultados
+    id_to_index = {product_id: idx for idx, product_id in ids.items()}
+
+    prompt = load_prompt(prompt_file)
+    static_prefix = split_prompt(prompt).static_prefix
+    prompt_version = None
+    if config.METADATA_TEMPLATE is not None:
+        prompt_version = config.METADATA_TEMPLATE.prompt_version(static_prefix)
+
+    with journal:
+        if job_name is None:
+            pending = pending_rows(df, config, flagged_rows(journal, ids))
+
+            # Prompt por producto con sus propios metadatos
+            prompts = {}
+            if config.METADATA_TEMPLATE is not None:
+                blocks = config.METADATA_TEMPLATE.render(df[pending])
+                prompts = {
+                    get_product_id(row, idx, config): static_prefix + SECTION_SEPARATOR + blocks[idx]
+                    for idx, row in df[pending].iterrows()
+                }
+
+            items = []
+            for idx, row in df[pending].iterrows():
+                product_id = get_product_id(row, idx, config)
+                image_filename = row.get(config.IMAGE_COLUMN, '')
+
+                if pd.isna(image_filename) or not image_filename:
+                    journal.append(idx, product_id, "ERROR_SIN_IMAGEN")
+                    continue
+
+                image_path = image_dir / image_filename
+                if not image_path.exists():
+                    journal.append(idx, product_id, f"ERROR_IMAGEN: Archivo no encontrado en {image_path}")
+                    continue
+
+                if config.IMAGE_PREPROCESS is not None:
+                    image_path = preprocess_image(image_path, config.IMAGE_PREPROCESS)
+
+                items.append((product_id, image_path))
+
+            if not items:
+                print("\n✨ ¡Todos los productos ya están procesados!")
+                return compact_journal(df, journal, output_csv, config.ATTRIBUTES_COLUMN, ids)
+
+            build_batch_requests(client, items, prompt, config.BATCH_REQUESTS_FILE, prompts=prompts)
+            display_name = f"atributos-{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+            job_name = submit_batch(client, config.GEMINI_MODEL, config.BATCH_REQUESTS_FILE, display_name).name
+            print(f"📤 Batch enviado: {job_name} ({len(items)} productos)")
+            print(f"💡 Para reanudar la espera: python extraer_atributos.py --modo batch --batch-job {job_name}")
+
+        job = wait_for_batch(
+            client,
+            job_name,
+            initial_delay=config.BATCH_POLL_INITIAL_DELAY,
+            max_delay=config.BATCH_POLL_MAX_DELAY
+        )
+        if job_state(job) not in SUCCESS_STATES:
+            # Sin resultados que ingerir: los productos siguen pendientes para el próximo envío
+            print(f"\n❌ Batch {job_name} terminó en {job_state(job)}: {job.error}")
+            return None
+        results = download_batch_results(client, job)
+
+        for product_id in results.keys() - id_to_index.keys():
+            logger.warning(f"Batch: id desconocido en resultados: {product_id}")
+        ingested = pd.Series({product_id: attributes for product_id, (attributes, _) in results.items()
+                              if product_id in id_to_index}, dtype=object)
+
+        # Normalización en bloque de todos los resultados del job
+        invalid = pd.Series([[]] * len(ingested), index=ingested.index, dtype=object)
+        if config.NORMALIZE_OUTPUT and len(ingested):
+            ingested, invalid, methods = normalize_results(ingested, parse_closed_lists(prompt), config)
+            print_normalization_stats(methods, invalid)
+
+        for product_id, attributes in ingested.items():
+            journal.append(
+                id_to_index[product_id], product_id, attributes,
+                batch_job=job_name, invalid=invalid[product_id] or None, prompt_version=prompt_version,
+                usage=results[product_id][1].as_record()
+            )
+
+    df = compact_journal(df, journal, output_csv, config.ATTRIBUTES_COLUMN, ids)
+    export_matrix(df, parse_closed_lists(prompt), config)
+
+    errors = df[config.ATTRIBUTES_COLUMN].str.startswith('ERROR', na=False).sum()
+    print(f"\n📊 Batch {job_name}: {len(results)} resultados, {errors} errores en total")
+    print(f"📁 Guardado en: {output_csv}")
+    return df
+
+
+def compact_only(config: Config) -> Optional[pd.DataFrame]:
+    """Reconstruye el CSV final desde la bitácora sin llamar a la API."""
+    if not config.INPUT_CSV.exists():
+        print(f"❌ Error: No se encontró {config.INPUT_CSV}")
+        return None
+
+    df = load_dataframe(config.INPUT_CSV, config)
+    compact_journal(
+        df, ResultJournal(config.JOURNAL_FILE), config.OUTPUT_CSV, config.ATTRIBUTES_COLUMN, product_ids(df, config)
+    )
+    print(f"📁 CSV compactado desde {config.JOURNAL_FILE}: {config.OUTPUT_CSV}")
+    if config.PROMPT_FILE.exists():
+        export_matrix(df, parse_closed_lists(load_prompt(config.PROMPT_FILE)), config)
+    return df
+
+
+def normalize_only(config: Config) -> Optional[pd.DataFrame]:
+    """
+    Normaliza los resultados existentes (CSV + bitácora) sin llamar a la API.
+
+    Los valores reparados se registran en la bitácora; las filas con valores
+    irreparables quedan marcadas para la próxima extracción.
+    """
+    if not config.INPUT_CSV.exists():
+        print(f"❌ Error: No se encontró {config.INPUT_CSV}")
+        return None
+
+    df = load_dataframe(config.INPUT_CSV, config)
+    journal = ResultJournal(config.JOURNAL_FILE)
+    ids = product_ids(df, config)
+    apply_journal(df, journal, config.ATTRIBUTES_COLUMN, ids)
+
+    closed_lists = parse_closed_lists(load_prompt(config.PROMPT_FILE))
+    attributes = df[config.ATTRIBUTES_COLUMN]
+    normalized, invalid, methods = normalize_results(attributes, closed_lists, config)
+
+    # Las filas ya marcadas tienen `nan` en lugar del valor irreparable y no cambian: conservan su marca
+    changed = (normalized != attributes) | (invalid.str.len() > 0)
+    with journal:
+        for idx in df.index[changed]:
+            journal.append(
+                idx, ids[idx], normalized[idx],
+                source='normalizador', invalid=invalid[idx] or None
+            )
+
+    print_normalization_stats(methods, invalid)
+    compact_journal(df, journal, config.OUTPUT_CSV, config.ATTRIBUTES_COLUMN, ids)
+    export_matrix(df, closed_lists, config)
+    print(f"📁 Guardado en: {config.OUTPUT_CSV}")
+    return df
+
+
+def merge_only(config: Config, shard_count: int) -> Optional[pd.DataFrame]:
+    """
+    Une los resultados de `shard_count` fragmentos en el CSV final.
+
+    Revisa que estén todas las bitácoras, que cada fila tenga resultado
+    (huecos), que ninguna aparezca en dos fragmentos (duplicados) y que los
+    ids coincidan con el CSV de entrada.
+    """
+    print("=" * 60)
+    print(f"🧩 UNIÓN DE {shard_count} FRAGMENTOS")
+    print("=" * 60)
+
+    if not config.INPUT_CSV.exists():
+        print(f"❌ Error: No se encontró {config.INPUT_CSV}")
+        return None
+
+    df = load_dataframe(config.INPUT_CSV, config, whole=True)
+    records, report = merge_shard_records(
+        df, config.JOURNAL_FILE, shard_count, lambda idx: get_product_id(df.loc[idx], idx, config)
+    )
+
+    sizes = Counter(shard_of(get_product_id(row, idx, config), shard_count) for idx, row in df.iterrows())
+    for shard_index in range(shard_count):
+        path = shard_path(config.JOURNAL_FILE, shard_index, shard_count)
+        status = "❌ falta" if shard_index in report.missing_shards else f"✅ {path}"
+        print(f"   Fragmento {shard_index}/{shard_count}: {sizes[shard_index]} filas, {status}")
+
+    print(f"\n📊 Cobertura: {report.covered}/{report.total_rows} ({report.coverage:.1%})")
+    for label, values in (("Huecos (sin resultado)", report.gaps),
+                          ("Duplicados entre fragmentos", report.duplicates),
+                          ("En un fragmento que no les corresponde", report.misplaced),
+                          ("Índice con id distinto al CSV", report.mismatched)):
+        if values:
+            preview = ', '.join(values[:10]) + (' ...' if len(values) > 10 else '')
+            print(f"⚠️  {label}: {len(values)} ({preview})")
+
+    for idx, record in records.items():
+        df.at[idx, config.ATTRIBUTES_COLUMN] = record['attributes']
+    df.to_csv(config.OUTPUT_CSV, index=False, encoding='utf-8')
+    if config.PROMPT_FILE.exists():
+        export_matrix(df, parse_closed_lists(load_prompt(config.PROMPT_FILE)), config)
+
+    if report.complete:
+        print(f"\n✅ Fragmentos completos, unidos en {config.OUTPUT_CSV}")
+    else:
+        print(f"\n⚠️  Unión incompleta guardada en {config.OUTPUT_CSV}: "
+              f"vuelve a correr los fragmentos con huecos y repite la unión")
+    return df
+
+
+def run_scheduled(
+    config: Config,
+    client: genai.Client,
+    client_pool: Optional[ClientPool] = None
+) -> Optional[pd.DataFrame]:
+    """
+    Corre la extracción ventana tras ventana mientras queden pendientes: si
+    aún cabe trabajo en la cuota de hoy vuelve a correr desde la bitácora;
+    cuando se agota, duerme hasta el reinicio de la cuota y retoma.
+    """
+    model_name = first_tier_model(config)
+    quota = daily_quota_for(config)
+
+    def run():
+        return run_extraction(
+            config=config,
+            client=client,
+            input_csv=config.INPUT_CSV,
+            output_csv=config.OUTPUT_CSV,
+            prompt_file=config.PROMPT_FILE,
+            image_dir=config.IMAGE_DIRECTORY,
+            client_pool=client_pool
+        )
+
+    if quota is None:
+        return run()
+
+    def wait(pending: int):
+        seconds = quota.seconds_until_reset() + 60
+        print(f"\n😴 Cuota diaria agotada con {pending} productos pendientes; "
+              f"se retoma a las {quota.next_reset():%Y-%m-%d %H:%M %Z} (en {seconds / 3600:.1f} h)")
+        time.sleep(seconds)
+
+    return run_windows(
+        run,
+        pending=lambda df: int(pending_rows(df, config).sum()),
+        capacity=lambda: quota_capacity(quota.remaining(model_name), config.PACK_SIZE),
+        wait=wait
+    )
+
+
+def parse_args() -> argparse.Namespace:
+    """Argumentos de línea de comandos"""
+    parser = argparse.ArgumentParser(description="Extracción de atributos con Gemini")
+    parser.add_argument('--compactar', action='store_true',
+                        help="Solo reconstruir el CSV final (y la matriz de atributos) desde la bitácora")
+    parser.add_argument('--modo', choices=['interactivo', 'batch'], default='interactivo',
+                        help="interactivo: llamadas concurrentes; batch: Batch API de Gemini")
+    parser.add_argument('--batch-job', default=None,
+                        help="Nombre de un job de batch ya enviado para esperar e ingerir")
+    parser.add_argument('--empaquetar', type=int, metavar='N', default=None,
+                        help="Enviar N productos por llamada (modo interactivo)")
+    parser.add_argument('--perfil', choices=list(GENERATION_PROFILES), default=None,
+                        help="Perfil de generación (thinking, tokens de salida, temperatura)")
+    parser.add_argument('--fragmento', metavar='I/N', default=None,
+                        help="Procesar solo el fragmento I de N (hash estable del id), con archivos propios")
+    parser.add_argument('--unir', type=int, metavar='N', default=None,
+                        help="Unir los resultados de N fragmentos en el CSV final")
+    parser.add_argument('--cuota-diaria', type=int, metavar='N', default=None,
+                        help="Tope de solicitudes por día del modelo; lo que no cabe queda para mañana")
+    parser.add_argument('--programar', action='store_true',
+                        help="Con --cuota-diaria, esperar al reinicio de la cuota y seguir hasta terminar")
+    parser.add_argument('--deadline', metavar='DURACIÓN', default=None,
+                        help="Presupuesto de tiempo (p. ej. 90m, 2h): procesar lo de mayor prioridad que quepa")
+    parser.add_argument('--cola', action='store_true',
+                        help="Tomar trabajo de la cola SQLite compartida (varios procesos en paralelo)")
+    parser.add_argument('--reparar', action='store_true',
+                        help="Volver a pedir solo los atributos que no pasan la validación")
+    parser.add_argument('--normalizar', action='store_true',
+                        help="Solo normalizar los resultados existentes contra las listas cerradas")
+    parser.add_argument('--cascada', action='store_true',
+                        help="Procesar primero con el modelo pequeño y escalar solo las filas dudosas")
+    parser.add_argument('--cobertura', action='store_true',
+                        help="Duplicar las llamadas más lentas que el p90 (hedging, consume cuota extra)")
+    return parser.parse_args()
+
+
 def main():
     """Función principal"""
 
+    args = parse_args()
+    config = Config()
+    if args.empaquetar:
+        config.PACK_SIZE = args.empaquetar
+    if args.perfil:
+        config.GENERATION_PROFILE = args.perfil
+    if args.cobertura:
+        config.HEDGING_ENABLED = True
+    if args.cascada:
+        config.CASCADE_ENABLED = True
+    if args.reparar:
+        config.REPAIR_VALIDATE = True
+    if args.cola:
+        config.WORK_QUEUE_ENABLED = True
+    if args.cuota_diaria:
+        config.REQUESTS_PER_DAY = args.cuota_diaria
+    if args.deadline:
+        try:
+            config.DEADLINE_SECONDS = parse_duration(args.deadline)
+        except ValueError as e:
+            print(f"❌ {e}")
+            return
+    if args.programar and not config.REQUESTS_PER_DAY:
+        print("❌ --programar necesita un tope diario (--cuota-diaria N o Config.REQUESTS_PER_DAY)")
+        return
+
+    if args.unir:
+        merge_only(config, args.unir)
+        return
+    if args.fragmento:
+        try:
+            use_shard(config, *parse_shard(args.fragmento))
+        except ValueError as e:
+            print(f"❌ {e}")
+            return
+        print(f"🧩 Fragmento {config.SHARD_INDEX}/{config.SHARD_COUNT}: {config.JOURNAL_FILE}")
+
+    if args.compactar:
+        compact_only(config)
+        return
+    if args.normalizar:
+        normalize_only(config)
+        return
+
     # Cargar configuración
     load_dotenv()
-    api_key = os.getenv('GEMINI_API_KEY')
+    api_keys = load_api_keys()
 
-    if not api_key:
+    if not api_keys:
         print("❌ Error: No se encontró GEMINI_API_KEY en .env")
         print("\n💡 Pasos:")
         print("1. Crea archivo .env")
-        print("2. Agrega: GEMINI_API_KEY=tu_api_key")
+        print("2. Agrega: GEMINI_API_KEY=tu_api_key (o GEMINI_API_KEYS=clave1,clave2 para varias)")
         return
 
-    # Configurar Gemini
-    genai.configure(api_key=api_key)
-    print("✅ API Key configurada")
-
-    # Crear config
-    config = Config()
+    # Configurar Gemini (GEMINI_BASE_URL permite apuntar a un servidor local de prueba)
+    base_url = os.getenv('GEMINI_BASE_URL')
+    http_options = types.HttpOptions(base_url=base_url) if base_url else None
+    # Siempre por el pool: con una sola clave solo aporta el limitador compartido
+    client_pool = ClientPool.from_keys(
+        api_keys,
+        lambda fingerprint, model_name: make_rate_limiter(config, fingerprint, model_name),
+        http_options,
+        quota_error_threshold=config.KEY_QUOTA_ERROR_THRESHOLD,
+        cooldown_seconds=config.KEY_COOLDOWN_SECONDS
+    )
+    client = client_pool.primary
+    if len(api_keys) > 1:
+        print(f"✅ {len(api_keys)} API keys configuradas: {', '.join(label for label, _ in api_keys)}")
+    else:
+        print("✅ API Key configurada")
+    if config.SHARED_RATE_LIMIT:
+        print(f"🚦 Ritmo compartido con otros procesos de la misma clave: {config.REQUESTS_PER_MINUTE} RPM")
 
     # Verificar archivos
     print("\n🔍 Verificando archivos...")
@@ -252,13 +1267,28 @@ def main():
         return
 
     # Ejecutar extracción
-    df = run_extraction(
-        config=config,
-        input_csv=config.INPUT_CSV,
-        output_csv=config.OUTPUT_CSV,
-        prompt_file=config.PROMPT_FILE,
-        image_dir=config.IMAGE_DIRECTORY
-    )
+    if args.modo == 'batch':
+        df = run_batch_extraction(
+            config=config,
+            client=client,
+            input_csv=config.INPUT_CSV,
+            output_csv=config.OUTPUT_CSV,
+            prompt_file=config.PROMPT_FILE,
+            image_dir=config.IMAGE_DIRECTORY,
+            job_name=args.batch_job
+        )
+    elif args.programar:
+        df = run_scheduled(config, client, client_pool)
+    else:
+        df = run_extraction(
+            config=config,
+            client=client,
+            input_csv=config.INPUT_CSV,
+            output_csv=config.OUTPUT_CSV,
+            prompt_file=config.PROMPT_FILE,
+            image_dir=config.IMAGE_DIRECTORY,
+            client_pool=client_pool
+        )
 
     if df is not None:
         print("\n📄 Primeros 5 resultados:")
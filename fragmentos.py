@@ -0,0 +1,117 @@
+"""
+Fragmentación determinista del catálogo para correr en varias máquinas
+Cada fila pertenece a un fragmento según un hash estable de su id, así que
+la pertenencia no cambia entre corridas. Cada fragmento escribe su propia
+bitácora y CSV; la unión revisa cobertura, huecos y duplicados antes de
+armar el CSV final.
+"""
+
+import hashlib
+import logging
+from pathlib import Path
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Tuple
+
+import pandas as pd
+
+from bitacora import ResultJournal
+
+
+logger = logging.getLogger(__name__)
+
+
+def shard_of(product_id: str, shard_count: int) -> int:
+    """Fragmento de un producto: hash estable (SHA-1) de su id módulo el total."""
+    digest = hashlib.sha1(str(product_id).encode('utf-8')).digest()
+    return int.from_bytes(digest[:8], 'big') % shard_count
+
+
+def parse_shard(text: str) -> Tuple[int, int]:
+    """Convierte `índice/total` (p. ej. `0/4`) en tupla, validando el rango."""
+    try:
+        index, count = (int(part) for part in text.split('/'))
+    except ValueError:
+        raise ValueError(f"Fragmento inválido '{text}': usa índice/total, p. ej. 0/4")
+    if count < 1 or not 0 <= index < count:
+        raise ValueError(f"Fragmento inválido '{text}': el índice va de 0 a {count - 1}")
+    return index, count
+
+
+def shard_path(path: Path, shard_index: int, shard_count: int) -> Path:
+    """Archivo propio de un fragmento: `productos.jsonl` → `productos.fragmento-0-de-4.jsonl`."""
+    path = Path(path)
+    return path.with_name(f"{path.stem}.fragmento-{shard_index}-de-{shard_count}{path.suffix}")
+
+
+@dataclass
+class MergeReport:
+    """Resultado de revisar los fragmentos antes de unirlos"""
+    total_rows: int
+    shard_count: int
+    covered: int = 0
+    missing_shards: List[int] = field(default_factory=list)
+    gaps: List[str] = field(default_factory=list)  # ids sin resultado en ningún fragmento
+    duplicates: List[str] = field(default_factory=list)  # ids con resultado en más de un fragmento
+    misplaced: List[str] = field(default_factory=list)  # ids en un fragmento que no les corresponde
+    mismatched: List[str] = field(default_factory=list)  # índices cuyo id no coincide con el CSV
+
+    @property
+    def coverage(self) -> float:
+        return self.covered / self.total_rows if self.total_rows else 1.0
+
+    @property
+    def complete(self) -> bool:
+        return not (self.missing_shards or self.gaps or self.mismatched)
+
+
+def _preferred(current: Dict[str, Any], candidate: Dict[str, Any]) -> Dict[str, Any]:
+    """Entre dos registros de la misma fila gana el exitoso y, a igualdad, el más reciente."""
+    current_ok = not str(current['attributes']).startswith('ERROR')
+    candidate_ok = not str(candidate['attributes']).startswith('ERROR')
+    if current_ok != candidate_ok:
+        return current if current_ok else candidate
+    return candidate if candidate.get('timestamp', '') > current.get('timestamp', '') else current
+
+
+def merge_shard_records(
+    df: pd.DataFrame,
+    journal_file: Path,
+    shard_count: int,
+    product_id: Callable[[Any], str]
+) -> Tuple[Dict[Any, Dict[str, Any]], MergeReport]:
+    """
+    Lee las bitácoras de todos los fragmentos y elige un registro por fila.
+
+    Args:
+        journal_file: Bitácora base; la de cada fragmento sale de `shard_path`
+        product_id: Índice de fila → id del producto en el CSV
+
+    Returns:
+        (índice → registro elegido, reporte de la revisión)
+    """
+    report = MergeReport(total_rows=len(df), shard_count=shard_count)
+    chosen: Dict[Any, Dict[str, Any]] = {}
+    seen_in: Dict[Any, int] = {}
+
+    for shard_index in range(shard_count):
+        path = shard_path(journal_file, shard_index, shard_count)
+        if not path.exists():
+            report.missing_shards.append(shard_index)
+            continue
+        for index, record in ResultJournal(path).load().items():
+            if index not in df.index or str(record.get('id')) != product_id(index):
+                report.mismatched.append(str(index))
+                continue
+            if shard_of(record['id'], shard_count) != shard_index:
+                report.misplaced.append(record['id'])
+            if index in chosen:
+                if seen_in[index] != shard_index:
+                    report.duplicates.append(record['id'])
+                chosen[index] = _preferred(chosen[index], record)
+            else:
+                chosen[index] = record
+            seen_in[index] = shard_index
+
+    report.covered = len(chosen)
+    report.gaps = [product_id(index) for index in df.index if index not in chosen]
+    return chosen, report
@@ -0,0 +1,220 @@
+"""
+Limitador de ritmo compartido entre procesos
+Token bucket (requests y tokens por minuto) cuyo saldo vive en un archivo
+protegido con bloqueo, uno por API key y modelo. Todos los procesos de la
+máquina que usan la misma clave (extractor, timing.py, notebook) consumen del
+mismo saldo con los mismos límites (los más estrictos declarados), así que el
+total por minuto se mantiene bajo la cuota sin importar cuántos estén
+corriendo.
+"""
+
+import os
+import re
+import json
+import time
+import random
+import asyncio
+import hashlib
+import logging
+import tempfile
+from pathlib import Path
+from contextlib import contextmanager
+from typing import Optional
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+try:
+    import msvcrt
+except ImportError:
+    msvcrt = None
+
+
+logger = logging.getLogger(__name__)
+
+# Directorio común para todos los procesos de la máquina
+DEFAULT_DIRECTORY = Path(tempfile.gettempdir()) / 'gemini_limitador'
+
+
+@contextmanager
+def file_lock(path: Path):
+    """Bloqueo exclusivo entre procesos (fcntl en POSIX, msvcrt en Windows)."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'a+b') as handle:
+        if fcntl is not None:
+            fcntl.flock(handle.fileno(), fcntl.LOCK_EX)
+        elif msvcrt is not None:
+            handle.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(handle.fileno(), msvcrt.LK_NBLCK, 1)
+                    break
+                except OSError:
+                    time.sleep(0.01)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(handle.fileno(), fcntl.LOCK_UN)
+            elif msvcrt is not None:
+                handle.seek(0)
+                msvcrt.locking(handle.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def key_fingerprint(api_key: str) -> str:
+    """Identificador estable de una API key que no la expone."""
+    return hashlib.sha256(api_key.encode('utf-8')).hexdigest()[:16]
+
+
+def shared_limiter_path(fingerprint: str, model_name: str, directory: Optional[Path] = None) -> Path:
+    """Archivo de saldo de una clave y un modelo."""
+    model = re.sub(r'[^A-Za-z0-9._-]', '_', model_name)
+    return Path(directory or DEFAULT_DIRECTORY) / f"{fingerprint}-{model}.json"
+
+
+# Segundos sin reservar tras los cuales los límites declarados por un proceso dejan de contar
+LIMITS_TTL = 300.0
+
+
+class SharedRateLimiter:
+    """
+    Token bucket con el saldo en un archivo compartido.
+
+    Misma interfaz que `motor_async.TokenBucket` (`acquire`, `available`,
+    `requests_per_minute`) más `acquire_blocking` para código síncrono. Cada
+    reserva lee, rellena y descuenta el saldo bajo el bloqueo del archivo; el
+    reloj es time.time() porque se compara entre procesos.
+
+    Cada proceso declara en el archivo sus límites (RPM y, si lo conoce, TPM)
+    y todos rellenan los dos saldos con los más estrictos entre los procesos
+    activos, así un proceso sin TPM no descarta el relleno de tokens de los
+    demás y procesos con límites distintos comparten el mismo saldo.
+    """
+
+    def __init__(self, path: Path, requests_per_minute: float, tokens_per_minute: Optional[float] = None):
+        self.path = Path(path)
+        self.lock_path = self.path.with_name(self.path.name + '.lock')
+        self.own_requests_per_minute = float(requests_per_minute)
+        self.own_tokens_per_minute = float(tokens_per_minute) if tokens_per_minute else None
+        # Límites efectivos de la última lectura del archivo
+        self.requests_per_minute = self.own_requests_per_minute
+        self.tokens_per_minute = self.own_tokens_per_minute
+        self.waited = 0.0  # Segundos que este proceso esperó turno
+        self._owner = str(os.getpid())
+        self._lock: Optional[asyncio.Lock] = None
+        self._lock_loop = None
+
+    def _declare_limits(self, state: dict, now: float):
+        """Registra los límites de este proceso y calcula los efectivos de los procesos activos."""
+        limits = {
+            owner: declared for owner, declared in (state.get('limits') or {}).items()
+            if now - declared.get('seen', 0.0) <= LIMITS_TTL
+        }
+        limits[self._owner] = {
+            'rpm': self.own_requests_per_minute, 'tpm': self.own_tokens_per_minute, 'seen': now
+        }
+        state['limits'] = limits
+        self.requests_per_minute = min(declared['rpm'] for declared in limits.values())
+        token_limits = [declared['tpm'] for declared in limits.values() if declared.get('tpm')]
+        self.tokens_per_minute = min(token_limits) if token_limits else None
+
+    def _load(self, now: float) -> dict:
+        """Saldo rellenado hasta `now` con los límites efectivos (lleno si el archivo no existe o está dañado)."""
+        state = None
+        if self.path.exists():
+            try:
+                state = json.loads(self.path.read_text(encoding='utf-8'))
+            except (json.JSONDecodeError, OSError):
+                logger.warning(f"Saldo compartido {self.path} ilegible, se reinicia")
+        if not state:
+            state = {'updated': now}
+            self._declare_limits(state, now)
+            state['requests'] = self.requests_per_minute
+            if self.tokens_per_minute:
+                state['tokens'] = self.tokens_per_minute
+            return state
+
+        self._declare_limits(state, now)
+        elapsed = max(0.0, now - state.get('updated', now))
+        state['requests'] = min(
+            self.requests_per_minute,
+            state.get('requests', 0.0) + elapsed * self.requests_per_minute / 60
+        )
+        if self.tokens_per_minute:
+            # El saldo de tokens nace lleno cuando el primer proceso con TPM se declara
+            tokens = state.get('tokens') if 'tokens' in state else self.tokens_per_minute
+            state['tokens'] = min(self.tokens_per_minute, tokens + elapsed * self.tokens_per_minute / 60)
+        else:
+            state.pop('tokens', None)
+        state['updated'] = now
+        return state
+
+    def _save(self, state: dict):
+        tmp = self.path.with_name(self.path.name + f'.{os.getpid()}.tmp')
+        tmp.write_text(json.dumps(state), encoding='utf-8')
+        os.replace(tmp, self.path)
+
+    def _reserve(self, tokens: float) -> float:
+        """Descuenta 1 request y `tokens` si hay saldo; si no, devuelve los segundos a esperar."""
+        with file_lock(self.lock_path):
+            state = self._load(time.time())
+            if self.tokens_per_minute:
+                tokens = min(tokens, self.tokens_per_minute)
+            wait = 0.0
+            if state['requests'] < 1:
+                wait = (1 - state['requests']) * 60 / self.requests_per_minute
+            if self.tokens_per_minute and state['tokens'] < tokens:
+                wait = max(wait, (tokens - state['tokens']) * 60 / self.tokens_per_minute)
+            if wait <= 0:
+                state['requests'] -= 1
+                if self.tokens_per_minute:
+                    state['tokens'] -= tokens
+            self._save(state)
+            return wait
+
+    def available(self) -> float:
+        """Saldo actual de requests compartido por todos los procesos."""
+        with file_lock(self.lock_path):
+            return self._load(time.time())['requests']
+
+    def acquire_blocking(self, tokens: float = 0):
+        """Espera turno (síncrono) para una request de aproximadamente `tokens` tokens."""
+        while True:
+            wait = self._reserve(tokens)
+            if wait <= 0:
+                return
+            # Pequeño desfase para que los procesos en espera no despierten todos juntos
+            wait += random.uniform(0, 0.05)
+            self.waited += wait
+            time.sleep(wait)
+
+    async def acquire(self, tokens: float = 0):
+        """Espera turno (asyncio); dentro del proceso las corrutinas hacen fila."""
+        loop = asyncio.get_running_loop()
+        if self._lock_loop is not loop:
+            # Un lock por event loop: el extractor corre un asyncio.run por nivel
+            self._lock = asyncio.Lock()
+            self._lock_loop = loop
+        async with self._lock:
+            while True:
+                wait = self._reserve(tokens)
+                if wait <= 0:
+                    return
+                wait += random.uniform(0, 0.05)
+                self.waited += wait
+                await asyncio.sleep(wait)
+
+
+def shared_rate_limiter(
+    api_key: str,
+    model_name: str,
+    requests_per_minute: float,
+    tokens_per_minute: Optional[float] = None,
+    directory: Optional[Path] = None
+) -> SharedRateLimiter:
+    """Limitador compartido de una API key y un modelo."""
+    path = shared_limiter_path(key_fingerprint(api_key), model_name, directory)
+    return SharedRateLimiter(path, requests_per_minute, tokens_per_minute)
@@ -0,0 +1,198 @@
+"""
+Matriz de atributos en formato columnar
+Convierte la columna de texto `gemini_attributes` en las 22 columnas del
+prompt como categóricas de pandas, con tablas de códigos estables entre
+corridas, y la exporta a Parquet y a una matriz one-hot dispersa (.npz) para
+búsqueda y similitud. Los consumidores leen el Parquet en lugar de volver a
+parsear el texto.
+
+pyarrow y scipy son opcionales: solo se importan al exportar.
+"""
+
+import re
+import json
+import logging
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from atributos import ATTRIBUTE_NAMES, is_missing, parse_attributes
+
+
+logger = logging.getLogger(__name__)
+
+# Tablas de códigos: atributo → valores en orden de código (el código es la posición)
+CodeTables = Dict[str, List[str]]
+
+# Formato canónico de format_attributes: los 22 atributos en orden fijo
+_CANONICAL_PREFIX = f'{ATTRIBUTE_NAMES[0]}: '
+_CANONICAL_SEPARATOR = re.compile(
+    ', (' + '|'.join(re.escape(name) for name in ATTRIBUTE_NAMES[1:]) + '): '
+)
+_CANONICAL_TAIL = ATTRIBUTE_NAMES[1:]
+
+# Textos que is_missing() trata como atributo no encontrado
+_MISSING_TEXT = ('', 'nan', 'none', 'null')
+
+
+def _parse_values(text: str) -> List[Optional[str]]:
+    """Valores de los 22 atributos en orden; formato canónico con un solo split."""
+    if text.startswith(_CANONICAL_PREFIX):
+        parts = _CANONICAL_SEPARATOR.split(text[len(_CANONICAL_PREFIX):])
+        if parts[1::2] == _CANONICAL_TAIL:
+            return [parts[0]] + parts[2::2]
+    attributes = parse_attributes(text)
+    return [attributes.get(name) for name in ATTRIBUTE_NAMES]
+
+
+def parse_attribute_column(attributes: pd.Series) -> pd.DataFrame:
+    """
+    Parser rápido de la columna de atributos a un DataFrame de 22 columnas.
+
+    Cada texto distinto se parsea una sola vez; las filas en el formato
+    canónico (las que escribe el extractor) se resuelven con un solo split y
+    el resto cae al parser general. Los errores y los valores faltantes
+    quedan como NaN.
+    """
+    codes, uniques = pd.factorize(attributes.fillna('').astype(str).str.strip())
+    parsed = pd.DataFrame(
+        [_parse_values(text) for text in uniques],
+        columns=ATTRIBUTE_NAMES,
+        dtype=object
+    )
+    parsed = parsed.apply(lambda column: column.str.strip())
+    parsed = parsed.mask(parsed.isna() | parsed.apply(lambda column: column.str.lower().isin(_MISSING_TEXT)))
+    parsed = parsed.reindex(codes)
+    parsed.index = attributes.index
+    return parsed
+
+
+def extend_code_tables(
+    parsed: pd.DataFrame,
+    closed_lists: Dict[str, List[str]],
+    code_tables: Optional[CodeTables] = None
+) -> CodeTables:
+    """
+    Tablas de códigos estables.
+
+    Cada atributo parte de su tabla anterior (o de la lista cerrada del
+    prompt) y solo agrega al final los valores nuevos, así que un código
+    nunca cambia de significado entre corridas.
+    """
+    tables: CodeTables = {}
+    for name in ATTRIBUTE_NAMES:
+        values = list((code_tables or {}).get(name) or closed_lists.get(name) or [])
+        known = set(values)
+        for value in sorted(parsed[name].dropna().unique()):
+            if value not in known:
+                values.append(value)
+                known.add(value)
+        tables[name] = [value for value in values if not is_missing(value)]
+    return tables
+
+
+def build_attribute_matrix(
+    df: pd.DataFrame,
+    attributes_column: str,
+    closed_lists: Dict[str, List[str]],
+    code_tables: Optional[CodeTables] = None,
+    id_column: str = 'id'
+) -> Tuple[pd.DataFrame, CodeTables]:
+    """
+    Matriz de atributos: una columna categórica por atributo.
+
+    Returns:
+        (matriz indexada como `df` con la columna de id, tablas de códigos)
+    """
+    parsed = parse_attribute_column(df[attributes_column])
+    tables = extend_code_tables(parsed, closed_lists, code_tables)
+
+    matrix = pd.DataFrame(index=df.index)
+    if id_column in df.columns:
+        matrix[id_column] = df[id_column].astype('string')
+    for name in ATTRIBUTE_NAMES:
+        matrix[name] = pd.Categorical(parsed[name], categories=tables[name])
+    return matrix, tables
+
+
+def one_hot_columns(code_tables: CodeTables) -> List[str]:
+    """Etiquetas `atributo=valor` de las columnas de la matriz one-hot."""
+    return [f"{name}={value}" for name in ATTRIBUTE_NAMES for value in code_tables[name]]
+
+
+def one_hot_matrix(matrix: pd.DataFrame, code_tables: CodeTables):
+    """
+    Matriz one-hot dispersa (CSR, una fila por producto) a partir de los
+    códigos categóricos. Las columnas siguen `one_hot_columns`.
+    """
+    from scipy import sparse
+
+    rows, columns = [], []
+    offset = 0
+    for name in ATTRIBUTE_NAMES:
+        codes = matrix[name].cat.codes.to_numpy().astype(np.int64)
+        present = np.flatnonzero(codes >= 0)
+        rows.append(present)
+        columns.append(codes[present] + offset)
+        offset += len(code_tables[name])
+
+    rows = np.concatenate(rows)
+    columns = np.concatenate(columns)
+    data = np.ones(len(rows), dtype=np.uint8)
+    return sparse.csr_matrix((data, (rows, columns)), shape=(len(matrix), offset))
+
+
+def load_code_tables(path: Path) -> Optional[CodeTables]:
+    """Tablas de códigos de una exportación anterior (None si no existe)."""
+    path = Path(path)
+    if not path.exists():
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)['codes']
+
+
+def export_attribute_matrix(
+    df: pd.DataFrame,
+    attributes_column: str,
+    closed_lists: Dict[str, List[str]],
+    parquet_path: Path,
+    npz_path: Path,
+    codes_path: Path,
+    id_column: str = 'id'
+) -> pd.DataFrame:
+    """
+    Escribe la matriz en Parquet, la one-hot dispersa en .npz y las tablas de
+    códigos (con las etiquetas de columna de la one-hot) en JSON.
+
+    Requiere pyarrow y scipy.
+    """
+    from scipy import sparse
+
+    matrix, tables = build_attribute_matrix(
+        df, attributes_column, closed_lists, load_code_tables(codes_path), id_column
+    )
+    matrix.to_parquet(parquet_path, engine='pyarrow', index=False)
+    sparse.save_npz(npz_path, one_hot_matrix(matrix, tables))
+
+    with open(codes_path, 'w', encoding='utf-8') as f:
+        json.dump({'codes': tables, 'one_hot_columns': one_hot_columns(tables)}, f, ensure_ascii=False, indent=2)
+
+    logger.info(f"Matriz de atributos: {len(matrix)} filas → {parquet_path}, {npz_path}")
+    return matrix
+
+
+def load_attribute_matrix(parquet_path: Path, codes_path: Optional[Path] = None) -> pd.DataFrame:
+    """
+    Carga la matriz desde Parquet. Con `codes_path` las categorías se fijan a
+    las tablas de códigos completas (incluye valores sin ocurrencias).
+    """
+    matrix = pd.read_parquet(parquet_path, engine='pyarrow')
+    tables = load_code_tables(codes_path) if codes_path is not None else None
+    for name in ATTRIBUTE_NAMES:
+        if tables is not None:
+            matrix[name] = pd.Categorical(matrix[name].astype(object), categories=tables[name])
+        elif matrix[name].dtype != 'category':
+            matrix[name] = matrix[name].astype('category')
+    return matrix
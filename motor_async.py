@@ -0,0 +1,612 @@
+"""
+Motor asíncrono de extracción de atributos con Gemini
+Mantiene varias solicitudes en vuelo limitadas por requests/tokens por minuto
+"""
+
+import asyncio
+import time
+import logging
+from pathlib import Path
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+from google import genai
+from google.genai import types
+
+from cache_contexto import cached_token_count
+from cobertura_solicitudes import HedgePolicy
+from cache_respuestas import ResponseCache, make_cache_key
+from cola_reintentos import (
+    QUOTA, BlockedResponseError, Failure, RetryPolicy, RetryQueue, classify_error
+)
+from control_concurrencia import AIMDController
+from enrutador_prompt import PromptRoute
+from empaquetado import PackedItem, build_packed_contents, split_packed_response
+from esquema_respuesta import build_packed_schema, parse_structured_response, restrict_schema
+from perfiles_generacion import GenerationProfile, profile_options
+from planificador_cuota import DailyQuota
+from pool_claves import ClientPool, KeySlot
+from preprocesamiento_imagenes import ImagePreprocessConfig, preprocess_image
+from uso_tokens import TokenUsage
+
+
+logger = logging.getLogger(__name__)
+
+
+MIME_TYPES = {
+    '.jpg': 'image/jpeg',
+    '.jpeg': 'image/jpeg',
+    '.png': 'image/png',
+    '.gif': 'image/gif',
+    '.webp': 'image/webp'
+}
+
+
+def get_mime_type(image_path: Path) -> str:
+    """Determina el tipo MIME de la imagen."""
+    return MIME_TYPES.get(image_path.suffix.lower(), 'image/jpeg')
+
+
+@dataclass
+class ExtractionJob:
+    """Producto pendiente de extracción (`prompt` es la parte propia del producto)"""
+    index: Any
+    product_id: str
+    image_path: Path
+    prompt: str
+    attempts: Dict[str, int] = field(default_factory=dict)  # reintentos por clase de error
+    known_attributes: Dict[str, str] = field(default_factory=dict)  # conservados (reparación parcial)
+    route: Optional[str] = None  # familia del enrutador de prompts (None = prompt completo)
+    usage: Optional[TokenUsage] = None  # tokens de todas sus llamadas (su parte de los paquetes)
+    refresh: bool = False  # re-extracción de una respuesta rechazada: no se lee de la caché
+
+
+# Resultado de un intento: texto final o fallo a reintentar
+Outcome = Union[str, Failure]
+
+
+class TokenBucket:
+    """
+    Token bucket asíncrono con dos cubetas: requests por minuto y tokens por minuto.
+
+    Ambas se rellenan de forma continua; `acquire` espera hasta que haya
+    saldo suficiente en las dos.
+    """
+
+    def __init__(self, requests_per_minute: float, tokens_per_minute: Optional[float] = None):
+        self.requests_per_minute = float(requests_per_minute)
+        self.tokens_per_minute = float(tokens_per_minute) if tokens_per_minute else None
+        self._request_balance = self.requests_per_minute
+        self._token_balance = self.tokens_per_minute or 0.0
+        self._last_refill = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self._last_refill
+        self._last_refill = now
+
+        self._request_balance = min(
+            self.requests_per_minute,
+            self._request_balance + elapsed * self.requests_per_minute / 60
+        )
+        if self.tokens_per_minute:
+            self._token_balance = min(
+                self.tokens_per_minute,
+                self._token_balance + elapsed * self.tokens_per_minute / 60
+            )
+
+    def _wait_time(self, tokens: float) -> float:
+        """Segundos que faltan para poder consumir 1 request y `tokens` tokens."""
+        wait = 0.0
+        if self._request_balance < 1:
+            wait = (1 - self._request_balance) * 60 / self.requests_per_minute
+        if self.tokens_per_minute and self._token_balance < tokens:
+            wait = max(wait, (tokens - self._token_balance) * 60 / self.tokens_per_minute)
+        return wait
+
+    def available(self) -> float:
+        """Saldo actual de requests (puede ser fraccionario)."""
+        self._refill()
+        return self._request_balance
+
+    async def acquire(self, tokens: float = 0):
+        """Espera turno para una request que consumirá aproximadamente `tokens` tokens."""
+        if self.tokens_per_minute:
+            tokens = min(tokens, self.tokens_per_minute)
+
+        async with self._lock:
+            while True:
+                self._refill()
+                wait = self._wait_time(tokens)
+                if wait <= 0:
+                    self._request_balance -= 1
+                    if self.tokens_per_minute:
+                        self._token_balance -= tokens
+                    return
+                await asyncio.sleep(wait)
+
+
+class AsyncExtractionEngine:
+    """Procesa trabajos de extracción de forma concurrente con el cliente async de Gemini"""
+
+    def __init__(
+        self,
+        client: genai.Client,
+        model_name: str,
+        max_concurrent: int = 4,
+        rate_limiter: Optional[TokenBucket] = None,
+        retry_policy: Optional[RetryPolicy] = None,
+        estimated_tokens: int = 0,
+        cache: Optional[ResponseCache] = None,
+        prompt_prefix: str = '',
+        cached_content: Optional[str] = None,
+        image_preprocess: Optional[ImagePreprocessConfig] = None,
+        pack_size: int = 1,
+        image_tokens: int = 258,
+        response_schema: Optional[types.Schema] = None,
+        profile: Optional[GenerationProfile] = None,
+        controller: Optional[AIMDController] = None,
+        hedging: Optional[HedgePolicy] = None,
+        routes: Optional[Dict[str, PromptRoute]] = None,
+        daily_quota: Optional[DailyQuota] = None,
+        client_pool: Optional[ClientPool] = None
+    ):
+        self.client = client
+        self.model_name = model_name
+        self.max_concurrent = max_concurrent
+        self.controller = controller or AIMDController.fixed(max_concurrent)
+        self.rate_limiter = rate_limiter
+        self.hedging = hedging
+        self.daily_quota = daily_quota
+        self.client_pool = client_pool
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.estimated_tokens = estimated_tokens
+        self.cache = cache
+        self.prompt_prefix = prompt_prefix
+        self.cached_content = cached_content
+        self.image_preprocess = image_preprocess
+        self.pack_size = max(1, pack_size)
+        self.image_tokens = image_tokens
+        self.response_schema = response_schema
+        self.routes = routes or {}
+        self.profile = profile
+        # Respuestas de distinto formato/perfil no son intercambiables en la caché
+        self.cache_namespace = '|'.join(filter(None, [
+            model_name,
+            'json' if self.returns_json else None,
+            profile.name if profile else None
+        ]))
+        self.coalesced = 0
+        self.api_calls = 0
+        self.context_cache_hits = 0
+        self.cached_tokens = 0
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.usage = TokenUsage()
+        self.call_latencies: List[float] = []
+        self.retries: Counter = Counter()
+        self.final_failures: Counter = Counter()
+        self._in_flight: Dict[str, asyncio.Future] = {}
+        self._restricted_schemas: Dict[Tuple[Optional[str], Tuple[str, ...]], types.Schema] = {}
+        self._packed_schemas: Dict[Optional[str], types.Schema] = {}
+
+    @property
+    def returns_json(self) -> bool:
+        """True si las respuestas individuales llegan como registro JSON (solo con esquema)."""
+        return self.response_schema is not None
+
+    async def _load_image(self, job: ExtractionJob) -> Tuple[bytes, str]:
+        """Lee (y preprocesa si aplica) la imagen del trabajo; retorna bytes y tipo MIME."""
+        image_path = job.image_path
+        if self.image_preprocess is not None:
+            image_path = await asyncio.to_thread(preprocess_image, image_path, self.image_preprocess)
+        image_bytes = await asyncio.to_thread(image_path.read_bytes)
+        return image_bytes, get_mime_type(image_path)
+
+    def _route(self, job: Optional[ExtractionJob]) -> Optional[PromptRoute]:
+        return self.routes.get(job.route) if job is not None and job.route else None
+
+    def _prefix(self, job: Optional[ExtractionJob]) -> str:
+        """Prefijo estático del trabajo (el de su familia si el enrutador le asignó una)."""
+        route = self._route(job)
+        return route.prefix if route is not None else self.prompt_prefix
+
+    def _cached_content(self, job: Optional[ExtractionJob]) -> Optional[str]:
+        route = self._route(job)
+        return route.cached_content if route is not None else self.cached_content
+
+    def _base_schema(self, job: Optional[ExtractionJob]) -> Optional[types.Schema]:
+        route = self._route(job)
+        if route is not None and route.response_schema is not None:
+            return route.response_schema
+        return self.response_schema
+
+    def _cache_key(self, job: ExtractionJob, image_bytes: bytes) -> str:
+        return make_cache_key(image_bytes, self._prefix(job) + job.prompt, self.cache_namespace)
+
+    def _cache_get(self, job: ExtractionJob, key: str) -> Optional[str]:
+        """Respuesta guardada; las re-extracciones no la leen para no recibir la misma respuesta rechazada."""
+        if self.cache is None or job.refresh:
+            return None
+        return self.cache.get(key)
+
+    def _cache_put(self, key: str, result: str):
+        """Guarda solo respuestas utilizables: sin errores y, con esquema, un registro JSON completo."""
+        if self.cache is None or result.startswith('ERROR'):
+            return
+        if self.returns_json and parse_structured_response(result)[1] is None:
+            return
+        self.cache.put(key, self.cache_namespace, result)
+
+    async def process_job(self, job: ExtractionJob) -> Outcome:
+        """
+        Procesa un producto con Gemini y retorna los atributos extraídos.
+
+        Consulta primero la caché y une requests idénticas que estén en vuelo
+        al mismo tiempo en una sola llamada.
+
+        Returns:
+            String con los atributos extraídos o mensaje de error, o un
+            `Failure` si el intento falló y puede reintentarse
+        """
+        if not job.image_path.exists():
+            return f"ERROR_IMAGEN: Archivo no encontrado en {job.image_path}"
+
+        try:
+            image_bytes, mime_type = await self._load_image(job)
+        except Exception as e:
+            return f"ERROR_LECTURA: {str(e)}"
+
+        key = self._cache_key(job, image_bytes)
+        cached = self._cache_get(job, key)
+        if cached is not None:
+            return cached
+
+        if key in self._in_flight:
+            self.coalesced += 1
+            return await asyncio.shield(self._in_flight[key])
+
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = future
+        try:
+            outcome = await self._generate(job, image_bytes, mime_type)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # Marcar como consultada aunque nadie más espere
+            raise
+        finally:
+            del self._in_flight[key]
+
+        if isinstance(outcome, str):
+            self._cache_put(key, outcome)
+        future.set_result(outcome)
+        return outcome
+
+    async def process_pack(self, jobs: List[ExtractionJob]) -> List[Tuple[ExtractionJob, Outcome]]:
+        """
+        Procesa varios productos en una sola llamada.
+
+        Los productos en caché o con imagen inválida se resuelven sin API; los
+        que el modelo omita en su respuesta se reintentan de forma individual.
+        Si falla la llamada del paquete, cada producto vuelve como `Failure`.
+        """
+        results: List[Tuple[ExtractionJob, Outcome]] = []
+        pending: List[Tuple[ExtractionJob, str, PackedItem]] = []
+
+        for job in jobs:
+            if not job.image_path.exists():
+                results.append((job, f"ERROR_IMAGEN: Archivo no encontrado en {job.image_path}"))
+                continue
+            try:
+                image_bytes, mime_type = await self._load_image(job)
+            except Exception as e:
+                results.append((job, f"ERROR_LECTURA: {str(e)}"))
+                continue
+
+            key = self._cache_key(job, image_bytes)
+            cached = self._cache_get(job, key)
+            if cached is not None:
+                results.append((job, cached))
+                continue
+
+            pending.append((job, key, PackedItem(job.product_id, image_bytes, mime_type, job.prompt)))
+
+        if len(pending) == 1:
+            job, key, item = pending[0]
+            outcome = await self._generate(job, item.image_bytes, item.mime_type)
+            if isinstance(outcome, str):
+                self._cache_put(key, outcome)
+            results.append((job, outcome))
+        elif pending:
+            items = [item for _, _, item in pending]
+            # Un paquete usa el prefijo de su familia solo si todos sus productos la comparten
+            pack_job = pending[0][0] if len({job.route for job, _, _ in pending}) == 1 else None
+            contents = build_packed_contents(items, '' if self._cached_content(pack_job) else self._prefix(pack_job))
+            tokens = self.estimated_tokens + sum(
+                len(item.product_prompt) // 4 + self.image_tokens for item in items[1:]
+            )
+            label = f"paquete de {len(items)} ({items[0].product_id}…)"
+            outcome = await self._call_gemini(
+                label, contents, self._generation_config(packed=True, job=pack_job, pack_size=len(items)), tokens,
+                [job for job, _, _ in pending]
+            )
+
+            if isinstance(outcome, Failure):
+                results.extend((job, outcome) for job, _, _ in pending)
+                return results
+
+            split = split_packed_response(outcome, [item.product_id for item in items])
+            for job, key, item in pending:
+                result: Outcome = split[item.product_id]
+                if result.startswith('ERROR_EMPAQUETADO'):
+                    result = await self._generate(job, item.image_bytes, item.mime_type)
+                if isinstance(result, str):
+                    self._cache_put(key, result)
+                results.append((job, result))
+
+        return results
+
+    def _record_schema(self, job: Optional[ExtractionJob]) -> Optional[types.Schema]:
+        """Esquema del registro; se reduce a los atributos faltantes si ya se conocen algunos."""
+        schema = self._base_schema(job)
+        if schema is None or job is None or not job.known_attributes:
+            return schema
+        missing = tuple(name for name in schema.property_ordering if name not in job.known_attributes)
+        key = (job.route, missing)
+        if key not in self._restricted_schemas:
+            self._restricted_schemas[key] = restrict_schema(schema, list(missing))
+        return self._restricted_schemas[key]
+
+    def _packed_schema(self, job: Optional[ExtractionJob]) -> Optional[types.Schema]:
+        schema = self._base_schema(job)
+        if schema is None:
+            return None
+        route = job.route if self._route(job) is not None else None
+        if route not in self._packed_schemas:
+            self._packed_schemas[route] = build_packed_schema(schema)
+        return self._packed_schemas[route]
+
+    def _generation_config(
+        self,
+        packed: bool = False,
+        job: Optional[ExtractionJob] = None,
+        pack_size: int = 1
+    ) -> Optional[types.GenerateContentConfig]:
+        """Configuración de generación según context cache, empaquetado y salida estructurada."""
+        options = profile_options(self.profile, self.model_name, pack_size) if self.profile else {}
+        cached_content = self._cached_content(job)
+        if cached_content:
+            options['cached_content'] = cached_content
+        if packed:
+            packed_schema = self._packed_schema(job)
+            if packed_schema is not None:
+                options['response_mime_type'] = 'application/json'
+                options['response_schema'] = packed_schema
+        elif self.response_schema is not None:
+            options['response_mime_type'] = 'application/json'
+            options['response_schema'] = self._record_schema(job)
+        return types.GenerateContentConfig(**options) if options else None
+
+    async def _generate(self, job: ExtractionJob, image_bytes: bytes, mime_type: str) -> Outcome:
+        """Llamada individual a Gemini para un producto."""
+        # Con context cache el prefijo ya vive en el servidor
+        prompt_text = job.prompt if self._cached_content(job) else self._prefix(job) + job.prompt
+        contents = [
+            types.Part.from_bytes(data=image_bytes, mime_type=mime_type),
+            types.Part.from_text(text=prompt_text)
+        ]
+        return await self._call_gemini(
+            job.product_id, contents, self._generation_config(job=job), self.estimated_tokens, [job]
+        )
+
+    async def _call_gemini(
+        self,
+        label: str,
+        contents: List[types.Part],
+        generation_config: Optional[types.GenerateContentConfig],
+        tokens: int,
+        jobs: List[ExtractionJob]
+    ) -> Outcome:
+        """
+        Un solo intento de llamada a Gemini.
+
+        No espera ni reintenta aquí: el fallo se clasifica y `run` decide si el
+        trabajo vuelve a la cola de reintentos diferidos. Los tokens de la
+        respuesta se reparten entre `jobs`.
+        """
+        # Respuesta de cada solicitud enviada (None si falló o se canceló el duplicado perdedor)
+        sent: List[Any] = []
+
+        async def _request(slot: Optional[KeySlot]):
+            if self.daily_quota is not None:
+                self.daily_quota.consume(self.model_name)
+            client = slot.client if slot is not None else self.client
+            position = len(sent)
+            sent.append(None)
+            error = None
+            try:
+                sent[position] = await client.aio.models.generate_content(
+                    model=self.model_name,
+                    contents=contents,
+                    config=generation_config
+                )
+                return sent[position]
+            except BaseException as e:
+                error = e
+                raise
+            finally:
+                if slot is not None:
+                    self.client_pool.release(slot, error)
+
+        async def _hedge_request():
+            # El duplicado también consume cuota (y puede ir a otra clave del pool)
+            return await _request(await self._pace(tokens))
+
+        slot = await self._pace(tokens)
+        start = time.monotonic()
+        try:
+            if self.hedging is not None:
+                response = await self.hedging.run(lambda: _request(slot), _hedge_request)
+            else:
+                response = await _request(slot)
+            self._record_usage(response, time.monotonic() - start, jobs)
+            for other in sent:
+                if other is not response:
+                    # La solicitud perdedora de la cobertura también se cobra
+                    self._count_call(other, jobs)
+            if not response.text:
+                raise BlockedResponseError(f"Respuesta sin texto ({_block_reason(response)})")
+            self.controller.on_success()
+            return response.text.strip().replace('\n', ' ')
+
+        except Exception as e:
+            failure = classify_error(e)
+            logger.warning(f"{label}: intento falló [{failure.error_class}]: {failure.message}")
+            if failure.error_class == QUOTA:
+                self.controller.on_quota_error(failure.retry_delay)
+            return failure
+
+    async def _pace(self, tokens: int) -> Optional[KeySlot]:
+        """Espera turno en el limitador; con pool de claves devuelve la clave elegida."""
+        if self.client_pool is not None:
+            return await self.client_pool.acquire(self.model_name, tokens)
+        if self.rate_limiter:
+            await self.rate_limiter.acquire(tokens)
+        return None
+
+    def _record_usage(self, response, latency: float, jobs: List[ExtractionJob]):
+        """Acumula estadísticas de uso y latencia de la respuesta (también por producto)."""
+        self.call_latencies.append(latency)
+        self._count_call(response, jobs)
+
+    def _count_call(self, response, jobs: List[ExtractionJob]):
+        """Cuenta una llamada enviada y reparte su uso entre `jobs`; sin respuesta cuenta solo la llamada."""
+        self.api_calls += 1
+        usage = getattr(response, 'usage_metadata', None)
+        call_usage = TokenUsage.from_metadata(usage)
+        self.usage = self.usage + call_usage
+        share = call_usage.split(len(jobs))
+        for job in jobs:
+            job.usage = share if job.usage is None else job.usage + share
+        if usage is not None:
+            self.input_tokens += getattr(usage, 'prompt_token_count', None) or 0
+            self.output_tokens += (getattr(usage, 'candidates_token_count', None) or 0) + \
+                (getattr(usage, 'thoughts_token_count', None) or 0)
+        cached = cached_token_count(usage)
+        if cached:
+            self.context_cache_hits += 1
+            self.cached_tokens += cached
+
+    async def run(
+        self,
+        jobs: Iterable[ExtractionJob],
+        on_result: Callable[[ExtractionJob, str], None]
+    ) -> int:
+        """
+        Procesa todos los trabajos con tantas llamadas en vuelo como permita el
+        controlador de concurrencia (cada una con hasta `pack_size` productos).
+
+        Los trabajos que fallan pasan a una cola de reintentos diferidos con
+        backoff por clase de error y liberan su lugar de inmediato, así que un
+        producto problemático nunca frena al resto. Los reintentos listos
+        tienen prioridad sobre los trabajos nuevos y se envían de uno en uno.
+
+        `on_result` se invoca una sola vez por trabajo, con su resultado final.
+
+        Returns:
+            Número de trabajos procesados
+        """
+        in_flight = set()
+        retry_queue = RetryQueue()
+        errors: List[BaseException] = []
+        processed = 0
+
+        def _settle(job: ExtractionJob, outcome: Outcome):
+            nonlocal processed
+            if isinstance(outcome, Failure):
+                if self.retry_policy.can_retry(outcome, job.attempts):
+                    attempt = job.attempts.get(outcome.error_class, 0)
+                    job.attempts[outcome.error_class] = attempt + 1
+                    self.retries[outcome.error_class] += 1
+                    retry_queue.push(job, self.retry_policy.delay(outcome, attempt))
+                    return
+                self.final_failures[outcome.error_class] += 1
+                outcome = self.retry_policy.final_message(outcome)
+            on_result(job, outcome)
+            processed += 1
+
+        async def _worker(unit: List[ExtractionJob]):
+            try:
+                if len(unit) > 1:
+                    results = await self.process_pack(unit)
+                else:
+                    results = [(unit[0], await self.process_job(unit[0]))]
+            finally:
+                self.controller.release()
+            for job, outcome in results:
+                _settle(job, outcome)
+
+        def _done(task: asyncio.Task):
+            in_flight.discard(task)
+            if not task.cancelled() and task.exception() is not None:
+                errors.append(task.exception())
+
+        source = _chunks(jobs, self.pack_size)
+        exhausted = False
+        while not errors:
+            await self.controller.acquire()
+
+            retry_job = retry_queue.pop_ready()
+            unit = [retry_job] if retry_job is not None else None
+            if unit is None and not exhausted:
+                unit = next(source, None)
+                exhausted = unit is None
+
+            if unit is not None:
+                task = asyncio.create_task(_worker(unit))
+                in_flight.add(task)
+                task.add_done_callback(_done)
+                continue
+
+            # Nada listo: esperar a que termine una llamada o venza un reintento
+            self.controller.release()
+            if not in_flight and not retry_queue:
+                break
+            timeout = retry_queue.next_ready_in()
+            if in_flight:
+                await asyncio.wait(set(in_flight), timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            else:
+                await asyncio.sleep(timeout)
+
+        if errors:
+            await asyncio.gather(*in_flight, return_exceptions=True)
+            raise errors[0]
+        return processed
+
+
+def _block_reason(response) -> str:
+    """Motivo por el que una respuesta llegó sin texto."""
+    feedback = getattr(response, 'prompt_feedback', None)
+    if feedback is not None and getattr(feedback, 'block_reason', None):
+        return f"SAFETY: {feedback.block_reason}"
+    candidates = getattr(response, 'candidates', None) or []
+    if candidates and getattr(candidates[0], 'finish_reason', None):
+        return str(candidates[0].finish_reason)
+    return 'sin candidatos'
+
+
+def _chunks(jobs: Iterable[ExtractionJob], size: int) -> Iterator[List[ExtractionJob]]:
+    """Agrupa los trabajos en listas de hasta `size` elementos."""
+    chunk: List[ExtractionJob] = []
+    for job in jobs:
+        chunk.append(job)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
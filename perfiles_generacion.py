@@ -0,0 +1,75 @@
+"""
+Perfiles de generación con nombre para Gemini
+Cada perfil fija presupuesto de thinking, tope de tokens de salida y
+temperatura; el tipo MIME de la respuesta lo decide el motor según haya
+esquema o no. La extracción es casi pura
+clasificación, así que "fast" desactiva el thinking.
+"""
+
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+
+from google.genai import types
+
+
+@dataclass(frozen=True)
+class GenerationProfile:
+    """Parámetros de generación de un perfil"""
+    name: str
+    thinking_budget: Optional[int]  # 0 = sin thinking, -1 = dinámico
+    max_output_tokens: int
+    temperature: float
+
+
+GENERATION_PROFILES: Dict[str, GenerationProfile] = {
+    'fast': GenerationProfile('fast', thinking_budget=0, max_output_tokens=768, temperature=0.0),
+    'balanced': GenerationProfile('balanced', thinking_budget=512, max_output_tokens=2048, temperature=0.2),
+    'accurate': GenerationProfile('accurate', thinking_budget=-1, max_output_tokens=8192, temperature=0.4),
+}
+
+DEFAULT_PROFILE = 'balanced'
+
+# Una respuesta empaquetada ocupa ~150-200 tokens por producto (JSON con id y atributos)
+PACKED_TOKENS_PER_PRODUCT = 256
+# Tope de salida de los modelos 2.5
+MAX_OUTPUT_TOKENS_LIMIT = 65536
+
+
+def get_profile(name: str) -> GenerationProfile:
+    """Obtiene un perfil por nombre."""
+    try:
+        return GENERATION_PROFILES[name]
+    except KeyError:
+        raise ValueError(f"Perfil desconocido: {name} (disponibles: {', '.join(GENERATION_PROFILES)})")
+
+
+def model_supports_thinking(model_name: str) -> bool:
+    """Los modelos 2.0 y anteriores rechazan thinking_config."""
+    return not any(version in model_name for version in ('1.5', '2.0'))
+
+
+def output_token_limit(profile: GenerationProfile, pack_size: int = 1) -> int:
+    """
+    Tope de tokens de salida para una llamada con `pack_size` productos.
+
+    El thinking cuenta contra el tope, así que un paquete reserva su
+    presupuesto (con thinking dinámico, el tope del perfil) más la
+    respuesta de cada producto; nunca baja del tope del perfil.
+    """
+    if pack_size <= 1:
+        return profile.max_output_tokens
+    budget = profile.thinking_budget or 0
+    thinking = profile.max_output_tokens if budget < 0 else budget
+    packed = pack_size * PACKED_TOKENS_PER_PRODUCT + thinking
+    return min(max(profile.max_output_tokens, packed), MAX_OUTPUT_TOKENS_LIMIT)
+
+
+def profile_options(profile: GenerationProfile, model_name: str, pack_size: int = 1) -> Dict[str, Any]:
+    """Argumentos de GenerateContentConfig que aporta el perfil (tope escalado si es un paquete)."""
+    options: Dict[str, Any] = {
+        'max_output_tokens': output_token_limit(profile, pack_size),
+        'temperature': profile.temperature,
+    }
+    if profile.thinking_budget is not None and model_supports_thinking(model_name):
+        options['thinking_config'] = types.ThinkingConfig(thinking_budget=profile.thinking_budget)
+    return options
@@ -0,0 +1,213 @@
+"""
+Planificador de cuota diaria
+Lleva en un archivo de estado las solicitudes consumidas por modelo en la
+ventana de cuota actual (Gemini reinicia las cuotas por día a medianoche,
+hora del Pacífico), ordena los productos pendientes por una columna de
+prioridad y deja de enviar trabajo antes de llegar al tope diario; lo que no
+cabe queda para la siguiente ventana. Con un presupuesto de tiempo
+(`--deadline`) elige el subconjunto de mayor prioridad que cabe en él.
+"""
+
+import os
+import re
+import json
+import time
+import logging
+from pathlib import Path
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Iterable, Iterator, List, Optional
+
+import pandas as pd
+
+from limitador_compartido import file_lock
+
+try:
+    from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+except ImportError:
+    ZoneInfo = None
+    ZoneInfoNotFoundError = Exception
+
+
+logger = logging.getLogger(__name__)
+
+QUOTA_TIMEZONE = 'America/Los_Angeles'
+
+
+def _quota_timezone(name: str):
+    """Zona horaria de la ventana de cuota; UTC-8 fijo si no hay base de zonas."""
+    if ZoneInfo is not None:
+        try:
+            return ZoneInfo(name)
+        except ZoneInfoNotFoundError:
+            pass
+    return timezone(timedelta(hours=-8))
+
+
+class DailyQuota:
+    """
+    Consumo de solicitudes por día y por modelo, persistido en JSON.
+
+    El archivo se lee y escribe bajo un bloqueo de archivo para que varios
+    procesos sobre la misma API key compartan el conteo. El tope efectivo es
+    `requests_per_day * margin`, así los reintentos en vuelo no pasan del
+    límite real.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        requests_per_day: int,
+        margin: float = 0.95,
+        timezone_name: str = QUOTA_TIMEZONE
+    ):
+        self.path = Path(path)
+        self.requests_per_day = requests_per_day
+        self.margin = margin
+        self.tz = _quota_timezone(timezone_name)
+
+    @property
+    def daily_cap(self) -> int:
+        return int(self.requests_per_day * self.margin)
+
+    def window(self, now: Optional[datetime] = None) -> str:
+        """Día de la ventana de cuota actual (fecha en la zona de reinicio)."""
+        return (now or datetime.now(self.tz)).astimezone(self.tz).date().isoformat()
+
+    def next_reset(self) -> datetime:
+        """Inicio de la siguiente ventana de cuota."""
+        now = datetime.now(self.tz)
+        tomorrow = now.date() + timedelta(days=1)
+        return datetime(tomorrow.year, tomorrow.month, tomorrow.day, tzinfo=self.tz)
+
+    def seconds_until_reset(self) -> float:
+        return max(0.0, (self.next_reset() - datetime.now(self.tz)).total_seconds())
+
+    @contextmanager
+    def _locked_state(self, write: bool):
+        """Estado de la ventana actual bajo bloqueo; se guarda al salir si `write`."""
+        with file_lock(self.path.with_name(self.path.name + '.lock')):
+            state = {}
+            if self.path.exists():
+                try:
+                    state = json.loads(self.path.read_text(encoding='utf-8'))
+                except json.JSONDecodeError:
+                    logger.warning(f"Estado de cuota {self.path} corrupto, se reinicia")
+            if state.get('window') != self.window():
+                state = {'window': self.window(), 'requests': {}}
+            yield state
+            if write:
+                tmp = self.path.with_name(self.path.name + '.tmp')
+                tmp.write_text(json.dumps(state, ensure_ascii=False, indent=2), encoding='utf-8')
+                os.replace(tmp, self.path)
+
+    def used(self, model_name: str) -> int:
+        with self._locked_state(write=False) as state:
+            return state['requests'].get(model_name, 0)
+
+    def remaining(self, model_name: str) -> int:
+        return max(0, self.daily_cap - self.used(model_name))
+
+    def consume(self, model_name: str, requests: int = 1):
+        """Registra solicitudes enviadas (incluye reintentos y duplicados de cobertura)."""
+        with self._locked_state(write=True) as state:
+            state['requests'][model_name] = state['requests'].get(model_name, 0) + requests
+            state['updated'] = datetime.now(self.tz).isoformat()
+
+
+def parse_duration(text: str) -> float:
+    """Duración en segundos: `90m`, `2h`, `1h30m`, `45s`; un número solo son minutos."""
+    text = str(text).strip().lower()
+    if re.fullmatch(r'\d+(\.\d+)?', text):
+        return float(text) * 60
+    parts = re.findall(r'(\d+(?:\.\d+)?)\s*([hms])', text)
+    if not parts or ''.join(number + unit for number, unit in parts) != text.replace(' ', ''):
+        raise ValueError(f"Duración inválida '{text}': usa p. ej. 90m, 2h o 1h30m")
+    factors = {'h': 3600, 'm': 60, 's': 1}
+    return sum(float(number) * factors[unit] for number, unit in parts)
+
+
+def priority_values(df: pd.DataFrame, priority_column: Optional[str]) -> pd.Series:
+    """Prioridad numérica por fila (mayor primero); sin columna o sin valor cuenta como 0."""
+    if not priority_column or priority_column not in df.columns:
+        return pd.Series(0.0, index=df.index)
+    return pd.to_numeric(df[priority_column], errors='coerce').fillna(0.0)
+
+
+def prioritize(jobs: List[Any], priorities: pd.Series) -> List[Any]:
+    """Trabajos (con atributo `index`) de mayor a menor prioridad; el orden original desempata."""
+    return sorted(jobs, key=lambda job: -priorities.get(job.index, 0.0))
+
+
+def deadline_capacity(
+    seconds: float,
+    requests_per_minute: float,
+    max_concurrent: int,
+    pack_size: int,
+    call_seconds: float,
+    headroom: float = 0.1
+) -> int:
+    """
+    Productos que caben en `seconds`: el ritmo es el menor entre el límite de
+    RPM y lo que permiten `max_concurrent` llamadas de `call_seconds`, menos
+    un margen para reintentos.
+    """
+    calls_per_minute = min(requests_per_minute, max_concurrent * 60 / max(call_seconds, 0.1))
+    return int(seconds / 60 * calls_per_minute * pack_size * (1 - headroom))
+
+
+def quota_capacity(remaining_requests: int, pack_size: int, headroom: float = 0.1) -> int:
+    """Productos que caben en las solicitudes que quedan hoy, con margen para reintentos."""
+    return int(remaining_requests * pack_size * (1 - headroom))
+
+
+def gate_jobs(
+    jobs: Iterable[Any],
+    quota: Optional[DailyQuota] = None,
+    model_name: Optional[str] = None,
+    deadline: Optional[float] = None
+) -> Iterator[Any]:
+    """
+    Entrega trabajos mientras quede cuota diaria y no se haya pasado el
+    `deadline` (time.time()); los que quedan sin entregar no se envían.
+    """
+    for job in jobs:
+        if deadline is not None and time.time() >= deadline:
+            logger.info("Planificador: se alcanzó el límite de tiempo, no se envían más trabajos")
+            return
+        if quota is not None and quota.remaining(model_name) <= 0:
+            logger.info(f"Planificador: cuota diaria de {model_name} agotada, no se envían más trabajos")
+            return
+        yield job
+
+
+def run_windows(
+    run: Callable[[], Any],
+    pending: Callable[[Any], int],
+    capacity: Callable[[], int],
+    wait: Callable[[int], None]
+) -> Any:
+    """
+    Repite `run` mientras queden productos pendientes. Si todavía caben
+    productos en la cuota de hoy (`capacity() > 0`) vuelve a correr de
+    inmediato; si no, `wait(pendientes)` duerme hasta el reinicio de la cuota.
+
+    Termina cuando no queda nada pendiente, cuando `run` devuelve None o
+    cuando una corrida con cuota disponible no reduce los pendientes (errores
+    persistentes), para no girar en vacío.
+    """
+    previous = None
+    while True:
+        result = run()
+        if result is None:
+            return None
+        left = pending(result)
+        if left == 0:
+            return result
+        if capacity() > 0:
+            if previous is not None and left >= previous:
+                logger.info(f"Planificador: {left} productos pendientes sin avance con cuota disponible, se detiene")
+                return result
+        else:
+            wait(left)
+        previous = left
@@ -0,0 +1,132 @@
+"""
+Manejo de la estructura de prompt_api.txt
+Separa el prompt en un prefijo estático (reglas, listas cerradas, formato de
+salida) y un sufijo por producto (bloque de metadatos), y extrae las listas
+de valores cerrados.
+"""
+
+import re
+import hashlib
+from dataclasses import dataclass
+from typing import Dict, List, Tuple
+
+import pandas as pd
+
+from atributos import ATTRIBUTE_NAMES
+
+
+SECTION_SEPARATOR = '\n---\n'
+METADATA_MARKER = '**Descripción del Artículo (Metadatos):**'
+KNOWN_ATTRIBUTES_MARKER = '**Atributos ya determinados (no los extraigas):**'
+RULE_HINTS_MARKER = '**Pistas del nombre (confírmalas con la imagen y corrígelas si no coinciden):**'
+
+# Subir al cambiar la plantilla de metadatos; queda registrada con cada resultado
+METADATA_TEMPLATE_VERSION = 'metadatos-v1'
+
+# Columna del CSV → etiqueta en el prompt (productos.csv y su equivalente en inglés)
+METADATA_FIELDS: Tuple[Tuple[str, str], ...] = (
+    ('nombre', 'Nombre'), ('name', 'Nombre'),
+    ('descripcion', 'Descripción'), ('description', 'Descripción'),
+    ('marca', 'Marca'), ('brand', 'Marca'),
+    ('categoria', 'Categoría'), ('category', 'Categoría'),
+) + tuple((name, name) for name in ATTRIBUTE_NAMES)
+
+_MISSING_TEXT = ('', 'nan', 'none', 'null')
+
+
+@dataclass
+class PromptParts:
+    """Prompt dividido en parte estática y parte por producto"""
+    static_prefix: str
+    product_suffix: str
+
+    @property
+    def full_text(self) -> str:
+        return self.static_prefix + SECTION_SEPARATOR + self.product_suffix
+
+
+def split_prompt(prompt: str) -> PromptParts:
+    """
+    Divide el prompt en secciones `---` y separa el bloque de metadatos.
+
+    Las demás secciones conservan su orden dentro del prefijo estático; el
+    bloque de metadatos pasa al final como sufijo por producto.
+    """
+    sections = prompt.split(SECTION_SEPARATOR)
+
+    static_sections = []
+    metadata_sections = []
+    for section in sections:
+        if section.lstrip().startswith(METADATA_MARKER):
+            metadata_sections.append(section.strip())
+        else:
+            static_sections.append(section.strip())
+
+    return PromptParts(
+        static_prefix=SECTION_SEPARATOR.join(static_sections),
+        product_suffix=SECTION_SEPARATOR.join(metadata_sections)
+    )
+
+
+_CLOSED_LIST_PATTERN = re.compile(r'\*\*([^*\n]+?):\*\*\s*\[\[(.*?)\]\]', re.DOTALL)
+
+
+def parse_closed_lists(prompt: str) -> Dict[str, List[str]]:
+    """
+    Extrae las listas de valores cerrados (`**Atributo:**[[v1, v2, ...]]`).
+
+    Returns:
+        Diccionario atributo → valores permitidos, en el orden del prompt
+    """
+    closed_lists: Dict[str, List[str]] = {}
+    for match in _CLOSED_LIST_PATTERN.finditer(prompt):
+        values = [value.strip() for value in match.group(2).split(',')]
+        closed_lists[match.group(1).strip()] = [value for value in values if value]
+    return closed_lists
+
+
+def render_known_attributes(known: Dict[str, str], missing: List[str]) -> str:
+    """
+    Sección del prompt que indica los atributos que se conservan (reparación
+    parcial) y los únicos que el modelo debe extraer.
+    """
+    known_text = ', '.join(f"{name}: {value}" for name, value in known.items())
+    return (f"{KNOWN_ATTRIBUTES_MARKER} {known_text}\n"
+            f"**Extrae únicamente:** {', '.join(missing)}")
+
+
+def render_rule_hints(hints: Dict[str, str]) -> str:
+    """
+    Sección del prompt con lo que las reglas infieren del nombre. Son pistas:
+    el modelo extrae todos los atributos y su respuesta prevalece.
+    """
+    return f"{RULE_HINTS_MARKER} " + ', '.join(f"{name}: {value}" for name, value in hints.items())
+
+
+@dataclass(frozen=True)
+class MetadataTemplate:
+    """
+    Plantilla del bloque de metadatos por producto.
+
+    Se renderiza en bloque sobre el DataFrame (operaciones de columna, sin
+    formatear cadenas por fila) y omite los campos vacíos o `nan`.
+    """
+    fields: Tuple[Tuple[str, str], ...] = METADATA_FIELDS
+    version: str = METADATA_TEMPLATE_VERSION
+
+    def render(self, df: pd.DataFrame) -> pd.Series:
+        """Bloque de metadatos de cada fila, indexado como `df`."""
+        block = pd.Series('', index=df.index, dtype=object)
+        for column, label in self.fields:
+            if column not in df.columns:
+                continue
+            values = df[column].astype(str).str.strip()
+            present = df[column].notna() & ~values.str.lower().isin(_MISSING_TEXT)
+            line = ('\n' + label + ': ') + values
+            block = block + line.where(present, '')
+        return METADATA_MARKER + block.where(block != '', '\nSin metadatos')
+
+    def prompt_version(self, static_prefix: str) -> str:
+        """Versión trazable: versión de la plantilla + huella del prefijo estático."""
+        fingerprint = hashlib.sha256((static_prefix + repr(self.fields)).encode('utf-8')).hexdigest()[:8]
+        return f"{self.version}-{fingerprint}"
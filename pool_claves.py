@@ -0,0 +1,207 @@
+"""
+Pool de clientes de Gemini con varias API keys (o proyectos)
+Cada clave tiene su propio limitador de ritmo por modelo y su propio estado
+de salud. Cada solicitud va a la clave con más holgura; una clave que
+responde RESOURCE_EXHAUSTED varias veces seguidas se aparta un tiempo y el
+trabajo sigue en las demás. Al final de la corrida se reporta el uso por
+clave.
+"""
+
+import os
+import time
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Mapping, Optional, Tuple
+
+from google import genai
+
+from control_concurrencia import is_quota_error, retry_delay_from_error
+from limitador_compartido import key_fingerprint
+
+
+logger = logging.getLogger(__name__)
+
+# Variables de entorno: varias claves separadas por coma, o una sola
+API_KEYS_ENV = 'GEMINI_API_KEYS'
+API_KEY_ENV = 'GEMINI_API_KEY'
+
+
+def load_api_keys(env: Optional[Mapping[str, str]] = None) -> List[Tuple[str, str]]:
+    """
+    Claves configuradas como (etiqueta, clave).
+
+    `GEMINI_API_KEYS` acepta `clave1,clave2` o `proyecto-a=clave1,proyecto-b=clave2`;
+    sin ella se usa `GEMINI_API_KEY`. Las claves repetidas se ignoran.
+    """
+    env = os.environ if env is None else env
+    entries = [entry.strip() for entry in env.get(API_KEYS_ENV, '').split(',') if entry.strip()]
+    if not entries and env.get(API_KEY_ENV):
+        entries = [env[API_KEY_ENV].strip()]
+
+    keys, seen = [], set()
+    for position, entry in enumerate(entries, 1):
+        label, _, key = entry.rpartition('=')
+        key = key.strip()
+        if not key or key in seen:
+            continue
+        seen.add(key)
+        keys.append((label.strip() or f"clave-{position} (…{key[-4:]})", key))
+    return keys
+
+
+@dataclass
+class KeySlot:
+    """Una API key del pool: cliente, limitadores por modelo y estado de salud"""
+    label: str
+    client: genai.Client
+    fingerprint: str = ''  # Identifica la clave sin exponerla (limitador compartido)
+    rate_limiters: Dict[str, Any] = field(default_factory=dict)  # modelo → TokenBucket
+    in_flight: int = 0
+    waiting: int = 0  # solicitudes esperando turno en el limitador
+    requests: int = 0
+    successes: int = 0
+    quota_errors: int = 0
+    other_errors: int = 0
+    consecutive_quota_errors: int = 0
+    cooldown_until: float = 0.0  # time.monotonic() hasta el que la clave queda apartada
+    times_benched: int = 0
+
+    def headroom(self, model_name: str) -> float:
+        """Fracción del saldo por minuto libre para `model_name`, descontando las que esperan turno."""
+        limiter = self.rate_limiters.get(model_name)
+        if limiter is None:
+            return 1.0
+        return (limiter.available() - self.waiting) / limiter.requests_per_minute
+
+    def describe(self) -> str:
+        """Resumen de uso de la clave."""
+        text = (f"{self.label}: {self.requests} solicitudes, {self.successes} exitosas, "
+                f"{self.quota_errors} de cuota, {self.other_errors} otros errores")
+        if self.times_benched:
+            text += f", apartada {self.times_benched} {'vez' if self.times_benched == 1 else 'veces'}"
+        return text
+
+
+class ClientPool:
+    """
+    Reparte las solicitudes entre varias API keys.
+
+    `acquire` elige la clave sana con más holgura en su limitador y espera su
+    turno; `release` registra el resultado de la llamada. Tras
+    `quota_error_threshold` errores de cuota seguidos la clave se aparta
+    `cooldown_seconds` (o lo que pida el RetryInfo del servidor, si es más).
+    """
+
+    def __init__(
+        self,
+        slots: List[KeySlot],
+        rate_limiter_factory: Optional[Callable[[str, str], Any]] = None,
+        quota_error_threshold: int = 2,
+        cooldown_seconds: float = 60.0
+    ):
+        if not slots:
+            raise ValueError("El pool de clientes necesita al menos una API key")
+        self.slots = slots
+        self.rate_limiter_factory = rate_limiter_factory
+        self.quota_error_threshold = quota_error_threshold
+        self.cooldown_seconds = cooldown_seconds
+
+    @classmethod
+    def from_keys(
+        cls,
+        keys: List[Tuple[str, str]],
+        rate_limiter_factory: Optional[Callable[[str, str], Any]] = None,
+        http_options: Optional[Any] = None,
+        **kwargs
+    ) -> 'ClientPool':
+        """
+        Un cliente por clave de `load_api_keys`; `rate_limiter_factory`
+        recibe (huella de la clave, modelo).
+        """
+        slots = [
+            KeySlot(label, genai.Client(api_key=key, http_options=http_options), key_fingerprint(key))
+            for label, key in keys
+        ]
+        return cls(slots, rate_limiter_factory, **kwargs)
+
+    def __len__(self) -> int:
+        return len(self.slots)
+
+    @property
+    def primary(self) -> genai.Client:
+        """Cliente de la primera clave (Batch API, context caches y otras operaciones de un solo proyecto)."""
+        return self.slots[0].client
+
+    def reset(self):
+        """Empieza una corrida: limitadores nuevos (se crean en el event loop de la corrida) y contadores en cero."""
+        for slot in self.slots:
+            slot.rate_limiters.clear()
+            slot.requests = slot.successes = slot.quota_errors = slot.other_errors = 0
+            slot.consecutive_quota_errors = slot.times_benched = 0
+
+    def _limiter(self, slot: KeySlot, model_name: str) -> Optional[Any]:
+        if self.rate_limiter_factory is not None and model_name not in slot.rate_limiters:
+            slot.rate_limiters[model_name] = self.rate_limiter_factory(slot.fingerprint, model_name)
+        return slot.rate_limiters.get(model_name)
+
+    async def acquire(self, model_name: str, tokens: float = 0) -> KeySlot:
+        """
+        Clave para la siguiente solicitud: la sana con más holgura y menos
+        llamadas en vuelo. Si todas están apartadas espera a la primera que
+        vuelva.
+        """
+        while True:
+            now = time.monotonic()
+            healthy = [slot for slot in self.slots if slot.cooldown_until <= now]
+            if healthy:
+                break
+            wait = min(slot.cooldown_until for slot in self.slots) - now
+            logger.warning(f"Pool de claves: todas apartadas por cuota, esperando {wait:.0f}s")
+            await asyncio.sleep(wait)
+
+        for slot in healthy:
+            self._limiter(slot, model_name)
+        slot = max(healthy, key=lambda slot: (slot.headroom(model_name), -slot.in_flight))
+        slot.in_flight += 1
+        limiter = slot.rate_limiters.get(model_name)
+        if limiter is not None:
+            slot.waiting += 1
+            try:
+                await limiter.acquire(tokens)
+            except BaseException:
+                slot.in_flight -= 1
+                raise
+            finally:
+                slot.waiting -= 1
+        slot.requests += 1
+        return slot
+
+    def release(self, slot: KeySlot, error: Optional[BaseException] = None):
+        """Registra el resultado de una llamada hecha con `slot` (None = éxito)."""
+        slot.in_flight -= 1
+        if isinstance(error, asyncio.CancelledError):
+            return  # Duplicado de cobertura cancelado: no dice nada de la clave
+        if error is None:
+            slot.successes += 1
+            slot.consecutive_quota_errors = 0
+        elif is_quota_error(error):
+            slot.quota_errors += 1
+            slot.consecutive_quota_errors += 1
+            # Con una sola clave no hay a dónde desviar: el AIMD y los reintentos se encargan
+            if len(self.slots) > 1 and slot.consecutive_quota_errors >= self.quota_error_threshold:
+                self._bench(slot, retry_delay_from_error(error))
+        else:
+            slot.other_errors += 1
+
+    def _bench(self, slot: KeySlot, retry_delay: Optional[float]):
+        """Aparta la clave hasta que pase el enfriamiento."""
+        cooldown = max(self.cooldown_seconds, retry_delay or 0.0)
+        slot.cooldown_until = time.monotonic() + cooldown
+        slot.consecutive_quota_errors = 0
+        slot.times_benched += 1
+        logger.warning(f"Pool de claves: {slot.label} apartada {cooldown:.0f}s por errores de cuota")
+
+    def describe(self) -> List[str]:
+        """Una línea de uso por clave."""
+        return [slot.describe() for slot in self.slots]
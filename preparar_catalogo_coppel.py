@@ -9,6 +9,8 @@ from pathlib import Path
 from tqdm import tqdm
 import time
 
+from reglas_atributos import infer_attributes
+
 
 def descargar_imagen(url: str, filename: str, output_dir: Path) -> str:
     """Descarga una imagen desde URL"""
@@ -113,79 +115,8 @@ def preparar_catalogo(
     print("🤖 Infiriendo atributos básicos del nombre...")
 
     for idx, row in df_final.iterrows():
-        nombre = str(row.get('nombre', '')).lower()
-
-        # Género
-        if 'niña' in nombre or 'girl' in nombre:
-            df_final.at[idx, 'Género'] = 'Bebé niña'
-        elif 'niño' in nombre or 'boy' in nombre:
-            df_final.at[idx, 'Género'] = 'Bebé niño'
-        elif 'bebé' in nombre or 'baby' in nombre:
-            df_final.at[idx, 'Género'] = 'Bebé'
-        else:
-            df_final.at[idx, 'Género'] = 'Unisex'
-
-        # Tipo de producto
-        if 'conjunto' in nombre or 'set' in nombre:
-            df_final.at[idx, 'Tipo de producto'] = 'Conjunto'
-            # Número de piezas
-            if '3 piezas' in nombre:
-                df_final.at[idx, 'Número de piezas'] = 3
-            elif '2 piezas' in nombre:
-                df_final.at[idx, 'Número de piezas'] = 2
-        elif 'mameluco' in nombre or 'bodysuit' in nombre:
-            df_final.at[idx, 'Tipo de producto'] = 'Mameluco'
-            df_final.at[idx, 'Número de piezas'] = 1
-        elif 'jumper' in nombre:
-            df_final.at[idx, 'Tipo de producto'] = 'Jumper'
-            df_final.at[idx, 'Número de piezas'] = 1
-        elif 'vestido' in nombre or 'dress' in nombre:
-            df_final.at[idx, 'Tipo de producto'] = 'Vestido'
-            df_final.at[idx, 'Número de piezas'] = 1
-        elif 'pantalón' in nombre or 'pants' in nombre or 'leggings' in nombre or 'mallas' in nombre:
-            df_final.at[idx, 'Tipo de producto'] = 'Pantalón'
-            df_final.at[idx, 'Número de piezas'] = 1
-        elif 'playera' in nombre or 'shirt' in nombre:
-            df_final.at[idx, 'Tipo de producto'] = 'Playera'
-            df_final.at[idx, 'Número de piezas'] = 1
-        elif 'sudadera' in nombre or 'hoodie' in nombre:
-            df_final.at[idx, 'Tipo de producto'] = 'Sudadera'
-            df_final.at[idx, 'Número de piezas'] = 1
-        elif 'babero' in nombre or 'bib' in nombre:
-            df_final.at[idx, 'Tipo de producto'] = 'Babero'
-            df_final.at[idx, 'Número de piezas'] = 1
-        elif 'zapato' in nombre or 'shoe' in nombre:
-            df_final.at[idx, 'Tipo de producto'] = 'Zapatos'
-            df_final.at[idx, 'Número de piezas'] = 1
-
-        # Color
-        colores = {
-            'rosa': 'Rosa',
-            'pink': 'Rosa',
-            'azul': 'Azul',
-            'blue': 'Azul',
-            'negro': 'Negro',
-            'black': 'Negro',
-            'blanco': 'Blanco',
-            'white': 'Blanco',
-            'gris': 'Gris',
-            'gray': 'Gris',
-            'beige': 'Beige',
-            'verde': 'Verde',
-            'green': 'Verde',
-        }
-
-        for color_key, color_value in colores.items():
-            if color_key in nombre:
-                df_final.at[idx, 'Color'] = color_value
-                break
-
-        # Marca
-        marcas = ['nike', 'adidas', 'baby colors', 'baby room', 'baby pop']
-        for marca in marcas:
-            if marca in nombre:
-                df_final.at[idx, 'marca'] = marca.title()
-                break
+        for atributo, valor in infer_attributes(row.get('nombre', '')).items():
+            df_final.at[idx, atributo] = valor
 
     # Seleccionar columnas finales
     columnas_finales = [
@@ -0,0 +1,97 @@
+"""
+Preprocesamiento de imágenes antes de enviarlas a Gemini
+Limita el lado mayor, recorta bordes blancos uniformes y recodifica a
+JPEG/WebP. Las versiones procesadas se guardan junto a las originales
+(en `<directorio de imágenes>/.procesadas/`) para no repetir el trabajo.
+"""
+
+import os
+import logging
+import tempfile
+from pathlib import Path
+from dataclasses import dataclass
+
+from PIL import Image, ImageChops
+
+
+logger = logging.getLogger(__name__)
+
+
+PROCESSED_SUBDIR = '.procesadas'
+
+FORMAT_EXTENSIONS = {
+    'JPEG': '.jpg',
+    'WEBP': '.webp'
+}
+
+
+@dataclass(frozen=True)
+class ImagePreprocessConfig:
+    """Parámetros del preprocesamiento"""
+    max_side: int = 1024
+    crop_borders: bool = True
+    border_tolerance: int = 10  # Diferencia máxima con el blanco para considerar borde
+    image_format: str = 'JPEG'
+    quality: int = 85
+
+    @property
+    def tag(self) -> str:
+        """Identificador de la configuración usado en el nombre del archivo procesado."""
+        crop = '_crop' if self.crop_borders else ''
+        return f"{self.max_side}px_q{self.quality}{crop}"
+
+
+def crop_white_borders(image: Image.Image, tolerance: int = 10) -> Image.Image:
+    """Recorta bordes blancos uniformes (fondo de catálogo)."""
+    rgb = image.convert('RGB')
+    background = Image.new('RGB', rgb.size, (255, 255, 255))
+    diff = ImageChops.difference(rgb, background)
+    # Restar la tolerancia para ignorar blancos casi puros por compresión
+    diff = ImageChops.add(diff, diff, 2.0, -tolerance)
+    bbox = diff.getbbox()
+    if bbox is None:
+        return image
+    return image.crop(bbox)
+
+
+def processed_path(image_path: Path, settings: ImagePreprocessConfig) -> Path:
+    """Ruta de la versión procesada de una imagen."""
+    extension = FORMAT_EXTENSIONS[settings.image_format.upper()]
+    return image_path.parent / PROCESSED_SUBDIR / f"{image_path.stem}_{settings.tag}{extension}"
+
+
+def preprocess_image(image_path: Path, settings: ImagePreprocessConfig) -> Path:
+    """
+    Devuelve la ruta de la imagen procesada, generándola si no existe o si la
+    original es más reciente.
+    """
+    output_path = processed_path(image_path, settings)
+    if output_path.exists() and output_path.stat().st_mtime >= image_path.stat().st_mtime:
+        return output_path
+
+    with Image.open(image_path) as image:
+        image = image.convert('RGB')
+
+        if settings.crop_borders:
+            image = crop_white_borders(image, settings.border_tolerance)
+
+        if max(image.size) > settings.max_side:
+            image.thumbnail((settings.max_side, settings.max_side), Image.LANCZOS)
+
+        # Escribir a un temporal y reemplazar: otros hilos o procesos que pasen el
+        # chequeo de existencia nunca leen un archivo a medio escribir
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        handle, tmp_name = tempfile.mkstemp(dir=output_path.parent, prefix=f".{output_path.name}.", suffix='.tmp')
+        try:
+            with os.fdopen(handle, 'wb') as tmp:
+                image.save(tmp, format=settings.image_format.upper(), quality=settings.quality)
+            os.replace(tmp_name, output_path)
+        except BaseException:
+            os.unlink(tmp_name)
+            raise
+
+    logger.debug(
+        f"Imagen procesada: {image_path.name} ({image_path.stat().st_size} B) → "
+        f"{output_path.name} ({output_path.stat().st_size} B)"
+    )
+    return output_path
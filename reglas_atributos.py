@@ -0,0 +1,139 @@
+"""
+Motor de reglas por palabras clave para inferir atributos desde el nombre
+Las reglas viven en tablas (atributo → palabras clave → valor) en lugar de
+cadenas de if/elif, para que las use tanto preparar_catalogo_coppel.py como
+el extractor, que se las pasa a Gemini como pistas que puede corregir.
+Las palabras clave coinciden como palabras completas ("set" no coincide
+con "closet", ni "niño" con "niños").
+"""
+
+import re
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+from atributos import ATTRIBUTE_NAMES, format_attributes, is_missing, parse_attributes
+from validacion import _contains_word
+
+
+@dataclass(frozen=True)
+class Rule:
+    """Si el texto contiene alguna palabra clave (palabra completa), el atributo toma `value`"""
+    keywords: Tuple[str, ...]
+    value: Any
+    extra: Dict[str, Any] = field(default_factory=dict)  # Atributos que la regla también fija
+
+
+@dataclass(frozen=True)
+class RuleGroup:
+    """Reglas de un atributo; gana la primera que coincide"""
+    attribute: str
+    rules: Tuple[Rule, ...]
+    default: Optional[Any] = None  # Valor supuesto si ninguna regla coincide
+    only_if: Optional[Tuple[str, Tuple[Any, ...]]] = None  # (atributo, valores) ya inferidos que habilitan el grupo
+    consume: bool = False  # Quitar la palabra clave del texto para los grupos siguientes
+
+
+# El orden importa: la marca va primero y se quita del texto ("Baby Colors"
+# no indica el género), y "N piezas" solo se lee en conjuntos y sets, como
+# hacía preparar_catalogo antes de las tablas.
+RULE_GROUPS: Tuple[RuleGroup, ...] = (
+    RuleGroup('marca', tuple(
+        Rule((brand,), brand.title()) for brand in ('nike', 'adidas', 'baby colors', 'baby room', 'baby pop')
+    ), consume=True),
+    RuleGroup('Género', (
+        Rule(('niña', 'girl'), 'Bebé niña'),
+        Rule(('niño', 'boy'), 'Bebé niño'),
+        Rule(('bebé', 'baby'), 'Bebé'),
+    ), default='Unisex'),
+    RuleGroup('Tipo de producto', (
+        Rule(('conjunto',), 'Conjunto'),
+        Rule(('set',), 'Set'),
+        Rule(('mameluco', 'bodysuit'), 'Mameluco', {'Número de piezas': 1}),
+        Rule(('jumper',), 'Jumper', {'Número de piezas': 1}),
+        Rule(('vestido', 'dress'), 'Vestido', {'Número de piezas': 1}),
+        Rule(('pantalón', 'pants', 'leggings', 'mallas'), 'Pantalón', {'Número de piezas': 1}),
+        Rule(('playera', 'shirt'), 'Playera', {'Número de piezas': 1}),
+        Rule(('sudadera', 'hoodie'), 'Sudadera', {'Número de piezas': 1}),
+        Rule(('babero', 'bib'), 'Babero', {'Número de piezas': 1}),
+        Rule(('zapato', 'shoe'), 'Zapatos', {'Número de piezas': 1}),
+    )),
+    RuleGroup('Número de piezas', (
+        Rule(('3 piezas',), 3),
+        Rule(('2 piezas',), 2),
+    ), only_if=('Tipo de producto', ('Conjunto', 'Set'))),
+    RuleGroup('Color', (
+        Rule(('rosa', 'pink'), 'Rosa'),
+        Rule(('azul', 'blue'), 'Azul'),
+        Rule(('negro', 'black'), 'Negro'),
+        Rule(('blanco', 'white'), 'Blanco'),
+        Rule(('gris', 'gray'), 'Gris'),
+        Rule(('beige',), 'Beige'),
+        Rule(('verde', 'green'), 'Verde'),
+    )),
+)
+
+
+def infer_attributes(
+    text: str,
+    groups: Tuple[RuleGroup, ...] = RULE_GROUPS,
+    include_defaults: bool = True
+) -> Dict[str, Any]:
+    """
+    Aplica las tablas de reglas a un texto (normalmente el nombre del producto).
+
+    Args:
+        include_defaults: Incluir los valores supuestos de los grupos sin
+            coincidencia (p. ej. Género = Unisex). El extractor los omite
+            porque no son atributos realmente determinados.
+
+    Returns:
+        Atributos inferidos
+    """
+    text = str(text).lower()
+    inferred: Dict[str, Any] = {}
+
+    for group in groups:
+        if group.only_if is not None and inferred.get(group.only_if[0]) not in group.only_if[1]:
+            continue
+        match = next(
+            ((rule, keyword) for rule in group.rules for keyword in rule.keywords if _contains_word(text, keyword)),
+            None
+        )
+        if match is not None:
+            rule, keyword = match
+            inferred.setdefault(group.attribute, rule.value)
+            for attribute, value in rule.extra.items():
+                inferred.setdefault(attribute, value)
+            if group.consume:
+                text = re.sub(r'(?<!\w)' + re.escape(keyword) + r'(?!\w)', ' ', text)
+        elif include_defaults and group.default is not None:
+            inferred.setdefault(group.attribute, group.default)
+
+    return inferred
+
+
+def known_attributes(text: str, groups: Tuple[RuleGroup, ...] = RULE_GROUPS) -> Dict[str, str]:
+    """Atributos del prompt que las reglas infieren sin suposiciones, como texto (pistas para el modelo)."""
+    return {
+        attribute: str(value)
+        for attribute, value in infer_attributes(text, groups, include_defaults=False).items()
+        if attribute in ATTRIBUTE_NAMES and not is_missing(value)
+    }
+
+
+def missing_attributes(known: Dict[str, str]) -> List[str]:
+    """Atributos que aún hay que pedirle al modelo, en el orden de salida."""
+    return [name for name in ATTRIBUTE_NAMES if name not in known]
+
+
+def merge_known_attributes(
+    attributes: str,
+    record: Optional[Dict[str, str]],
+    known: Dict[str, str]
+) -> Tuple[str, Optional[Dict[str, str]]]:
+    """Completa la respuesta del modelo con los atributos que se conservan (reparación parcial)."""
+    if not known or attributes.startswith('ERROR'):
+        return attributes, record
+    record = dict(record if record is not None else parse_attributes(attributes))
+    record.update(known)
+    return format_attributes(record), record
@@ -0,0 +1,78 @@
+"""
+Reparación parcial: volver a pedir solo los atributos que fallaron
+En lugar de re-extraer el producto completo, cada fila con atributos
+inválidos, obligatorios faltantes o que contradicen los metadatos recibe un
+prompt corto que pide únicamente esos atributos; el resto del registro se
+conserva y la respuesta se fusiona sobre él. Las filas se agrupan por el
+conjunto de atributos a reparar para que compartan esquema y paquete.
+"""
+
+from collections import Counter
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import pandas as pd
+
+from atributos import ATTRIBUTE_NAMES, MISSING_VALUE, is_missing
+from matriz_atributos import parse_attribute_column
+from validacion import failing_attributes
+
+
+@dataclass(frozen=True)
+class RepairTarget:
+    """Fila a reparar: atributos conservados y atributos a volver a pedir"""
+    index: Any
+    known: Dict[str, str]  # Los 22 atributos menos los que fallaron (`nan` incluido)
+    failing: Tuple[str, ...]
+
+    @property
+    def visible_known(self) -> Dict[str, str]:
+        """Atributos conservados con valor, para mostrarlos en el prompt."""
+        return {name: value for name, value in self.known.items() if not is_missing(value)}
+
+
+def find_repair_targets(
+    df: pd.DataFrame,
+    attributes_column: str,
+    closed_lists: Dict[str, List[str]],
+    flagged: Optional[Dict[Any, List[str]]] = None,
+    validate: bool = True
+) -> Dict[Any, RepairTarget]:
+    """
+    Filas con un registro válido en formato pero con atributos que reparar.
+
+    Args:
+        flagged: Índice → atributos que el normalizador no pudo reparar
+            (ya quedaron como `nan` en el registro)
+        validate: Revisar también listas cerradas, obligatorios y metadatos;
+            con False solo se reparan las filas de `flagged`
+
+    Returns:
+        Índice → objetivo de reparación
+    """
+    flagged = flagged or {}
+    text = df[attributes_column].fillna('').astype(str).str.strip()
+    candidates = (text.str.len() > 0) & ~text.str.startswith('ERROR')
+    if not validate:
+        candidates &= df.index.isin(list(flagged))
+
+    records = parse_attribute_column(text[candidates])
+    targets = {}
+    for index, row in records.iterrows():
+        record = {name: value for name, value in row.items() if not pd.isna(value)}
+        failing = set(flagged.get(index, []))
+        if validate:
+            failing.update(failing_attributes(record, df.loc[index].to_dict(), closed_lists))
+        if not failing:
+            continue
+        targets[index] = RepairTarget(
+            index=index,
+            known={name: record.get(name, MISSING_VALUE) for name in ATTRIBUTE_NAMES if name not in failing},
+            failing=tuple(name for name in ATTRIBUTE_NAMES if name in failing)
+        )
+    return targets
+
+
+def repair_groups(targets: Iterable[RepairTarget]) -> Counter:
+    """Número de filas por conjunto de atributos a reparar."""
+    return Counter(target.failing for target in targets)
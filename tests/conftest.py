@@ -0,0 +1,17 @@
+"""Fixtures compartidas de las pruebas"""
+
+import os
+
+import pytest
+
+
+@pytest.fixture(scope='session')
+def extractor(tmp_path_factory):
+    """Módulo `extraer_atributos` importado desde un directorio temporal (su log queda ahí, no en el repo)."""
+    cwd = os.getcwd()
+    os.chdir(tmp_path_factory.mktemp('extractor'))
+    try:
+        import extraer_atributos
+    finally:
+        os.chdir(cwd)
+    return extraer_atributos
@@ -0,0 +1,197 @@
+"""
+Cliente falso de Gemini para las pruebas
+Imita `client.aio.models.generate_content` con un registro fijo (JSON o
+texto según la configuración) y `usage_metadata`, sin red ni API key.
+Cuenta las llamadas y puede demorar algunas para ejercitar la cobertura
+(hedging). `FakeBatchClient` imita los endpoints `files`/`batches` de la
+Batch API.
+"""
+
+import re
+import json
+import asyncio
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional
+
+import pandas as pd
+from PIL import Image
+
+
+RECORD = {'Género': 'Unisex', 'Tipo de producto': 'Conjunto', 'Color': 'Rosa'}
+USAGE = {'prompt_token_count': 1000, 'candidates_token_count': 60, 'thoughts_token_count': 40,
+         'cached_content_token_count': 0}
+
+
+PACKED_ID = re.compile(r'^### Producto id=(\S+)', re.MULTILINE)
+
+
+def _texts(contents) -> List[str]:
+    return [part.text for part in contents if getattr(part, 'text', None)]
+
+
+class FakeModels:
+    """
+    Responde como lo haría el modelo según la configuración recibida: registro
+    JSON si se pidió `application/json`, texto `atributo: valor` si no, y un
+    arreglo con un objeto por id si el contenido es un paquete.
+    """
+
+    def __init__(self, record: Dict[str, str], delays: Optional[List[float]] = None):
+        self.record = record
+        self.delays = list(delays or [])
+        self.calls = 0
+        self.configs: List[Any] = []
+
+    def reply(self, contents, config=None) -> str:
+        as_json = config is not None and config.response_mime_type == 'application/json'
+        text = ', '.join(f"{name}: {value}" for name, value in self.record.items())
+        packed_ids = [match for part in _texts(contents) for match in PACKED_ID.findall(part)]
+        if packed_ids:
+            attributes = self.record if as_json else text
+            return json.dumps([{'id': pid, 'atributos': attributes} for pid in packed_ids], ensure_ascii=False)
+        return json.dumps(self.record, ensure_ascii=False) if as_json else text
+
+    async def generate_content(self, model, contents, config=None):
+        self.calls += 1
+        self.configs.append(config)
+        if self.delays:
+            await asyncio.sleep(self.delays.pop(0))
+        return SimpleNamespace(
+            text=self.reply(contents, config),
+            usage_metadata=SimpleNamespace(**USAGE)
+        )
+
+
+class FakeCaches:
+    """Context caches en memoria: registra los creados y los eliminados"""
+
+    def __init__(self):
+        self.created: List[str] = []
+        self.deleted: List[str] = []
+
+    def create(self, model, config):
+        self.created.append(config.display_name)
+        return SimpleNamespace(name=f"cachedContents/{config.display_name}")
+
+    def delete(self, name):
+        self.deleted.append(name)
+
+
+class FakeGeminiClient:
+    """Cliente con la forma de `genai.Client` que solo atiende generate_content asíncrono"""
+
+    def __init__(self, record: Optional[Dict[str, str]] = None, delays: Optional[List[float]] = None):
+        self.aio = SimpleNamespace(models=FakeModels(record or RECORD, delays))
+        self.caches = FakeCaches()
+
+    @property
+    def calls(self) -> int:
+        return self.aio.models.calls
+
+
+class FakeFiles:
+    """Files API en memoria: cuenta las subidas y sirve el archivo de resultados del job"""
+
+    def __init__(self):
+        self.uploads: List[str] = []
+        self.contents: Dict[str, bytes] = {}
+
+    def upload(self, file, config=None):
+        name = f"files/{len(self.uploads)}"
+        self.uploads.append(str(file))
+        self.contents[name] = Path(file).read_bytes()
+        return SimpleNamespace(name=name, uri=f"https://falso/{name}", mime_type=getattr(config, 'mime_type', None))
+
+    def download(self, file):
+        return self.contents[file]
+
+
+class FakeBatches:
+    """
+    Endpoints de batch: el job recorre `states` (uno por consulta) y al
+    llegar a un estado exitoso escribe una línea de resultado por `key`
+    del JSONL enviado; las llaves de `failing` reciben un `error`.
+    """
+
+    def __init__(self, files: FakeFiles, states: List[str], record: Dict[str, str], failing=()):
+        self.files = files
+        self.states = list(states)
+        self.record = record
+        self.failing = set(failing)
+        self.polls = 0
+        self.created: List[Any] = []
+
+    def create(self, model, src, config=None):
+        self.created.append(SimpleNamespace(model=model, src=src, config=config))
+        return SimpleNamespace(name='batches/1', state='JOB_STATE_PENDING')
+
+    def _results(self, src: str) -> bytes:
+        lines = []
+        for line in self.files.contents[src].decode('utf-8').splitlines():
+            key = json.loads(line)['key']
+            if key in self.failing:
+                lines.append({'key': key, 'error': {'code': 500, 'message': 'interno'}})
+                continue
+            text = ', '.join(f"{name}: {value}" for name, value in self.record.items())
+            lines.append({'key': key, 'response': {
+                'candidates': [{'content': {'parts': [{'text': text}]}}],
+                'usageMetadata': {'promptTokenCount': USAGE['prompt_token_count'],
+                                  'candidatesTokenCount': USAGE['candidates_token_count']},
+            }})
+        return '\n'.join(json.dumps(line, ensure_ascii=False) for line in lines).encode('utf-8')
+
+    def get(self, name):
+        state = self.states[min(self.polls, len(self.states) - 1)]
+        self.polls += 1
+        dest = None
+        if state in ('JOB_STATE_SUCCEEDED', 'JOB_STATE_PARTIALLY_SUCCEEDED') and self.created:
+            self.files.contents['files/resultados'] = self._results(self.created[-1].src)
+            dest = SimpleNamespace(file_name='files/resultados')
+        error = 'falló el job' if state == 'JOB_STATE_FAILED' else None
+        return SimpleNamespace(name=name, state=state, dest=dest, error=error)
+
+
+class FakeBatchClient:
+    """Cliente con solo `files` y `batches`, como un servidor local que imita la Batch API"""
+
+    def __init__(self, states=('JOB_STATE_PENDING', 'JOB_STATE_RUNNING', 'JOB_STATE_SUCCEEDED'),
+                 record: Optional[Dict[str, str]] = None, failing=()):
+        self.files = FakeFiles()
+        self.batches = FakeBatches(self.files, list(states), record or RECORD, failing)
+
+
+def make_catalog(directory: Path, rows: int) -> Path:
+    """CSV de productos con una imagen pequeña por fila; devuelve la ruta del CSV."""
+    images = directory / 'images'
+    images.mkdir(parents=True, exist_ok=True)
+    products = []
+    for number in range(rows):
+        image = f"P{number}.jpg"
+        Image.new('RGB', (32, 32), (200, 30, 30)).save(images / image)
+        products.append({'id': f"P{number}", 'image': image, 'nombre': f"Conjunto {number}", 'categoria': 'Bebé'})
+    csv = directory / 'productos.csv'
+    pd.DataFrame(products).to_csv(csv, index=False)
+    return csv
+
+
+def extractor_config(extractor, directory: Path):
+    """Config del extractor sin red, cachés ni archivos fuera de `directory`."""
+    config = extractor.Config()
+    config.INPUT_CSV = directory / 'productos.csv'
+    config.OUTPUT_CSV = directory / 'productos_con_atributos.csv'
+    config.JOURNAL_FILE = directory / 'productos_con_atributos.jsonl'
+    config.IMAGE_DIRECTORY = directory / 'images'
+    config.PROMPT_FILE = Path(__file__).resolve().parent.parent / 'prompt_api.txt'
+    config.WORK_QUEUE_FILE = directory / 'cola_trabajo.sqlite'
+    config.QUOTA_STATE_FILE = directory / 'cuota_diaria.json'
+    config.USAGE_LOG = directory / 'uso_tokens.jsonl'
+    config.BATCH_REQUESTS_FILE = directory / 'batch_requests.jsonl'
+    config.MATRIX_PARQUET = None
+    config.REQUESTS_PER_MINUTE = 100_000
+    config.SHARED_RATE_LIMIT = False
+    config.PREFLIGHT_COUNT_TOKENS = False
+    config.CACHE_ENABLED = False
+    config.CONTEXT_CACHE_ENABLED = False
+    config.IMAGE_PREPROCESS = None
+    return config
@@ -0,0 +1,125 @@
+"""Pruebas del modo batch contra un sustituto local de los endpoints files/batches"""
+
+import json
+from types import SimpleNamespace
+
+import pandas as pd
+import pytest
+from PIL import Image
+
+import batch_gemini
+from batch_gemini import build_batch_requests, download_batch_results, submit_batch, wait_for_batch
+from gemini_falso import FakeBatchClient, extractor_config, make_catalog
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    """Esperas del sondeo sin dormir: el reloj avanza lo que se habría esperado."""
+    waited = []
+    monkeypatch.setattr(batch_gemini, 'time', SimpleNamespace(sleep=waited.append, time=lambda: sum(waited)))
+    return waited
+
+
+def test_requests_reuse_uploads_of_the_same_image(tmp_path):
+    client = FakeBatchClient()
+    shared, other = tmp_path / 'a.jpg', tmp_path / 'b.png'
+    Image.new('RGB', (8, 8)).save(shared)
+    Image.new('RGB', (8, 8)).save(other)
+    output = tmp_path / 'requests.jsonl'
+
+    written = build_batch_requests(
+        client, [('P1', shared), ('P2', shared), ('P3', other)], 'prompt general', output,
+        prompts={'P3': 'prompt propio'}
+    )
+
+    assert written == 3
+    assert client.files.uploads == [str(shared), str(other)]
+    lines = [json.loads(line) for line in output.read_text(encoding='utf-8').splitlines()]
+    assert [line['key'] for line in lines] == ['P1', 'P2', 'P3']
+    parts = [line['request']['contents'][0]['parts'] for line in lines]
+    assert parts[0][0]['file_data'] == parts[1][0]['file_data'] == {
+        'file_uri': 'https://falso/files/0', 'mime_type': 'image/jpeg'
+    }
+    assert parts[2][0]['file_data']['mime_type'] == 'image/png'
+    assert [part[1]['text'] for part in parts] == ['prompt general', 'prompt general', 'prompt propio']
+
+
+def test_wait_backs_off_until_a_terminal_state(sleeps):
+    client = FakeBatchClient(states=['JOB_STATE_PENDING'] * 4 + ['JOB_STATE_SUCCEEDED'])
+
+    job = wait_for_batch(client, 'batches/1', initial_delay=1, max_delay=4)
+
+    assert job.state == 'JOB_STATE_SUCCEEDED'
+    assert sleeps == [1, 2, 4, 4]
+
+
+def test_wait_gives_up_after_timeout(sleeps):
+    client = FakeBatchClient(states=['JOB_STATE_RUNNING'])
+
+    with pytest.raises(TimeoutError):
+        wait_for_batch(client, 'batches/1', initial_delay=10, max_delay=10, timeout=25)
+    assert sleeps == [10, 10]
+
+
+def test_results_are_ingested_by_key_with_per_line_errors(tmp_path, sleeps):
+    client = FakeBatchClient(failing={'P2'})
+    requests = tmp_path / 'requests.jsonl'
+    requests.write_text('\n'.join(json.dumps({'key': key}) for key in ('P1', 'P2')), encoding='utf-8')
+
+    job = submit_batch(client, 'gemini-2.5-flash', requests, 'prueba')
+    results = download_batch_results(client, wait_for_batch(client, job.name, initial_delay=1))
+
+    assert client.batches.created[0].src == 'files/0'
+    assert results['P1'][0].startswith('Género: Unisex')
+    assert results['P2'][0].startswith('ERROR_API_FATAL')
+
+
+def test_failed_job_has_no_results(sleeps):
+    client = FakeBatchClient(states=['JOB_STATE_RUNNING', 'JOB_STATE_FAILED'])
+
+    job = wait_for_batch(client, 'batches/1', initial_delay=1)
+
+    with pytest.raises(RuntimeError, match='JOB_STATE_FAILED'):
+        download_batch_results(client, job)
+
+
+def _batch_config(extractor, directory):
+    make_catalog(directory, 4)
+    config = extractor_config(extractor, directory)
+    config.BATCH_POLL_INITIAL_DELAY = 1
+    return config
+
+
+def _run_batch(extractor, config, client, job_name=None):
+    return extractor.run_batch_extraction(
+        config, client, config.INPUT_CSV, config.OUTPUT_CSV, config.PROMPT_FILE, config.IMAGE_DIRECTORY,
+        job_name=job_name
+    )
+
+
+def test_run_batch_extraction_journals_every_row(extractor, tmp_path, sleeps):
+    config = _batch_config(extractor, tmp_path)
+    client = FakeBatchClient(failing={'P2'})
+
+    df = _run_batch(extractor, config, client)
+
+    attributes = df.set_index('id')[config.ATTRIBUTES_COLUMN]
+    assert attributes['P2'].startswith('ERROR_API_FATAL')
+    assert attributes.drop('P2').str.contains('Tipo de producto: Conjunto').all()
+    records = [json.loads(line) for line in config.JOURNAL_FILE.read_text(encoding='utf-8').splitlines()]
+    assert sorted(record['id'] for record in records) == ['P0', 'P1', 'P2', 'P3']
+    assert all(record['batch_job'] == 'batches/1' and record['usage']['calls'] == 1 for record in records)
+    assert pd.read_csv(config.OUTPUT_CSV)[config.ATTRIBUTES_COLUMN].notna().all()
+
+    # Solo la fila con error transitorio vuelve al siguiente envío
+    retry = FakeBatchClient()
+    _run_batch(extractor, config, retry)
+    sent = retry.files.contents[retry.batches.created[0].src].decode('utf-8').splitlines()
+    assert [json.loads(line)['key'] for line in sent] == ['P2']
+
+
+def test_failed_job_leaves_rows_pending(extractor, tmp_path, sleeps):
+    config = _batch_config(extractor, tmp_path)
+
+    assert _run_batch(extractor, config, FakeBatchClient(states=['JOB_STATE_FAILED'])) is None
+    assert not config.JOURNAL_FILE.exists() or config.JOURNAL_FILE.read_text(encoding='utf-8') == ''
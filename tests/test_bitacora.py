@@ -0,0 +1,60 @@
+"""Pruebas de la bitácora: los registros se ubican por id del producto"""
+
+import pandas as pd
+
+from bitacora import ResultJournal, apply_journal, flagged_rows
+
+
+def _journal(tmp_path, records):
+    journal = ResultJournal(tmp_path / 'bitacora.jsonl', fsync=False)
+    with journal:
+        for index, product_id, attributes, extra in records:
+            journal.append(index, product_id, attributes, **extra)
+    return journal
+
+
+def _frame(ids):
+    df = pd.DataFrame({'id': ids, 'atributos': [''] * len(ids)})
+    return df, df['id'].astype(str)
+
+
+def test_applies_by_index_when_csv_is_unchanged(tmp_path):
+    journal = _journal(tmp_path, [(0, 'A', 'color: Rosa', {}), (1, 'B', 'color: Azul', {})])
+    df, ids = _frame(['A', 'B'])
+
+    assert apply_journal(df, journal, 'atributos', ids) == 2
+    assert df['atributos'].tolist() == ['color: Rosa', 'color: Azul']
+
+
+def test_relocates_records_when_csv_is_reordered(tmp_path):
+    journal = _journal(tmp_path, [(0, 'A', 'color: Rosa', {}), (1, 'B', 'color: Azul', {})])
+    df, ids = _frame(['NUEVO', 'B', 'A'])
+
+    assert apply_journal(df, journal, 'atributos', ids) == 2
+    assert df['atributos'].tolist() == ['', 'color: Azul', 'color: Rosa']
+
+
+def test_skips_missing_or_ambiguous_ids(tmp_path):
+    journal = _journal(tmp_path, [(0, 'A', 'color: Rosa', {}), (1, 'B', 'color: Azul', {})])
+    df, ids = _frame(['B', 'C', 'B'])
+
+    assert apply_journal(df, journal, 'atributos', ids) == 0
+    assert df['atributos'].tolist() == ['', '', '']
+
+
+def test_latest_record_wins_across_indices(tmp_path):
+    journal = _journal(tmp_path, [
+        (0, 'A', 'ERROR_API_FATAL: 503', {}),
+        (3, 'A', 'color: Rosa', {}),
+    ])
+    df, ids = _frame(['B', 'A'])
+
+    apply_journal(df, journal, 'atributos', ids)
+    assert df.at[1, 'atributos'] == 'color: Rosa'
+
+
+def test_flagged_rows_follow_product_id(tmp_path):
+    journal = _journal(tmp_path, [(0, 'A', 'color: nan', {'invalid': ['color']})])
+    _, ids = _frame(['B', 'A'])
+
+    assert flagged_rows(journal, ids) == {1: ['color']}
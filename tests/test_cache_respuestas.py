@@ -0,0 +1,65 @@
+"""Pruebas de la caché de respuestas del motor"""
+
+import asyncio
+
+from PIL import Image
+
+from cache_respuestas import ResponseCache
+from esquema_respuesta import build_response_schema
+from gemini_falso import FakeGeminiClient, FakeModels
+from motor_async import AsyncExtractionEngine, ExtractionJob
+
+
+class TruncatedModels(FakeModels):
+    """Responde un JSON cortado, como cuando se agota el tope de salida"""
+
+    def reply(self, contents, config=None) -> str:
+        return super().reply(contents, config)[:20]
+
+
+def _engine(tmp_path, client):
+    return AsyncExtractionEngine(
+        client=client,
+        model_name='gemini-2.5-flash',
+        cache=ResponseCache(tmp_path / 'cache.sqlite'),
+        response_schema=build_response_schema({'Color': ['Rosa', 'Azul']})
+    )
+
+
+def _job(tmp_path, **kwargs):
+    image = tmp_path / 'A.jpg'
+    Image.new('RGB', (16, 16), (200, 30, 30)).save(image)
+    return ExtractionJob(index=0, product_id='A', image_path=image, prompt='Producto A', **kwargs)
+
+
+def test_identical_request_is_served_from_cache(tmp_path):
+    client = FakeGeminiClient()
+    engine = _engine(tmp_path, client)
+
+    first = asyncio.run(engine.process_job(_job(tmp_path)))
+    second = asyncio.run(engine.process_job(_job(tmp_path)))
+
+    assert first == second
+    assert client.calls == 1
+
+
+def test_reextraction_skips_the_cached_answer(tmp_path):
+    client = FakeGeminiClient()
+    engine = _engine(tmp_path, client)
+
+    asyncio.run(engine.process_job(_job(tmp_path)))
+    asyncio.run(engine.process_job(_job(tmp_path, refresh=True)))
+
+    assert client.calls == 2
+
+
+def test_unparseable_answer_is_not_cached(tmp_path):
+    client = FakeGeminiClient()
+    client.aio.models = TruncatedModels(client.aio.models.record)
+    engine = _engine(tmp_path, client)
+
+    asyncio.run(engine.process_job(_job(tmp_path)))
+    asyncio.run(engine.process_job(_job(tmp_path)))
+
+    assert client.calls == 2
+    assert engine.cache.total_bytes() == 0
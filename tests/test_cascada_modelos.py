@@ -0,0 +1,98 @@
+"""Pruebas de la cascada de modelos: motivos de escalamiento, estadísticas y el bucle de niveles"""
+
+import re
+from collections import Counter
+
+import pytest
+
+from bitacora import ResultJournal
+from cascada_modelos import TierStats, escalation_reasons
+from cola_trabajo import DONE, WorkQueue
+from gemini_falso import RECORD, FakeGeminiClient, FakeModels, extractor_config, make_catalog
+
+
+CLOSED_LISTS = {'Tipo de producto': ['Conjunto', 'Pijama'], 'Género': ['Niña', 'Niño', 'Unisex']}
+
+
+def test_escalation_reasons():
+    metadata = {'nombre': 'Conjunto 1'}
+    valid = {'Género': 'Unisex', 'Tipo de producto': 'Conjunto'}
+
+    assert escalation_reasons('', valid, metadata, CLOSED_LISTS) == []
+    assert escalation_reasons('', {'Género': 'Unisex'}, metadata, CLOSED_LISTS) \
+        == ['Tipo de producto: falta atributo obligatorio']
+    assert escalation_reasons('', valid, metadata, CLOSED_LISTS, invalid={'Color': 'Fucsia neón'}) \
+        == ["Color: 'Fucsia neón' fuera de la lista cerrada"]
+    # Otro modelo no arregla una imagen faltante o un bloqueo; sí un error de API o de JSON
+    assert escalation_reasons('ERROR_SIN_IMAGEN', None, metadata, CLOSED_LISTS) == []
+    assert escalation_reasons('ERROR_PERMANENTE_SEGURIDAD: bloqueada', None, metadata, CLOSED_LISTS) == []
+    assert escalation_reasons('ERROR_JSON: respuesta truncada', None, metadata, CLOSED_LISTS) \
+        == ['ERROR_JSON: respuesta truncada']
+
+
+def test_tier_stats_cost_and_latency():
+    stats = TierStats('gemini-2.5-flash-lite', rows=10, input_tokens=1_000_000, output_tokens=500_000,
+                      latencies=[1.0, 3.0])
+
+    assert stats.mean_latency == 2.0
+    assert stats.cost == pytest.approx(0.10 + 0.20)
+    assert TierStats('modelo-sin-precio').cost is None
+    assert 'costo desconocido' in TierStats('modelo-sin-precio').describe()
+
+
+class TieredModels(FakeModels):
+    """El modelo pequeño omite el tipo de producto de las filas indicadas; el grande responde completo"""
+
+    def __init__(self, small_model, weak_names):
+        super().__init__(RECORD)
+        self.small_model = small_model
+        self.weak_names = set(weak_names)
+        self.calls_by_model = Counter()
+
+    def reply(self, contents, config=None):
+        text = super().reply(contents, config)
+        names = {name for part in contents for name in re.findall(r'Nombre: (.+)', getattr(part, 'text', None) or '')}
+        if self.model == self.small_model and names & self.weak_names:
+            text = text.replace('Tipo de producto: Conjunto, ', '')
+        return text
+
+    async def generate_content(self, model, contents, config=None):
+        self.model = model
+        self.calls_by_model[model] += 1
+        return await super().generate_content(model, contents, config)
+
+
+def test_row_failing_validation_escalates_once_to_the_large_model(extractor, tmp_path, monkeypatch):
+    make_catalog(tmp_path, 4)
+    config = extractor_config(extractor, tmp_path)
+    config.CASCADE_ENABLED = True
+    config.STRUCTURED_OUTPUT = False
+    config.WORK_QUEUE_ENABLED = True
+    client = FakeGeminiClient()
+    client.aio.models = TieredModels(config.CASCADE_FIRST_MODEL, ['Conjunto 1'])
+
+    completed = Counter()
+    complete = WorkQueue.complete
+
+    def counting_complete(queue, product_id, attributes):
+        completed[product_id] += 1
+        complete(queue, product_id, attributes)
+
+    monkeypatch.setattr(WorkQueue, 'complete', counting_complete)
+
+    df = extractor.run_extraction(
+        config, client, config.INPUT_CSV, config.OUTPUT_CSV, config.PROMPT_FILE, config.IMAGE_DIRECTORY
+    )
+
+    assert client.aio.models.calls_by_model == {config.CASCADE_FIRST_MODEL: 4, config.GEMINI_MODEL: 1}
+    assert df[config.ATTRIBUTES_COLUMN].str.contains('Tipo de producto: Conjunto').all()
+
+    # Un solo registro y una sola liberación de la asignación por fila, también la escalada
+    records = list(ResultJournal(config.JOURNAL_FILE).iter_records())
+    assert Counter(record['id'] for record in records) == {f"P{n}": 1 for n in range(4)}
+    assert {record['id']: record['model'] for record in records}['P1'] == config.GEMINI_MODEL
+    assert {record['model'] for record in records if record['id'] != 'P1'} == {config.CASCADE_FIRST_MODEL}
+    assert completed == {f"P{n}": 1 for n in range(4)}
+    queue = WorkQueue(config.WORK_QUEUE_FILE)
+    assert queue.counts()[DONE] == 4
+    queue.close()
@@ -0,0 +1,114 @@
+"""Pruebas de la política de cobertura (hedging) contra la latencia de cola"""
+
+import asyncio
+
+from cobertura_solicitudes import HedgePolicy, percentile
+from gemini_falso import FakeModels, RECORD
+
+
+class TrackedModels(FakeModels):
+    """FakeModels que registra qué llamadas terminaron y cuáles se cancelaron"""
+
+    def __init__(self, delays):
+        super().__init__(RECORD, delays)
+        self.finished = []
+        self.cancelled = []
+
+    async def generate_content(self, model, contents, config=None):
+        call = self.calls + 1
+        try:
+            response = await super().generate_content(model, contents, config)
+        except asyncio.CancelledError:
+            self.cancelled.append(call)
+            raise
+        self.finished.append(call)
+        return response
+
+
+def _warmed_policy(latency=0.05, samples=10, **options) -> HedgePolicy:
+    hedging = HedgePolicy(min_samples=samples, min_delay=0.0, **options)
+    for _ in range(samples):
+        hedging._record(latency, latency)
+    return hedging
+
+
+def _run(hedging: HedgePolicy, models: TrackedModels, calls: int = 1):
+    async def scenario():
+        loop = asyncio.get_running_loop()
+        results = []
+        for _ in range(calls):
+            start = loop.time()
+            response = await hedging.run(lambda: models.generate_content('modelo', []))
+            results.append((response.text, loop.time() - start))
+        await asyncio.sleep(0)  # Deja que la cancelación del perdedor se complete
+        return results
+
+    return asyncio.run(scenario())
+
+
+def test_percentile_uses_nearest_rank():
+    values = [5.0, 1.0, 4.0, 2.0, 3.0, 10.0, 6.0, 7.0, 9.0, 8.0]
+
+    assert percentile(values, 90) == 9.0
+    assert percentile(values, 50) == 5.0
+    assert percentile(values, 100) == 10.0
+    assert percentile([], 90) == 0.0
+
+
+def test_no_hedge_before_enough_samples():
+    hedging = HedgePolicy(budget_fraction=1.0, min_samples=3, min_delay=0.0)
+    models = TrackedModels(delays=[0.02, 0.02])
+
+    _run(hedging, models, calls=2)
+
+    assert hedging.hedge_delay() is None
+    assert hedging.hedges_sent == 0
+    assert models.calls == 2
+
+
+def test_hedge_fires_after_the_p90_and_the_first_reply_wins():
+    hedging = _warmed_policy(latency=0.05, budget_fraction=1.0)
+    # La original se cuelga; el duplicado sale al cumplirse el p90 y responde rápido
+    models = TrackedModels(delays=[1.0, 0.01])
+
+    [(text, elapsed)] = _run(hedging, models)
+
+    assert 'Conjunto' in text
+    assert 0.05 <= elapsed < 0.5
+    assert hedging.hedges_sent == 1 and hedging.hedge_wins == 1
+    assert models.finished == [2]
+    assert models.cancelled == [1]
+
+
+def test_fast_original_does_not_send_a_duplicate():
+    hedging = _warmed_policy(latency=0.05, budget_fraction=1.0)
+    models = TrackedModels(delays=[0.01])
+
+    _run(hedging, models)
+
+    assert hedging.hedges_sent == 0
+    assert models.calls == 1 and models.finished == [1]
+
+
+def test_original_wins_when_the_duplicate_is_slower():
+    hedging = _warmed_policy(latency=0.05, budget_fraction=1.0)
+    models = TrackedModels(delays=[0.08, 1.0])
+
+    _run(hedging, models)
+
+    assert hedging.hedges_sent == 1 and hedging.hedge_wins == 0
+    assert models.finished == [1]
+    assert models.cancelled == [2]
+
+
+def test_hedges_stay_within_the_budget():
+    hedging = _warmed_policy(latency=0.02, samples=100, budget_fraction=0.25)
+    # Todas las originales tardan más que el p90; sólo 1 de cada 4 puede duplicarse
+    models = TrackedModels(delays=[0.06] * 16)
+
+    _run(hedging, models, calls=8)
+
+    assert hedging.calls == 8
+    assert hedging.hedges_sent == 2
+    assert hedging.hedges_sent <= hedging.budget_fraction * hedging.calls
+    assert models.calls == 8 + hedging.hedges_sent
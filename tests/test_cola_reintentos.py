@@ -0,0 +1,93 @@
+"""Pruebas de la clasificación de errores, los presupuestos por clase y la cola diferida"""
+
+import asyncio
+
+import pytest
+
+from cola_reintentos import (
+    BAD_IMAGE, OTHER, QUOTA, SAFETY, SERVER, TIMEOUT,
+    Failure, RetryPolicy, RetryQueue, classify_error,
+)
+
+
+class ApiError(Exception):
+    def __init__(self, code, message):
+        super().__init__(f"{code} {message}")
+        self.code = code
+
+
+@pytest.mark.parametrize('error, error_class', [
+    (ApiError(429, "RESOURCE_EXHAUSTED {'retryDelay': '20s'}"), QUOTA),
+    (Exception('Respuesta bloqueada: SAFETY'), SAFETY),
+    (asyncio.TimeoutError(), TIMEOUT),
+    (ApiError(504, 'DEADLINE_EXCEEDED'), TIMEOUT),
+    (ApiError(503, 'UNAVAILABLE'), SERVER),
+    (ApiError(400, 'INVALID_ARGUMENT: Unable to process input image'), BAD_IMAGE),
+    (ApiError(400, 'INVALID_ARGUMENT: bad field'), OTHER),
+])
+def test_classify_error(error, error_class):
+    assert classify_error(error).error_class == error_class
+
+
+def test_quota_failure_keeps_the_server_retry_delay():
+    failure = classify_error(ApiError(429, "RESOURCE_EXHAUSTED {'retryDelay': '20s'}"))
+
+    assert failure.retry_delay == 20.0
+    assert RetryPolicy().delay(failure, attempt=0) >= 20.0
+
+
+def test_each_class_spends_its_own_budget():
+    policy = RetryPolicy(budgets={QUOTA: 3, SERVER: 1, SAFETY: 0})
+    quota, server = Failure(QUOTA, '429'), Failure(SERVER, '503')
+
+    # Los reintentos por cuota no consumen el presupuesto de errores de servidor
+    attempts = {QUOTA: 2}
+    assert policy.can_retry(quota, attempts)
+    assert policy.can_retry(server, attempts)
+
+    attempts = {QUOTA: 3, SERVER: 1}
+    assert not policy.can_retry(quota, attempts)
+    assert not policy.can_retry(server, attempts)
+    assert not policy.can_retry(Failure(SAFETY, 'SAFETY'), {})
+
+
+def test_backoff_grows_with_the_attempt_and_respects_the_ceiling():
+    policy = RetryPolicy(base_delays={SERVER: 2.0}, max_delay=10.0)
+    failure = Failure(SERVER, '503')
+
+    for attempt in range(6):
+        delay = policy.delay(failure, attempt)
+        assert 1.0 <= delay <= min(10.0, 2.0 * 2 ** attempt)
+
+
+def test_final_message_separates_permanent_from_exhausted_errors():
+    assert RetryPolicy.final_message(Failure(SAFETY, 'bloqueada')) \
+        == 'ERROR_PERMANENTE_SEGURIDAD: bloqueada'
+    assert RetryPolicy.final_message(Failure(BAD_IMAGE, 'imagen corrupta')) \
+        == 'ERROR_PERMANENTE_IMAGEN: imagen corrupta'
+    assert RetryPolicy.final_message(Failure(SERVER, '503 UNAVAILABLE')) \
+        == 'ERROR_API_FATAL: [servidor] 503 UNAVAILABLE'
+
+
+def test_retry_queue_releases_items_in_order_of_their_delay():
+    async def scenario():
+        queue = RetryQueue()
+        queue.push('lento', 0.05)
+        queue.push('rápido', 0.01)
+        queue.push('también rápido', 0.01)
+
+        assert queue.pop_ready() is None
+        assert 0 < queue.next_ready_in() <= 0.01
+
+        released = []
+        while queue:
+            await asyncio.sleep(queue.next_ready_in())
+            item = queue.pop_ready()
+            if item is not None:
+                released.append(item)
+        return released, queue.next_ready_in()
+
+    released, next_ready = asyncio.run(scenario())
+
+    assert released == ['rápido', 'también rápido', 'lento']
+    assert next_ready is None
@@ -0,0 +1,88 @@
+"""Pruebas de la cola de trabajo con asignaciones temporales"""
+
+import sqlite3
+import time
+from types import SimpleNamespace
+
+from cola_trabajo import DONE, FAILED, PENDING, WorkQueue, leased_jobs
+
+
+def _queue(tmp_path, worker_id, **kwargs):
+    return WorkQueue(tmp_path / 'cola.sqlite', worker_id=worker_id, **kwargs)
+
+
+def test_two_workers_never_lease_the_same_product(tmp_path):
+    first, second = _queue(tmp_path, 'a'), _queue(tmp_path, 'b')
+    assert first.seed('v1', lambda: [('A', True), ('B', True), ('C', True)]) == 3
+    assert second.seed('v1', lambda: [('A', True), ('B', True), ('C', True)]) is None
+
+    assert first.try_lease(['A', 'B']) == ['A', 'B']
+    assert second.try_lease(['A', 'B', 'C']) == ['C']
+
+
+def test_expired_lease_can_be_taken_over(tmp_path):
+    first, second = _queue(tmp_path, 'a', lease_seconds=0.05), _queue(tmp_path, 'b')
+    first.seed('v1', lambda: [('A', True)])
+
+    assert first.try_lease(['A']) == ['A']
+    assert second.try_lease(['A']) == []
+    time.sleep(0.1)
+    assert second.try_lease(['A']) == ['A']
+
+
+def test_retryable_errors_return_to_pending_until_max_attempts(tmp_path):
+    queue = _queue(tmp_path, 'a', max_attempts=2)
+    queue.seed('v1', lambda: [('A', True), ('B', True)])
+
+    queue.try_lease(['A', 'B'])
+    queue.complete('A', 'ERROR_API_FATAL: 503')
+    queue.complete('B', 'Tipo: nan')
+    assert queue.counts()[PENDING] == 1 and queue.counts()[DONE] == 1
+
+    queue.try_lease(['A'])
+    queue.complete('A', 'ERROR_API_FATAL: 503')
+    assert queue.counts()[FAILED] == 1
+    assert queue.is_finished()
+
+
+def test_reseed_drops_products_no_longer_in_csv(tmp_path):
+    queue = _queue(tmp_path, 'a')
+    queue.seed('v1', lambda: [('A', True), ('B', True), ('C', True)])
+    queue.try_lease(['A'])
+    queue.complete('A', 'Tipo: nan')
+
+    # El CSV se editó: B desaparece, C se mueve de posición y llega D
+    assert queue.seed('v2', lambda: [('D', True), ('C', True), ('A', False)]) == 2
+    assert sorted(queue.open_ids()) == ['C', 'D']
+    assert queue.counts()[DONE] == 1
+
+    queue.try_lease(['C', 'D'])
+    queue.complete('C', 'Tipo: nan')
+    queue.complete('D', 'Tipo: nan')
+    assert queue.is_finished()
+
+
+def test_old_positional_queue_is_discarded(tmp_path):
+    path = tmp_path / 'cola.sqlite'
+    conn = sqlite3.connect(str(path))
+    conn.execute('CREATE TABLE work (row_index INTEGER PRIMARY KEY, product_id TEXT NOT NULL, status TEXT NOT NULL, '
+                 'attempts INTEGER NOT NULL DEFAULT 0, lease_owner TEXT, lease_expires REAL, error TEXT, '
+                 'updated REAL NOT NULL)')
+    conn.execute("INSERT INTO work VALUES (0, 'X', 'pendiente', 0, NULL, NULL, NULL, 0)")
+    conn.execute('CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)')
+    conn.execute("INSERT INTO meta VALUES ('signature', 'v1')")
+    conn.commit()
+    conn.close()
+
+    queue = WorkQueue(path, worker_id='a')
+    assert queue.open_ids() == []
+    assert queue.seed('v1', lambda: [('A', True)]) == 1
+
+
+def test_leased_jobs_skips_products_held_by_another_worker(tmp_path):
+    first, second = _queue(tmp_path, 'a'), _queue(tmp_path, 'b')
+    first.seed('v1', lambda: [(product_id, True) for product_id in 'ABCD'])
+    second.try_lease(['B'])
+
+    jobs = [SimpleNamespace(product_id=product_id) for product_id in 'ABCD']
+    assert [job.product_id for job in leased_jobs(first, jobs, batch_size=2)] == ['A', 'C', 'D']
@@ -0,0 +1,79 @@
+"""Pruebas del controlador de concurrencia AIMD y de la lectura de errores de cuota"""
+
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from control_concurrencia import AIMDController, is_quota_error, retry_delay_from_error
+
+
+def test_additive_increase_adds_about_one_per_window_of_successes():
+    controller = AIMDController(initial_limit=4, max_limit=32)
+
+    for _ in range(4):
+        controller.on_success()
+    assert controller.current_limit == 4
+    for _ in range(2):
+        controller.on_success()
+    assert controller.current_limit == 5
+
+
+def test_quota_error_halves_the_limit_once_per_cooldown():
+    controller = AIMDController(initial_limit=16, decrease_cooldown=60)
+
+    controller.on_quota_error()
+    controller.on_quota_error()  # Misma ráfaga de 429: no vuelve a recortar
+
+    assert controller.limit == 8
+    assert controller.decreases == 1
+    assert controller.quota_errors == 2
+
+
+def test_limits_are_clamped():
+    controller = AIMDController(initial_limit=2, min_limit=1, max_limit=3, decrease_cooldown=0)
+
+    for _ in range(50):
+        controller.on_success()
+    assert controller.limit == 3
+
+    for _ in range(10):
+        controller.on_quota_error()
+    assert controller.limit == 1
+
+    fixed = AIMDController.fixed(4)
+    fixed.on_success()
+    fixed.on_quota_error()
+    assert fixed.current_limit == 4
+
+
+def test_acquire_waits_for_a_free_slot():
+    async def scenario():
+        controller = AIMDController.fixed(1)
+        await controller.acquire()
+        second = asyncio.ensure_future(controller.acquire())
+        await asyncio.sleep(0.01)
+        blocked = not second.done()
+        controller.release()
+        await asyncio.wait_for(second, 1)
+        return blocked, controller.in_flight
+
+    assert asyncio.run(scenario()) == (True, 1)
+
+
+def test_is_quota_error_accepts_code_or_message():
+    assert is_quota_error(SimpleNamespace(code=429))
+    assert is_quota_error(Exception('429 RESOURCE_EXHAUSTED: cuota por minuto'))
+    assert not is_quota_error(Exception('503 UNAVAILABLE'))
+
+
+@pytest.mark.parametrize('error, expected', [
+    (SimpleNamespace(details={'error': {'details': [
+        {'@type': 'type.googleapis.com/google.rpc.RetryInfo', 'retryDelay': '17s'}
+    ]}}), 17.0),
+    (Exception("429 RESOURCE_EXHAUSTED {'retryDelay': '42.5s'}"), 42.5),
+    (Exception('retryDelay: 3s'), 3.0),
+    (Exception('429 RESOURCE_EXHAUSTED sin pista'), None),
+])
+def test_retry_delay_from_error(error, expected):
+    assert retry_delay_from_error(error) == expected
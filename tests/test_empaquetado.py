@@ -0,0 +1,103 @@
+"""Pruebas del empaquetado de varios productos por llamada y de la separación de sus respuestas"""
+
+import json
+import asyncio
+
+from PIL import Image
+
+from empaquetado import PackedItem, build_packed_contents, split_packed_response
+from gemini_falso import RECORD, FakeGeminiClient, FakeModels
+from motor_async import AsyncExtractionEngine, ExtractionJob
+
+
+class DroppingModels(FakeModels):
+    """Responde los paquetes sin los ids indicados"""
+
+    def __init__(self, dropped):
+        super().__init__(RECORD)
+        self.dropped = set(dropped)
+
+    def reply(self, contents, config=None):
+        text = super().reply(contents, config)
+        if text.startswith('['):
+            text = json.dumps([item for item in json.loads(text) if item['id'] not in self.dropped],
+                              ensure_ascii=False)
+        return text
+
+
+def _jobs(tmp_path, count):
+    image = tmp_path / 'foto.jpg'
+    Image.new('RGB', (8, 8)).save(image)
+    return [ExtractionJob(index=n, product_id=f"P{n}", image_path=image, prompt=f"Producto P{n}") for n in range(count)]
+
+
+def _process_pack(client, jobs):
+    engine = AsyncExtractionEngine(client=client, model_name='gemini-2.5-flash', pack_size=len(jobs))
+    return engine, asyncio.run(engine.process_pack(jobs))
+
+
+def test_packed_contents_share_the_prefix_and_label_each_product():
+    items = [PackedItem('A', b'img-a', 'image/jpeg', 'Nombre: Conjunto A'),
+             PackedItem('B', b'img-b', 'image/png', 'Nombre: Conjunto B')]
+
+    parts = build_packed_contents(items, 'Reglas')
+
+    assert parts[0].text == 'Reglas'
+    assert 'A continuación se incluyen 2 productos' in parts[1].text
+    assert parts[2].text == '### Producto id=A\nNombre: Conjunto A'
+    assert parts[3].inline_data.data == b'img-a' and parts[3].inline_data.mime_type == 'image/jpeg'
+    assert parts[4].text.startswith('### Producto id=B')
+    assert parts[5].inline_data.mime_type == 'image/png'
+    # Con el prefijo en el context cache, el paquete empieza por las instrucciones
+    assert 'productos' in build_packed_contents(items)[0].text
+
+
+def test_splits_records_by_id_and_ignores_unknown_ids():
+    text = "```json\n" + json.dumps([
+        {'id': 'A', 'atributos': 'Color: Rosa'},
+        {'id': 'B', 'atributos': {'Color': 'Azul'}},
+        {'id': 'Z', 'atributos': 'Color: Verde'},
+    ]) + "\n```"
+
+    results = split_packed_response(text, ['A', 'B'])
+
+    assert results == {'A': 'Color: Rosa', 'B': json.dumps({'Color': 'Azul'})}
+
+
+def test_missing_ids_get_a_retryable_error():
+    results = split_packed_response(json.dumps([{'id': 'A', 'atributos': 'Color: Rosa'}]), ['A', 'B'])
+
+    assert results['A'] == 'Color: Rosa'
+    assert results['B'].startswith('ERROR_EMPAQUETADO')
+
+
+def test_truncated_json_fails_every_product():
+    results = split_packed_response('[{"id": "A", "atributos": "Color: Ro', ['A', 'B'])
+
+    assert all(value.startswith('ERROR_EMPAQUETADO') for value in results.values())
+
+
+def test_engine_sends_one_call_per_pack(tmp_path):
+    client = FakeGeminiClient()
+
+    engine, results = _process_pack(client, _jobs(tmp_path, 3))
+
+    assert client.calls == 1
+    assert [job.product_id for job, _ in results] == ['P0', 'P1', 'P2']
+    assert all('Tipo de producto: Conjunto' in outcome for _, outcome in results)
+
+
+def test_ids_missing_from_the_pack_are_retried_individually(tmp_path):
+    client = FakeGeminiClient()
+    client.aio.models = DroppingModels(['P1'])
+    jobs = _jobs(tmp_path, 3)
+    jobs.append(ExtractionJob(index=3, product_id='P3', image_path=tmp_path / 'no_existe.jpg', prompt='Producto P3'))
+
+    engine, results = _process_pack(client, jobs)
+
+    # Un paquete con P0, P1 y P2, y una llamada individual para el id omitido
+    assert client.calls == 2
+    outcomes = {job.product_id: outcome for job, outcome in results}
+    assert outcomes['P3'].startswith('ERROR_IMAGEN')
+    assert not any(outcomes[pid].startswith('ERROR') for pid in ('P0', 'P1', 'P2'))
+    assert 'Tipo de producto: Conjunto' in outcomes['P1']
@@ -0,0 +1,93 @@
+"""Pruebas del enrutador de prompts por familia y de sus context caches"""
+
+from types import SimpleNamespace
+
+from enrutador_prompt import (
+    GENERAL_FAMILY, attach_context_caches, build_routes, needs_full_prefix, product_family,
+    release_context_caches, render_static_prefix,
+)
+from gemini_falso import FakeCaches
+
+
+STATIC_PREFIX = (
+    "Reglas de extracción.\n"
+    "**Tipo:**[[Carriola, Andadera]]\n"
+    "**Género:**[[Niña, Niño, Unisex]]\n"
+    "**Corte:**[[Recto, Skinny]]\n"
+    "**Tipo de producto:**[[Conjunto, Pantalón, Carriola]]\n"
+)
+CLOSED_LISTS = {
+    'Tipo': ['Carriola', 'Andadera'],
+    'Género': ['Niña', 'Niño', 'Unisex'],
+    'Corte': ['Recto', 'Skinny'],
+    'Tipo de producto': ['Conjunto', 'Pantalón', 'Carriola'],
+}
+
+
+def test_product_family_prefers_the_product_type_over_the_category():
+    assert product_family('Conjunto', 'Juguetes') == 'ropa_completa'
+    assert product_family(' pantalón ', None) == 'ropa_inferior'
+    # Sin tipo (o con uno desconocido) decide la categoría
+    assert product_family(None, 'Carriolas y autoasientos') == 'equipo'
+    assert product_family('nan', 'Juguetería') == 'juguetes'
+    assert product_family('Cohete', 'Bebé') == GENERAL_FAMILY
+
+
+def test_family_prefix_drops_closed_lists_that_do_not_apply():
+    prefix = render_static_prefix(STATIC_PREFIX, 'ropa_inferior')
+
+    assert '**Corte:**' in prefix and '**Género:**' in prefix
+    assert '**Tipo:**' not in prefix
+    assert prefix.endswith('(responde `nan`):** Tipo')
+    assert render_static_prefix(STATIC_PREFIX, GENERAL_FAMILY) == STATIC_PREFIX
+
+
+def test_build_routes_skips_the_general_family():
+    routes = build_routes(STATIC_PREFIX, CLOSED_LISTS, ['equipo', GENERAL_FAMILY, 'equipo', 'ropa_inferior'])
+
+    assert sorted(routes) == ['equipo', 'ropa_inferior']
+    assert '**Corte:**' not in routes['equipo'].prefix
+    assert routes['equipo'].response_schema is not None
+    assert build_routes(STATIC_PREFIX, CLOSED_LISTS, ['equipo'], structured_output=False)['equipo'].response_schema is None
+
+
+def test_needs_full_prefix():
+    routes = build_routes(STATIC_PREFIX, CLOSED_LISTS, ['equipo', 'ropa_inferior'], structured_output=False)
+
+    assert not needs_full_prefix(routes, ['equipo', 'ropa_inferior'])
+    assert needs_full_prefix(routes, ['equipo', None])
+    assert needs_full_prefix(routes, [GENERAL_FAMILY])
+    # Con empaquetado, los paquetes que mezclan familias van con el prefijo completo
+    assert not needs_full_prefix(routes, ['equipo'], pack_size=3)
+    assert needs_full_prefix(routes, ['equipo', 'ropa_inferior'], pack_size=3)
+
+
+def test_context_caches_are_attached_and_released_per_route():
+    client = SimpleNamespace(caches=FakeCaches())
+    routes = build_routes(STATIC_PREFIX, CLOSED_LISTS, ['equipo', 'ropa_inferior'], structured_output=False)
+
+    attach_context_caches(client, 'gemini-2.5-flash', routes, ttl_seconds=600)
+
+    assert client.caches.created == ['prompt-atributos-equipo', 'prompt-atributos-ropa_inferior']
+    assert routes['equipo'].cached_content == 'cachedContents/prompt-atributos-equipo'
+
+    release_context_caches(client, routes)
+
+    assert client.caches.deleted == ['cachedContents/prompt-atributos-equipo',
+                                     'cachedContents/prompt-atributos-ropa_inferior']
+    assert all(route.cached_content is None for route in routes.values())
+
+
+def test_failed_cache_leaves_the_route_uncached():
+    class RejectingCaches(FakeCaches):
+        def create(self, model, config):
+            raise RuntimeError('400 INVALID_ARGUMENT: prefijo demasiado corto')
+
+    client = SimpleNamespace(caches=RejectingCaches())
+    routes = build_routes(STATIC_PREFIX, CLOSED_LISTS, ['equipo'], structured_output=False)
+
+    attach_context_caches(client, 'gemini-2.5-flash', routes, ttl_seconds=600)
+    release_context_caches(client, routes)
+
+    assert routes['equipo'].cached_content is None
+    assert client.caches.deleted == []
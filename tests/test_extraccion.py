@@ -0,0 +1,55 @@
+"""Pruebas de run_extraction de punta a punta contra el cliente falso"""
+
+import pytest
+
+from gemini_falso import FakeGeminiClient, extractor_config, make_catalog
+
+
+ROWS = 6
+
+
+def _run(extractor, directory, **overrides):
+    make_catalog(directory, ROWS)
+    config = extractor_config(extractor, directory)
+    for name, value in overrides.items():
+        setattr(config, name, value)
+    client = FakeGeminiClient()
+    df = extractor.run_extraction(
+        config, client, config.INPUT_CSV, config.OUTPUT_CSV, config.PROMPT_FILE, config.IMAGE_DIRECTORY
+    )
+    return df[config.ATTRIBUTES_COLUMN], client
+
+
+@pytest.mark.parametrize('pack_size', [1, 3])
+def test_free_text_prompt_is_not_sent_as_json(extractor, tmp_path, pack_size):
+    attributes, client = _run(extractor, tmp_path, STRUCTURED_OUTPUT=False, PACK_SIZE=pack_size)
+
+    assert client.calls == ROWS // pack_size
+    assert all(config.response_mime_type is None and config.response_schema is None
+               for config in client.aio.models.configs)
+    assert not attributes.str.startswith('ERROR').any()
+    assert attributes.str.contains('Tipo de producto: Conjunto').all()
+    assert attributes.str.contains('Color: Rosa').all()
+
+
+@pytest.mark.parametrize('pack_size', [1, 3])
+def test_structured_output_asks_for_json_with_schema(extractor, tmp_path, pack_size):
+    attributes, client = _run(extractor, tmp_path, STRUCTURED_OUTPUT=True, PACK_SIZE=pack_size)
+
+    assert all(config.response_mime_type == 'application/json' and config.response_schema is not None
+               for config in client.aio.models.configs)
+    assert not attributes.str.startswith('ERROR').any()
+    assert attributes.str.contains('Tipo de producto: Conjunto').all()
+
+
+@pytest.mark.parametrize('routing, expected', [
+    (True, ['prompt-atributos-ropa_completa']),
+    (False, ['prompt-atributos']),
+])
+def test_full_prefix_cache_only_when_some_job_reads_it(extractor, tmp_path, routing, expected):
+    # Todos los productos son conjuntos: con enrutador todos usan la ruta de su familia
+    attributes, client = _run(extractor, tmp_path, CONTEXT_CACHE_ENABLED=True, PROMPT_ROUTING=routing)
+
+    assert client.caches.created == expected
+    assert sorted(client.caches.deleted) == [f"cachedContents/{name}" for name in expected]
+    assert all(config.cached_content == f"cachedContents/{expected[0]}" for config in client.aio.models.configs)
@@ -0,0 +1,128 @@
+"""
+Pruebas de la fragmentación: varios procesos de fragmento en la misma
+máquina contra el cliente falso y luego la unión, revisando cobertura,
+huecos y duplicados.
+"""
+
+import os
+import json
+import shutil
+import multiprocessing
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+import pytest
+
+from fragmentos import merge_shard_records, parse_shard, shard_of, shard_path
+from gemini_falso import extractor_config, make_catalog
+
+
+ROWS = 30
+SHARDS = 3
+
+
+def _in_workdir(directory: str):
+    """Importa el extractor desde `directory` (su log y archivos relativos quedan ahí)."""
+    os.chdir(directory)
+    import extraer_atributos
+    return extraer_atributos
+
+
+def _run_shard(directory: str, shard_index: int, shard_count: int) -> int:
+    from pathlib import Path
+    from gemini_falso import FakeGeminiClient
+
+    extractor = _in_workdir(directory)
+    config = extractor_config(extractor, Path(directory))
+    extractor.use_shard(config, shard_index, shard_count)
+    client = FakeGeminiClient()
+    extractor.run_extraction(
+        config, client, config.INPUT_CSV, config.OUTPUT_CSV, config.PROMPT_FILE, config.IMAGE_DIRECTORY
+    )
+    return client.calls
+
+
+def _merge(directory: str, shard_count: int):
+    from pathlib import Path
+
+    extractor = _in_workdir(directory)
+    config = extractor_config(extractor, Path(directory))
+    extractor.merge_only(config, shard_count)
+
+
+@pytest.fixture(scope='module')
+def sharded_run(tmp_path_factory):
+    """Catálogo procesado por SHARDS procesos en paralelo (las pruebas que lo alteran trabajan en una copia)."""
+    directory = tmp_path_factory.mktemp('fragmentos')
+    make_catalog(directory, ROWS)
+    with ProcessPoolExecutor(SHARDS, mp_context=multiprocessing.get_context('spawn')) as executor:
+        calls = list(executor.map(_run_shard, [str(directory)] * SHARDS, range(SHARDS), [SHARDS] * SHARDS))
+    return directory, calls
+
+
+def _report(directory):
+    df = pd.read_csv(directory / 'productos.csv')
+    return merge_shard_records(df, directory / 'productos_con_atributos.jsonl', SHARDS, lambda idx: df.at[idx, 'id'])
+
+
+def test_shard_of_is_stable_and_covers_every_shard():
+    ids = [f"P{number}" for number in range(1000)]
+    shards = [shard_of(product_id, 4) for product_id in ids]
+
+    assert shards == [shard_of(product_id, 4) for product_id in ids]
+    assert set(shards) == {0, 1, 2, 3}
+    assert min(Counter(shards).values()) > 200
+
+
+def test_parse_shard_validates_range():
+    assert parse_shard('2/4') == (2, 4)
+    for text in ('4/4', '-1/4', '1', 'a/b', '0/0'):
+        with pytest.raises(ValueError):
+            parse_shard(text)
+
+
+def test_shard_processes_split_the_catalog_without_overlap(sharded_run):
+    directory, calls = sharded_run
+
+    assert sum(calls) == ROWS
+    records, report = _report(directory)
+    assert report.complete
+    assert report.coverage == 1.0
+    assert not (report.gaps or report.duplicates or report.misplaced or report.mismatched)
+
+    expected = Counter(shard_of(f"P{number}", SHARDS) for number in range(ROWS))
+    for shard_index in range(SHARDS):
+        journal = shard_path(directory / 'productos_con_atributos.jsonl', shard_index, SHARDS)
+        assert sum(1 for _ in open(journal, encoding='utf-8')) == expected[shard_index]
+
+
+def test_merge_writes_the_full_csv(sharded_run, tmp_path):
+    directory = shutil.copytree(sharded_run[0], tmp_path / 'copia')
+    with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context('spawn')) as executor:
+        executor.submit(_merge, str(directory), SHARDS).result()
+
+    merged = pd.read_csv(directory / 'productos_con_atributos.csv')
+    assert len(merged) == ROWS
+    assert merged['gemini_attributes'].str.contains('Tipo de producto: Conjunto').all()
+
+
+def test_merge_reports_gaps_and_duplicates(sharded_run, tmp_path):
+    directory = shutil.copytree(sharded_run[0], tmp_path / 'copia')
+    base = directory / 'productos_con_atributos.jsonl'
+
+    # Un fragmento perdido deja huecos; un registro copiado a otro fragmento es duplicado
+    lost = shard_path(base, 2, SHARDS)
+    lost_ids = {json.loads(line)['id'] for line in open(lost, encoding='utf-8')}
+    lost.unlink()
+    first = open(shard_path(base, 0, SHARDS), encoding='utf-8').readline()
+    with open(shard_path(base, 1, SHARDS), 'a', encoding='utf-8') as f:
+        f.write(first)
+
+    records, report = _report(directory)
+    assert not report.complete
+    assert report.missing_shards == [2]
+    assert set(report.gaps) == lost_ids
+    assert report.duplicates == [json.loads(first)['id']]
+    assert report.misplaced == [json.loads(first)['id']]
+    assert report.covered == ROWS - len(lost_ids)
@@ -0,0 +1,65 @@
+"""Pruebas del limitador compartido entre procesos"""
+
+import pytest
+
+import limitador_compartido
+from limitador_compartido import LIMITS_TTL, SharedRateLimiter
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(limitador_compartido.time, 'time', lambda: now[0])
+    return now
+
+
+def _limiter(tmp_path, owner, requests_per_minute, tokens_per_minute=None):
+    limiter = SharedRateLimiter(tmp_path / 'clave-modelo.json', requests_per_minute, tokens_per_minute)
+    limiter._owner = owner  # Un "proceso" distinto por limitador
+    return limiter
+
+
+def test_process_without_tpm_keeps_the_token_refill(tmp_path, clock):
+    extractor = _limiter(tmp_path, 'extractor', 600, 6000)
+    notebook = _limiter(tmp_path, 'notebook', 600)
+
+    assert extractor._reserve(6000) == 0
+    clock[0] += 30
+    assert notebook._reserve(0) == 0
+    # Los 30 s de relleno (3000 tokens) siguen disponibles para el extractor
+    assert extractor._reserve(3000) == 0
+    assert extractor._reserve(1) > 0
+
+
+def test_processes_share_the_strictest_limits(tmp_path, clock):
+    fast = _limiter(tmp_path, 'rapido', 60, 100_000)
+    slow = _limiter(tmp_path, 'lento', 6, 10_000)
+
+    slow._reserve(0)
+    assert fast._reserve(0) == 0
+    assert fast.requests_per_minute == 6
+    assert fast.tokens_per_minute == 10_000
+    assert fast.available() <= 6
+
+
+def test_limits_of_an_inactive_process_expire(tmp_path, clock):
+    fast = _limiter(tmp_path, 'rapido', 60)
+    slow = _limiter(tmp_path, 'lento', 6)
+
+    slow._reserve(0)
+    fast._reserve(0)
+    assert fast.requests_per_minute == 6
+
+    clock[0] += LIMITS_TTL + 1
+    fast._reserve(0)
+    assert fast.requests_per_minute == 60
+
+
+def test_requests_wait_for_refill(tmp_path, clock):
+    limiter = _limiter(tmp_path, 'a', 2)
+
+    assert limiter._reserve(0) == 0
+    assert limiter._reserve(0) == 0
+    assert limiter._reserve(0) == pytest.approx(30)
+    clock[0] += 30
+    assert limiter._reserve(0) == 0
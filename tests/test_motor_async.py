@@ -0,0 +1,101 @@
+"""Pruebas del motor asíncrono: concurrencia, orden de resultados y errores → Outcome"""
+
+import asyncio
+from types import SimpleNamespace
+
+from PIL import Image
+
+from cola_reintentos import OTHER, QUOTA, SAFETY, SERVER, TIMEOUT, RetryPolicy
+from gemini_falso import USAGE, FakeGeminiClient, FakeModels
+from motor_async import AsyncExtractionEngine, ExtractionJob
+
+
+class ScriptedModels(FakeModels):
+    """Cada producto (por su prompt) falla con las excepciones indicadas antes de responder"""
+
+    def __init__(self, failures, latency=0.01):
+        super().__init__({'Color': 'Rosa'})
+        self.failures = {product_id: list(errors) for product_id, errors in failures.items()}
+        self.latency = latency
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.calls_by_product = {}
+
+    async def generate_content(self, model, contents, config=None):
+        product_id = contents[-1].text.split()[-1]
+        self.calls += 1
+        self.calls_by_product[product_id] = self.calls_by_product.get(product_id, 0) + 1
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.latency)
+            errors = self.failures.get(product_id)
+            if errors:
+                raise errors.pop(0)
+            return SimpleNamespace(text=f"Color: Rosa {product_id}", usage_metadata=SimpleNamespace(**USAGE))
+        finally:
+            self.in_flight -= 1
+
+
+def _client(failures=None, latency=0.01):
+    client = FakeGeminiClient()
+    client.aio.models = ScriptedModels(failures or {}, latency)
+    return client
+
+
+def _jobs(tmp_path, count):
+    image = tmp_path / 'foto.jpg'
+    Image.new('RGB', (8, 8)).save(image)
+    return [ExtractionJob(index=n, product_id=f"P{n}", image_path=image, prompt=f"Producto P{n}") for n in range(count)]
+
+
+def _run(client, jobs, **kwargs):
+    fast_retries = RetryPolicy(base_delays={QUOTA: 0.2, SERVER: 0.2, TIMEOUT: 0.2, OTHER: 0.2})
+    engine = AsyncExtractionEngine(client=client, model_name='gemini-2.5-flash', retry_policy=fast_retries, **kwargs)
+    results = []
+    processed = asyncio.run(engine.run(jobs, lambda job, outcome: results.append((job.product_id, outcome))))
+    return engine, processed, results
+
+
+def test_runs_up_to_max_concurrent_calls_and_reports_each_job_once(tmp_path):
+    client = _client()
+
+    engine, processed, results = _run(client, _jobs(tmp_path, 12), max_concurrent=3)
+
+    assert processed == 12
+    assert client.aio.models.max_in_flight == 3
+    assert sorted(results) == sorted((f"P{n}", f"Color: Rosa P{n}") for n in range(12))
+    assert engine.api_calls == 12
+
+
+def test_failing_product_is_retried_without_blocking_the_rest(tmp_path):
+    client = _client({'P0': [Exception('503 UNAVAILABLE'), Exception('503 UNAVAILABLE')]})
+
+    engine, processed, results = _run(client, _jobs(tmp_path, 6), max_concurrent=2)
+
+    # Los demás terminan mientras P0 espera su reintento diferido
+    assert [product_id for product_id, _ in results][-1] == 'P0'
+    assert dict(results)['P0'] == 'Color: Rosa P0'
+    assert client.aio.models.calls_by_product['P0'] == 3
+    assert engine.retries[SERVER] == 2
+    assert processed == 6
+
+
+def test_errors_map_to_final_outcomes(tmp_path):
+    jobs = _jobs(tmp_path, 3)
+    jobs.append(ExtractionJob(index=3, product_id='P3', image_path=tmp_path / 'falta.jpg', prompt='Producto P3'))
+    client = _client({
+        'P0': [Exception('Respuesta bloqueada: SAFETY')],
+        'P1': [Exception('algo raro')] * 3,
+    })
+
+    engine, processed, results = _run(client, jobs, max_concurrent=4)
+    outcomes = dict(results)
+
+    assert outcomes['P0'].startswith('ERROR_PERMANENTE_SEGURIDAD')
+    assert outcomes['P1'].startswith('ERROR_API_FATAL: [otro]')
+    assert outcomes['P2'] == 'Color: Rosa P2'
+    assert outcomes['P3'].startswith('ERROR_IMAGEN')
+    assert len(results) == processed == 4
+    assert client.aio.models.calls_by_product == {'P0': 1, 'P1': 3, 'P2': 1}
+    assert engine.final_failures == {SAFETY: 1, OTHER: 1}
@@ -0,0 +1,38 @@
+"""Pruebas del tope de salida de los perfiles de generación"""
+
+from perfiles_generacion import (
+    GENERATION_PROFILES, MAX_OUTPUT_TOKENS_LIMIT, PACKED_TOKENS_PER_PRODUCT, output_token_limit, profile_options
+)
+
+
+def test_single_product_keeps_profile_limit():
+    for profile in GENERATION_PROFILES.values():
+        assert output_token_limit(profile, 1) == profile.max_output_tokens
+
+
+def test_packed_limit_covers_every_product_plus_thinking():
+    balanced = GENERATION_PROFILES['balanced']
+    limit = output_token_limit(balanced, 8)
+
+    assert limit == 8 * PACKED_TOKENS_PER_PRODUCT + balanced.thinking_budget
+    assert limit - balanced.thinking_budget >= 8 * 200
+
+
+def test_packed_limit_without_thinking_scales_with_pack():
+    fast = GENERATION_PROFILES['fast']
+
+    assert output_token_limit(fast, 2) == fast.max_output_tokens
+    assert output_token_limit(fast, 8) == 8 * PACKED_TOKENS_PER_PRODUCT
+
+
+def test_dynamic_thinking_reserves_profile_limit():
+    accurate = GENERATION_PROFILES['accurate']
+
+    assert output_token_limit(accurate, 8) == accurate.max_output_tokens + 8 * PACKED_TOKENS_PER_PRODUCT
+    assert output_token_limit(accurate, 1000) == MAX_OUTPUT_TOKENS_LIMIT
+
+
+def test_profile_options_uses_pack_size():
+    options = profile_options(GENERATION_PROFILES['fast'], 'gemini-2.5-flash', pack_size=8)
+
+    assert options['max_output_tokens'] == 8 * PACKED_TOKENS_PER_PRODUCT
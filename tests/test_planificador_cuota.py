@@ -0,0 +1,87 @@
+"""Pruebas de la cuota diaria y del ciclo de ventanas de --programar"""
+
+from planificador_cuota import DailyQuota, parse_duration, quota_capacity, run_windows
+
+
+class FakeWindow:
+    """Cuota en memoria: cada corrida gasta una solicitud por producto hasta el tope de capacidad."""
+
+    def __init__(self, products: int, cap: int, stuck: int = 0):
+        self.pending = products
+        self.cap = cap
+        self.used = 0
+        self.stuck = stuck  # Productos que fallan siempre
+        self.runs = 0
+        self.waits = []
+
+    def remaining(self) -> int:
+        return max(0, self.cap - self.used)
+
+    def run(self):
+        self.runs += 1
+        sent = min(self.pending, quota_capacity(self.remaining(), 1))
+        self.used += sent
+        self.pending = max(self.stuck, self.pending - sent)
+        return self.pending
+
+    def wait(self, pending: int):
+        self.waits.append(pending)
+        self.used = 0
+
+
+def _loop(window: FakeWindow):
+    return run_windows(
+        window.run, pending=lambda left: left,
+        capacity=lambda: quota_capacity(window.remaining(), 1), wait=window.wait
+    )
+
+
+def test_keeps_running_until_the_quota_is_really_spent():
+    # Tope 950: la primera corrida solo envía el 90 % y deja cuota para una segunda
+    window = FakeWindow(products=3000, cap=950)
+
+    assert _loop(window) == 0
+    assert window.runs > 4
+    assert len(window.waits) == 3
+    assert window.waits == sorted(window.waits, reverse=True)
+
+
+def test_stops_when_a_run_with_quota_makes_no_progress():
+    window = FakeWindow(products=5, cap=950, stuck=5)
+
+    assert _loop(window) == 5
+    assert window.runs == 2
+    assert window.waits == []
+
+
+def test_none_result_stops_the_loop():
+    assert run_windows(lambda: None, pending=len, capacity=lambda: 1, wait=lambda left: None) is None
+
+
+def test_daily_quota_is_shared_through_the_state_file(tmp_path):
+    first = DailyQuota(tmp_path / 'cuota.json', requests_per_day=100)
+    second = DailyQuota(tmp_path / 'cuota.json', requests_per_day=100)
+
+    first.consume('modelo', 30)
+    second.consume('modelo', 20)
+
+    assert first.daily_cap == 95
+    assert second.used('modelo') == 50
+    assert first.remaining('modelo') == 45
+    assert first.remaining('otro') == 95
+
+
+def test_daily_quota_resets_in_a_new_window(tmp_path):
+    quota = DailyQuota(tmp_path / 'cuota.json', requests_per_day=100)
+    quota.consume('modelo', 90)
+    state = (tmp_path / 'cuota.json').read_text(encoding='utf-8')
+    (tmp_path / 'cuota.json').write_text(state.replace(quota.window(), '2000-01-01'), encoding='utf-8')
+
+    assert quota.used('modelo') == 0
+    assert 0 < quota.seconds_until_reset() <= 24 * 3600
+
+
+def test_parse_duration():
+    assert parse_duration('90') == 5400
+    assert parse_duration('1h30m') == 5400
+    assert parse_duration('45s') == 45
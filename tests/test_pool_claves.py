@@ -0,0 +1,106 @@
+"""Pruebas del pool de API keys: elección por holgura y claves apartadas por cuota"""
+
+import time
+import asyncio
+from types import SimpleNamespace
+
+from pool_claves import ClientPool, KeySlot, load_api_keys
+
+
+class FakeLimiter:
+    """Limitador con saldo fijo que registra las adquisiciones"""
+
+    def __init__(self, available, requests_per_minute=60):
+        self._available = available
+        self.requests_per_minute = requests_per_minute
+        self.acquired = []
+
+    def available(self):
+        return self._available
+
+    async def acquire(self, tokens=0):
+        self.acquired.append(tokens)
+        self._available -= 1
+
+
+QUOTA_ERROR = Exception("429 RESOURCE_EXHAUSTED {'retryDelay': '90s'}")
+
+
+def _pool(available, **kwargs):
+    """Pool con una clave por saldo disponible; las etiquetas son A, B, C..."""
+    slots = [KeySlot(chr(ord('A') + n), client=SimpleNamespace(), fingerprint=f"huella-{n}")
+             for n in range(len(available))]
+    limiters = {slot.fingerprint: FakeLimiter(balance) for slot, balance in zip(slots, available)}
+    return ClientPool(slots, lambda fingerprint, model: limiters[fingerprint], **kwargs)
+
+
+def _acquire(pool, times=1):
+    async def scenario():
+        return [await pool.acquire('gemini-2.5-flash', tokens=1000) for _ in range(times)]
+    return [slot.label for slot in asyncio.run(scenario())]
+
+
+def test_load_api_keys_accepts_labels_and_skips_duplicates():
+    env = {'GEMINI_API_KEYS': 'proyecto-a=clave-aaaa, clave-bbbb, proyecto-c=clave-aaaa'}
+
+    assert load_api_keys(env) == [('proyecto-a', 'clave-aaaa'), ('clave-2 (…bbbb)', 'clave-bbbb')]
+    assert load_api_keys({'GEMINI_API_KEY': 'unica-1234'}) == [('clave-1 (…1234)', 'unica-1234')]
+
+
+def test_acquire_picks_the_key_with_the_most_headroom():
+    pool = _pool([10, 40, 25])
+
+    # B tiene más saldo hasta empatar con C; el empate lo gana la de menos llamadas en vuelo
+    assert _acquire(pool, 17) == ['B'] * 15 + ['C', 'B']
+    assert pool.slots[1].requests == 16 and pool.slots[1].in_flight == 16
+    assert pool.slots[1].rate_limiters['gemini-2.5-flash'].acquired[0] == 1000
+
+
+def test_ties_go_to_the_key_with_fewer_calls_in_flight():
+    pool = _pool([30, 30])
+    pool.slots[0].in_flight = 3
+
+    assert _acquire(pool) == ['B']
+
+
+def test_key_is_benched_after_consecutive_quota_errors():
+    pool = _pool([40, 10], quota_error_threshold=2, cooldown_seconds=60)
+    first = pool.slots[0]
+
+    # Un éxito entre errores reinicia la racha
+    for error in (QUOTA_ERROR, None, QUOTA_ERROR):
+        first.in_flight += 1
+        pool.release(first, error)
+    assert first.times_benched == 0
+
+    first.in_flight += 1
+    pool.release(first, QUOTA_ERROR)
+    assert first.times_benched == 1 and first.quota_errors == 3
+    # El enfriamiento respeta el RetryInfo del servidor si es mayor
+    assert 85 < first.cooldown_until - time.monotonic() <= 90
+    assert _acquire(pool, 2) == ['B', 'B']
+
+
+def test_single_key_is_never_benched():
+    pool = _pool([40], quota_error_threshold=1)
+    slot = pool.slots[0]
+
+    for _ in range(5):
+        slot.in_flight += 1
+        pool.release(slot, QUOTA_ERROR)
+
+    assert slot.quota_errors == 5 and slot.times_benched == 0
+    assert _acquire(pool) == ['A']
+
+
+def test_cancelled_hedge_and_other_errors_do_not_count_as_quota():
+    pool = _pool([40, 40], quota_error_threshold=1)
+    slot = pool.slots[0]
+
+    slot.in_flight = 2
+    pool.release(slot, asyncio.CancelledError())
+    pool.release(slot, Exception('503 UNAVAILABLE'))
+
+    assert slot.in_flight == 0
+    assert slot.other_errors == 1 and slot.quota_errors == 0 and slot.times_benched == 0
+    assert pool.describe()[0] == 'A: 0 solicitudes, 0 exitosas, 0 de cuota, 1 otros errores'
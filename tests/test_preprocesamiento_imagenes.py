@@ -0,0 +1,39 @@
+"""Pruebas del preprocesamiento de imágenes"""
+
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from PIL import Image
+
+from preprocesamiento_imagenes import ImagePreprocessConfig, preprocess_image, processed_path
+
+
+def _image(tmp_path, size=(2000, 1000)):
+    path = tmp_path / 'producto.jpg'
+    image = Image.new('RGB', size, (255, 255, 255))
+    image.paste((200, 30, 30), (500, 200, 1500, 800))
+    image.save(path)
+    return path
+
+
+def test_resizes_and_crops_white_borders(tmp_path):
+    settings = ImagePreprocessConfig(max_side=512)
+    output = preprocess_image(_image(tmp_path), settings)
+
+    assert output == processed_path(tmp_path / 'producto.jpg', settings)
+    with Image.open(output) as image:
+        assert max(image.size) == 512
+        assert image.size[0] / image.size[1] == pytest.approx(1000 / 600, rel=0.01)
+
+
+def test_concurrent_calls_leave_one_complete_file(tmp_path):
+    source = _image(tmp_path)
+    settings = ImagePreprocessConfig()
+
+    with ThreadPoolExecutor(8) as executor:
+        outputs = set(executor.map(lambda _: preprocess_image(source, settings), range(16)))
+
+    output, = outputs
+    assert [path.name for path in output.parent.iterdir()] == [output.name]
+    with Image.open(output) as image:
+        image.verify()
@@ -0,0 +1,40 @@
+"""Pruebas del motor de reglas por palabras clave"""
+
+import pytest
+
+from plantilla_prompt import RULE_HINTS_MARKER, render_rule_hints
+from reglas_atributos import infer_attributes, known_attributes
+
+
+@pytest.mark.parametrize('name, attribute, unexpected', [
+    ("Organizador de closet gris", 'Tipo de producto', 'Conjunto'),
+    ("Set de biberones", 'Tipo de producto', 'Conjunto'),
+    ("Pañalero para niños", 'Género', 'Bebé niño'),
+    ("Carriola Baby Colors", 'Género', 'Bebé'),
+    ("Set de biberones", 'Tipo de producto', 'Babero'),
+])
+def test_keywords_match_whole_words_only(name, attribute, unexpected):
+    assert known_attributes(name).get(attribute) != unexpected
+
+
+def test_brand_is_still_detected():
+    assert infer_attributes("Carriola Baby Colors")['marca'] == 'Baby Colors'
+
+
+def test_pieces_only_for_sets():
+    assert infer_attributes("Conjunto 3 piezas para bebé niña")['Número de piezas'] == 3
+    assert infer_attributes("Set 2 piezas azul")['Número de piezas'] == 2
+    assert infer_attributes("Mameluco 2 piezas")['Número de piezas'] == 1
+    assert 'Número de piezas' not in infer_attributes("Conjunto 5 piezas")
+
+
+def test_defaults_only_when_requested():
+    assert infer_attributes("Organizador de closet")['Género'] == 'Unisex'
+    assert 'Género' not in known_attributes("Organizador de closet")
+
+
+def test_hints_are_rendered_as_overridable():
+    section = render_rule_hints({'Género': 'Bebé niña', 'Color': 'Rosa'})
+
+    assert section.startswith(RULE_HINTS_MARKER)
+    assert 'Género: Bebé niña, Color: Rosa' in section
@@ -0,0 +1,74 @@
+"""Pruebas de la reparación parcial: solo se vuelven a pedir los atributos que fallaron"""
+
+import pandas as pd
+
+from atributos import parse_attributes
+from gemini_falso import FakeGeminiClient, extractor_config, make_catalog
+from reparacion_parcial import find_repair_targets, repair_groups
+
+
+CLOSED_LISTS = {'Género': ['Niña', 'Niño', 'Unisex'], 'Tipo de producto': ['Conjunto', 'Pijama']}
+VALID = 'Género: Unisex, Tipo de producto: Conjunto, Color: Azul, Estilo: Casual'
+INVALID_GENDER = 'Género: Marciano, Tipo de producto: Conjunto, Color: Azul, Estilo: Casual'
+
+
+def _frame(attributes):
+    return pd.DataFrame({'nombre': [f"Conjunto {n}" for n in range(len(attributes))], 'atributos': attributes})
+
+
+def test_targets_keep_the_record_and_list_only_failing_attributes():
+    df = _frame([VALID, INVALID_GENDER, 'Género: Unisex, Color: Azul', 'ERROR_API_FATAL: 503', ''])
+
+    targets = find_repair_targets(df, 'atributos', CLOSED_LISTS)
+
+    # Los errores y las filas sin procesar se re-extraen completas, no se reparan
+    assert sorted(targets) == [1, 2]
+    assert targets[1].failing == ('Género',)
+    assert targets[1].visible_known == {'Tipo de producto': 'Conjunto', 'Color': 'Azul', 'Estilo': 'Casual'}
+    assert targets[2].failing == ('Tipo de producto',)
+    assert targets[2].known['Tipo'] == 'nan'
+    assert repair_groups(targets.values()) == {('Género',): 1, ('Tipo de producto',): 1}
+
+
+def test_without_validation_only_flagged_rows_are_repaired():
+    df = _frame([VALID, INVALID_GENDER])
+
+    targets = find_repair_targets(df, 'atributos', CLOSED_LISTS, flagged={0: ['Color']}, validate=False)
+
+    assert list(targets) == [0]
+    assert targets[0].failing == ('Color',)
+    assert 'Color' not in targets[0].known
+
+
+def test_repair_requeries_failing_attributes_and_merges_them(extractor, tmp_path):
+    make_catalog(tmp_path, 2)
+    config = extractor_config(extractor, tmp_path)
+    catalog = pd.read_csv(config.INPUT_CSV)
+    catalog[config.ATTRIBUTES_COLUMN] = [VALID, INVALID_GENDER]
+    catalog.to_csv(config.INPUT_CSV, index=False)
+    config.REPAIR_VALIDATE = True
+    config.STRUCTURED_OUTPUT = False
+    client = FakeGeminiClient()
+    prompts = []
+    generate_content = client.aio.models.generate_content
+
+    async def recording_generate_content(model, contents, config=None):
+        prompts.append(contents[-1].text)
+        return await generate_content(model, contents, config)
+
+    client.aio.models.generate_content = recording_generate_content
+
+    df = extractor.run_extraction(
+        config, client, config.INPUT_CSV, config.OUTPUT_CSV, config.PROMPT_FILE, config.IMAGE_DIRECTORY
+    )
+
+    # Una sola llamada, para la fila inválida, que pide solo el género
+    assert len(prompts) == 1
+    assert 'Nombre: Conjunto 1' in prompts[0]
+    assert '**Extrae únicamente:** Género' in prompts[0]
+
+    # El género viene del modelo; el resto del registro anterior se conserva
+    repaired = parse_attributes(df.loc[1, config.ATTRIBUTES_COLUMN])
+    assert repaired['Género'] == 'Unisex'
+    assert repaired['Color'] == 'Azul' and repaired['Estilo'] == 'Casual'
+    assert df.loc[0, config.ATTRIBUTES_COLUMN] == VALID
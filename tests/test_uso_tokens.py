@@ -0,0 +1,61 @@
+"""Pruebas de la contabilidad de tokens (respuestas interactivas, duplicados de cobertura y Batch API)"""
+
+import json
+import asyncio
+from types import SimpleNamespace
+
+from batch_gemini import download_batch_results
+from cobertura_solicitudes import HedgePolicy
+from gemini_falso import USAGE, FakeGeminiClient
+from motor_async import AsyncExtractionEngine, ExtractionJob
+from uso_tokens import TokenUsage
+
+
+def test_from_json_reads_camel_case_usage_metadata():
+    usage = TokenUsage.from_json({
+        'promptTokenCount': 1300, 'candidatesTokenCount': 50, 'thoughtsTokenCount': 20,
+        'cachedContentTokenCount': 1000,
+        'promptTokensDetails': [{'modality': 'TEXT', 'tokenCount': 1042}, {'modality': 'IMAGE', 'tokenCount': 258}],
+    })
+
+    assert usage == TokenUsage(prompt_tokens=1300, image_tokens=258, cached_tokens=1000,
+                               thinking_tokens=20, output_tokens=50, calls=1)
+    assert TokenUsage.from_json(None) == TokenUsage(calls=1)
+
+
+def test_batch_results_carry_usage_per_request():
+    lines = [
+        {'key': 'A', 'response': {
+            'candidates': [{'content': {'parts': [{'text': 'Color: Rosa'}]}}],
+            'usageMetadata': {'promptTokenCount': 1300, 'candidatesTokenCount': 50},
+        }},
+        {'key': 'B', 'error': {'code': 500}},
+    ]
+    client = SimpleNamespace(files=SimpleNamespace(
+        download=lambda file: '\n'.join(json.dumps(line) for line in lines).encode('utf-8')
+    ))
+    job = SimpleNamespace(name='batches/1', state='JOB_STATE_SUCCEEDED', dest=SimpleNamespace(file_name='f'))
+
+    results = download_batch_results(client, job)
+
+    assert results['A'] == ('Color: Rosa', TokenUsage(prompt_tokens=1300, output_tokens=50, calls=1))
+    assert results['B'][0].startswith('ERROR_API_FATAL')
+    assert results['B'][1] == TokenUsage(calls=1)
+
+
+def test_cancelled_hedge_duplicate_is_counted_as_a_call(tmp_path):
+    # La original tarda; el duplicado responde de inmediato y la original se cancela
+    client = FakeGeminiClient(delays=[1.0, 0.0])
+    hedging = HedgePolicy(budget_fraction=1.0, min_samples=1, min_delay=0.05)
+    hedging._record(0.05, 0.05)
+    engine = AsyncExtractionEngine(client=client, model_name='gemini-2.5-flash', hedging=hedging)
+    job = ExtractionJob(index=0, product_id='A', image_path=tmp_path / 'A.jpg', prompt='')
+
+    text = asyncio.run(engine._call_gemini('A', [], None, 0, [job]))
+
+    assert 'Conjunto' in text
+    assert hedging.hedge_wins == 1
+    assert client.calls == 2
+    assert engine.api_calls == 2
+    assert engine.usage.calls == 2 and job.usage.calls == 2
+    assert engine.usage.prompt_tokens == USAGE['prompt_token_count']
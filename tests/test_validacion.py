@@ -0,0 +1,48 @@
+"""Pruebas del normalizador de listas cerradas"""
+
+import pandas as pd
+
+from atributos import parse_attributes
+from validacion import EXACT, FUZZY, INVALID, NORMALIZED, ClosedListIndex, normalize_attribute_column
+
+
+CLOSED_LISTS = {
+    'Color': ['Rosa', 'Azul', 'Verde'],
+    'Género': ['Bebé niña', 'Bebé niño', 'Unisex'],
+    'ColorAgrupador': ['Gris (#C2C4C6)', 'Rosa (#F4B6C2)'],
+}
+
+
+def test_lookup_resolves_exact_accents_parenthesis_and_fuzzy():
+    index = ClosedListIndex(CLOSED_LISTS)
+
+    assert index.lookup('Color', 'Rosa') == ('Rosa', EXACT)
+    assert index.lookup('Género', 'bebe NIÑA') == ('Bebé niña', NORMALIZED)
+    assert index.lookup('ColorAgrupador', 'gris') == ('Gris (#C2C4C6)', NORMALIZED)
+    assert index.lookup('Color', 'Verdee') == ('Verde', FUZZY)
+    assert index.lookup('Color', 'Morado') == ('Morado', INVALID)
+
+
+def test_normalize_record_blanks_invalid_values():
+    record, invalid = ClosedListIndex(CLOSED_LISTS).normalize_record({'Color': 'Morado', 'Género': 'unisex'})
+
+    assert record['Color'] == 'nan'
+    assert record['Género'] == 'Unisex'
+    assert invalid == {'Color': 'Morado'}
+
+
+def test_normalize_column_keeps_errors_and_flags_invalid_rows():
+    attributes = pd.Series([
+        'Color: rosa, Género: Bebe nino',
+        'ERROR_API_FATAL: 503',
+        '',
+        'Color: Morado, Género: Unisex',
+    ])
+
+    text, invalid, _ = normalize_attribute_column(attributes, ClosedListIndex(CLOSED_LISTS))
+
+    assert parse_attributes(text[0])['Color'] == 'Rosa'
+    assert parse_attributes(text[0])['Género'] == 'Bebé niño'
+    assert text[1] == 'ERROR_API_FATAL: 503'
+    assert text[2] == ''
+    assert invalid.tolist() == [[], [], [], ['Color']]
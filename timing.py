@@ -13,7 +13,9 @@ Características:
 
 import os
 import time
+import asyncio
 import logging
+import argparse
 import statistics
 from pathlib import Path
 from typing import Optional, Dict, Any, List, Tuple
@@ -27,6 +29,19 @@ from google.genai import types
 from tqdm.auto import tqdm
 from dotenv import load_dotenv
 
+from cobertura_solicitudes import percentile
+from cola_reintentos import PERMANENT_CLASSES, QUOTA, RetryPolicy, classify_error
+from control_concurrencia import AIMDController, is_quota_error, retry_delay_from_error
+from cache_contexto import cached_token_count, create_context_cache, delete_context_cache
+from atributos import ATTRIBUTE_NAMES, parse_attributes
+from empaquetado import PackedItem, build_packed_contents, split_packed_response
+from limitador_compartido import shared_rate_limiter
+from pool_claves import load_api_keys
+from uso_tokens import TokenUsage, count_prompt_tokens, usage_cost
+from perfiles_generacion import GENERATION_PROFILES, get_profile, profile_options
+from plantilla_prompt import split_prompt
+from preprocesamiento_imagenes import ImagePreprocessConfig, preprocess_image
+
 
 @dataclass
 class TimingMetrics:
@@ -43,6 +58,18 @@ class TimingMetrics:
     max_response_time: float
     requests_per_minute: float
     estimated_time_per_1000: float
+    context_cache_hits: int = 0
+    context_cache_hit_rate: float = 0.0
+    cached_tokens_saved: int = 0
+    concurrency_limit: float = 1.0
+    # Tokens promedio por request exitosa según usage_metadata
+    avg_prompt_tokens: float = 0.0
+    avg_image_tokens: float = 0.0
+    avg_cached_tokens: float = 0.0
+    avg_thinking_tokens: float = 0.0
+    avg_output_tokens: float = 0.0
+    preflight_prompt_tokens: Optional[int] = None  # count_tokens del prompt completo antes del test
+    cost_per_request: Optional[float] = None  # USD según MODEL_PRICES
 
 
 @dataclass
@@ -84,26 +111,75 @@ class TimingOptimizer:
         
         # Configuración base de la notebook
         self.GEMINI_MODEL = 'gemini-2.5-flash'
+        self.GENERATION_PROFILE = 'balanced'  # fast | balanced | accurate
         self.MAX_RETRIES = 5
         self.BASE_DELAY = 1.5  # Empezar más agresivo
+        self.RETRY_POLICY = RetryPolicy()  # Backoff con jitter por clase de error
         self.INITIAL_RATE_LIMIT = 1.0  # Delay inicial más bajo
         self.IMAGE_DIRECTORY = Path('images')
         self.PROMPT_FILE = Path('prompt_api.txt')
         
         # Nuevas configuraciones para optimización
         self.QUOTA_LIMIT_FREE_TIER = 10  # Requests per minute for free tier
+        self.TOKENS_PER_MINUTE_LIMIT = 250_000  # Tokens de entrada por minuto (free tier)
+        self.IMAGE_TOKENS_ESTIMATE = 258  # Tokens aproximados por imagen
         self.OPTIMIZATION_SAMPLE_SIZE = 10  # Número de requests para calcular métricas
         self.TARGET_SUCCESS_RATE = 0.95  # 95% de éxito objetivo
         
+        # Limitador compartido con los demás procesos que usan la misma clave
+        self.SHARED_RATE_LIMIT = True
+        
+        # Control de concurrencia AIMD (requests en vuelo)
+        self.INITIAL_CONCURRENCY = 2
+        self.MAX_CONCURRENCY = 16
+
+        # Context caching del prefijo estático del prompt
+        self.USE_CONTEXT_CACHE = True
+        self.CONTEXT_CACHE_TTL = 3600  # segundos
+
+        # Preprocesamiento de imágenes (None para enviar la original)
+        self.IMAGE_PREPROCESS = ImagePreprocessConfig(max_side=1024, crop_borders=True, image_format='JPEG', quality=85)
+        self.RESOLUTION_BENCHMARK_SETTINGS = [
+            ImagePreprocessConfig(max_side=1024, quality=85),
+            ImagePreprocessConfig(max_side=768, quality=85),
+            ImagePreprocessConfig(max_side=512, quality=80),
+            ImagePreprocessConfig(max_side=384, quality=75, image_format='WEBP'),
+        ]
+        
+        # Empaquetado de varios productos por request
+        self.PACK_BENCHMARK_SIZES = [1, 2, 4, 8]
+        
     def initialize_client(self):
         """Inicializar cliente de Gemini"""
         try:
-            self.client = genai.Client(api_key=os.getenv('GEMINI_API_KEY'))
+            api_keys = load_api_keys()
+            api_key = api_keys[0][1] if api_keys else None
+            self.client = genai.Client(api_key=api_key)
+            self.rate_limiter = None
+            if self.SHARED_RATE_LIMIT and api_key:
+                self.rate_limiter = shared_rate_limiter(
+                    api_key, self.GEMINI_MODEL, self.QUOTA_LIMIT_FREE_TIER, self.TOKENS_PER_MINUTE_LIMIT
+                )
             self.logger.info("Cliente de Gemini inicializado correctamente")
         except Exception as e:
             self.logger.error(f"Error al inicializar cliente de Gemini: {e}")
             raise
             
+    def pace(self, tokens: int = 0):
+        """Espera turno en el limitador compartido entre procesos (request de ≈`tokens` tokens de entrada)"""
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire_blocking(tokens)
+            
+    def preflight_count_tokens(self, image_path: Path, prompt_text: str) -> Optional[int]:
+        """Tokens de entrada de una request (imagen preprocesada + prompt) según count_tokens"""
+        if self.IMAGE_PREPROCESS is not None:
+            image_path = preprocess_image(image_path, self.IMAGE_PREPROCESS)
+        contents = [
+            types.Part.from_bytes(data=image_path.read_bytes(), mime_type=self.get_mime_type(image_path)),
+            types.Part.from_text(text=prompt_text)
+        ]
+        return count_prompt_tokens(self.client, self.GEMINI_MODEL, contents)
+        
     def load_prompt(self) -> str:
         """Cargar prompt desde archivo"""
         try:
@@ -125,21 +201,39 @@ class TimingOptimizer:
         }
         return mime_types.get(extension, 'image/jpeg')
         
-    def process_single_request(self, image_path: Path, prompt: str) -> Tuple[str, float, bool]:
+    def process_single_request(
+        self,
+        image_path: Path,
+        prompt: str,
+        cached_content: Optional[str] = None,
+        preprocess: Optional[ImagePreprocessConfig] = None,
+        profile_name: Optional[str] = None,
+        retry_quota: bool = True
+    ) -> Tuple[str, float, bool, Any]:
         """
         Procesar una sola request midiendo tiempo y éxito
         
+        Args:
+            cached_content: Nombre del context cache con el prefijo estático;
+                en ese caso `prompt` es solo la parte del producto
+            preprocess: Configuración de preprocesamiento de la imagen
+            profile_name: Perfil de generación (por defecto GENERATION_PROFILE)
+            retry_quota: Si es False, un error de cuota se devuelve de inmediato
+                como ERROR_CUOTA para que lo gestione el controlador AIMD
+        
         Returns:
-            (response, time_taken, success)
+            (response, time_taken, success, usage_metadata)
         """
         if not image_path.exists():
-            return f"ERROR_IMAGEN: Archivo no encontrado", 0.0, False
+            return f"ERROR_IMAGEN: Archivo no encontrado", 0.0, False, None
             
         try:
+            if preprocess is not None:
+                image_path = preprocess_image(image_path, preprocess)
             with open(image_path, 'rb') as f:
                 image_bytes = f.read()
         except Exception as e:
-            return f"ERROR_LECTURA: {str(e)}", 0.0, False
+            return f"ERROR_LECTURA: {str(e)}", 0.0, False, None
             
         mime_type = self.get_mime_type(image_path)
         contents = [
@@ -147,42 +241,54 @@ class TimingOptimizer:
             types.Part.from_text(text=prompt)
         ]
         
+        options = profile_options(get_profile(profile_name or self.GENERATION_PROFILE), self.GEMINI_MODEL)
+        if cached_content:
+            options['cached_content'] = cached_content
+        generation_config = types.GenerateContentConfig(**options)
+        tokens = len(prompt) // 4 + self.IMAGE_TOKENS_ESTIMATE
+        
+        # La espera de turno no cuenta como latencia
+        self.pace(tokens)
         start_time = time.time()
         
         for attempt in range(self.MAX_RETRIES):
+            if attempt:
+                self.pace(tokens)
             try:
                 response = self.client.models.generate_content(
                     model=self.GEMINI_MODEL,
-                    contents=contents
+                    contents=contents,
+                    config=generation_config
                 )
                 
                 end_time = time.time()
                 time_taken = end_time - start_time
                 
-                return response.text.strip().replace('\n', ' '), time_taken, True
+                return response.text.strip().replace('\n', ' '), time_taken, True, response.usage_metadata
                 
             except Exception as e:
                 error_message = str(e)
+                failure = classify_error(e)
                 
                 # Detectar errores de cuota
-                if "429" in error_message or "RESOURCE_EXHAUSTED" in error_message:
+                if failure.error_class == QUOTA:
+                    if not retry_quota:
+                        return f"ERROR_CUOTA: {error_message}", time.time() - start_time, False, None
                     self.logger.warning(f"Cuota excedida en intento {attempt + 1}")
-                    if attempt < self.MAX_RETRIES - 1:
-                        # Esperar más tiempo en errores de cuota
-                        wait_time = self.BASE_DELAY * (3 ** attempt)  # Backoff más agresivo
-                        self.logger.info(f"Esperando {wait_time}s por cuota...")
-                        time.sleep(wait_time)
-                    continue
                     
-                # Otros errores
+                # Errores permanentes (bloqueo de seguridad, imagen inválida): no reintentar
+                if failure.error_class in PERMANENT_CLASSES:
+                    return self.RETRY_POLICY.final_message(failure), time.time() - start_time, False, None
+                    
                 if attempt < self.MAX_RETRIES - 1:
-                    wait_time = self.BASE_DELAY * (2 ** attempt)
+                    wait_time = self.RETRY_POLICY.delay(failure, attempt)
+                    self.logger.info(f"Esperando {wait_time:.1f}s ({failure.error_class})...")
                     time.sleep(wait_time)
                 else:
                     end_time = time.time()
-                    return f"ERROR_API: {error_message}", end_time - start_time, False
+                    return f"ERROR_API: {error_message}", end_time - start_time, False, None
                     
-        return "ERROR_INESPERADO", time.time() - start_time, False
+        return "ERROR_INESPERADO", time.time() - start_time, False, None
         
     def run_timing_test(self, num_samples: int = 10) -> TimingMetrics:
         """
@@ -190,49 +296,92 @@ class TimingOptimizer:
         """
         self.logger.info(f"🚀 Iniciando test de timing con {num_samples} muestras")
         
-        # Cargar prompt
-        prompt = self.load_prompt()
+        # Cargar prompt y registrar el prefijo estático en el context cache
+        prompt_parts = split_prompt(self.load_prompt())
+        cached_content = None
+        if self.USE_CONTEXT_CACHE:
+            cached_content = create_context_cache(
+                self.client, self.GEMINI_MODEL, prompt_parts.static_prefix, self.CONTEXT_CACHE_TTL
+            )
+        prompt = prompt_parts.product_suffix if cached_content else prompt_parts.full_text
         
         # Obtener imágenes de muestra
         sample_images = list(self.IMAGE_DIRECTORY.glob("*.jpg"))[:num_samples]
         if len(sample_images) < num_samples:
             self.logger.warning(f"Solo se encontraron {len(sample_images)} imágenes de {num_samples} solicitadas")
             
+        # Estimación previa con count_tokens (prompt completo, como sin context cache)
+        preflight_tokens = None
+        if sample_images:
+            preflight_tokens = self.preflight_count_tokens(sample_images[0], prompt_parts.full_text)
+            if preflight_tokens:
+                self.logger.info(f"🔢 count_tokens: {preflight_tokens:,} tokens de entrada por request")
+            
         request_times = []
         success_count = 0
         error_count = 0
         quota_errors = 0
         rate_limit_errors = 0
+        context_cache_hits = 0
+        cached_tokens_saved = 0
+        usage_total = TokenUsage()
         
-        test_start = time.time()
+        controller = AIMDController(initial_limit=self.INITIAL_CONCURRENCY, max_limit=self.MAX_CONCURRENCY)
         
-        with tqdm(total=len(sample_images), desc="Test de timing") as pbar:
-            for i, image_path in enumerate(sample_images):
-                self.logger.info(f"Procesando muestra {i+1}/{len(sample_images)}: {image_path.name}")
-                
-                response, time_taken, success = self.process_single_request(image_path, prompt)
+        async def _run_sample(image_path: Path, pbar):
+            nonlocal success_count, error_count, quota_errors, rate_limit_errors
+            nonlocal context_cache_hits, cached_tokens_saved, usage_total
+            
+            for attempt in range(self.MAX_RETRIES):
+                await controller.acquire()
+                try:
+                    response, time_taken, success, usage = await asyncio.to_thread(
+                        self.process_single_request,
+                        image_path, prompt, cached_content, self.IMAGE_PREPROCESS, None, False
+                    )
+                finally:
+                    controller.release()
+                    
+                # Cuota: el controlador recorta la concurrencia y se reintenta
+                if response.startswith("ERROR_CUOTA") and attempt < self.MAX_RETRIES - 1:
+                    quota_errors += 1
+                    retry_delay = retry_delay_from_error(response)
+                    controller.on_quota_error(retry_delay)
+                    self.logger.warning(f"Cuota excedida ({image_path.name}), límite AIMD {controller.limit:.2f}")
+                    await asyncio.sleep(self.RETRY_POLICY.delay(classify_error(Exception(response)), attempt))
+                    continue
+                break
                 
-                request_times.append(time_taken)
+            request_times.append(time_taken)
+            
+            if success:
+                controller.on_success()
+                success_count += 1
+                usage_total = usage_total + TokenUsage.from_metadata(usage)
+                cached_tokens = cached_token_count(usage)
+                if cached_tokens:
+                    context_cache_hits += 1
+                    cached_tokens_saved += cached_tokens
+                self.logger.info(f"✅ {image_path.name} en {time_taken:.2f}s (límite AIMD {controller.limit:.2f})")
+            else:
+                error_count += 1
+                if is_quota_error(response):
+                    quota_errors += 1
+                elif "RATE_LIMIT" in response:
+                    rate_limit_errors += 1
+                self.logger.error(f"❌ Error: {response[:100]}")
                 
-                if success:
-                    success_count += 1
-                    self.logger.info(f"✅ Éxito en {time_taken:.2f}s")
-                else:
-                    error_count += 1
-                    if "429" in response or "RESOURCE_EXHAUSTED" in response:
-                        quota_errors += 1
-                    elif "RATE_LIMIT" in response:
-                        rate_limit_errors += 1
-                    self.logger.error(f"❌ Error: {response[:100]}")
-                    
-                # Rate limiting adaptativo
-                if i < len(sample_images) - 1:  # No esperar después del último
-                    delay = self.calculate_adaptive_delay(request_times, success_count, error_count)
-                    time.sleep(delay)
-                    
-                pbar.update(1)
+            pbar.update(1)
+            
+        async def _run_all():
+            with tqdm(total=len(sample_images), desc="Test de timing") as pbar:
+                await asyncio.gather(*(_run_sample(image_path, pbar) for image_path in sample_images))
                 
+        test_start = time.time()
+        asyncio.run(_run_all())
+        
         total_time = time.time() - test_start
+        delete_context_cache(self.client, cached_content)
         
         # Calcular métricas
         if request_times:
@@ -241,7 +390,7 @@ class TimingOptimizer:
             min_time = min(request_times)
             max_time = max(request_times)
             requests_per_minute = len(request_times) / (total_time / 60)
-            estimated_time_per_1000 = (avg_time + self.INITIAL_RATE_LIMIT) * 1000 / 60  # en minutos
+            estimated_time_per_1000 = 1000 / requests_per_minute  # en minutos, con la concurrencia alcanzada
         else:
             avg_time = median_time = min_time = max_time = 0
             requests_per_minute = 0
@@ -259,40 +408,300 @@ class TimingOptimizer:
             min_response_time=min_time,
             max_response_time=max_time,
             requests_per_minute=requests_per_minute,
-            estimated_time_per_1000=estimated_time_per_1000
+            estimated_time_per_1000=estimated_time_per_1000,
+            context_cache_hits=context_cache_hits,
+            context_cache_hit_rate=context_cache_hits / success_count if success_count else 0.0,
+            cached_tokens_saved=cached_tokens_saved,
+            concurrency_limit=controller.limit,
+            preflight_prompt_tokens=preflight_tokens
         )
+        if success_count:
+            average = usage_total.split(success_count)
+            metrics.avg_prompt_tokens = average.prompt_tokens
+            metrics.avg_image_tokens = average.image_tokens
+            metrics.avg_cached_tokens = average.cached_tokens
+            metrics.avg_thinking_tokens = average.thinking_tokens
+            metrics.avg_output_tokens = average.output_tokens
+            metrics.cost_per_request = usage_cost(self.GEMINI_MODEL, average)
         
         self.metrics_history.append(metrics)
         return metrics
         
-    def calculate_adaptive_delay(self, recent_times: List[float], success_count: int, error_count: int) -> float:
-        """Calcular delay adaptativo basado en métricas recientes"""
-        if not recent_times:
-            return self.INITIAL_RATE_LIMIT
+    def run_resolution_benchmark(
+        self,
+        num_samples: int = 5,
+        settings_list: Optional[List[ImagePreprocessConfig]] = None
+    ) -> Dict[str, Dict[str, Any]]:
+        """
+        Comparar latencia y concordancia de atributos entre resoluciones
+        
+        La referencia es la imagen original; para cada configuración se mide
+        la latencia, el tamaño enviado y el porcentaje de atributos iguales
+        a los extraídos de la original, sobre las mismas muestras.
+        """
+        if settings_list is None:
+            settings_list = self.RESOLUTION_BENCHMARK_SETTINGS
             
-        # Tasa de éxito actual
-        total_requests = success_count + error_count
-        success_rate = success_count / total_requests if total_requests > 0 else 0
+        prompt = split_prompt(self.load_prompt()).full_text
+        sample_images = list(self.IMAGE_DIRECTORY.glob("*.jpg"))[:num_samples]
         
-        # Tiempo promedio reciente (últimas 5 requests)
-        recent_avg = statistics.mean(recent_times[-5:]) if len(recent_times) >= 5 else statistics.mean(recent_times)
+        variants: List[Tuple[str, Optional[ImagePreprocessConfig]]] = [('original', None)]
+        variants += [(f"{s.tag}_{s.image_format.lower()}", s) for s in settings_list]
         
-        # Ajustar delay basado en tasa de éxito y tiempo de respuesta
-        if success_rate >= self.TARGET_SUCCESS_RATE:
-            # Si va bien, ser más agresivo
-            adaptive_delay = max(0.5, self.INITIAL_RATE_LIMIT * 0.8)
-        elif success_rate >= 0.8:
-            # Mantener delay actual
-            adaptive_delay = self.INITIAL_RATE_LIMIT
-        else:
-            # Si hay muchos errores, ser más conservador
-            adaptive_delay = self.INITIAL_RATE_LIMIT * 1.5
+        reference: Dict[str, Dict[str, str]] = {}
+        results: Dict[str, Dict[str, Any]] = {}
+        
+        for label, settings in variants:
+            self.logger.info(f"🖼️  Benchmark de resolución: {label}")
+            times, sizes, agreements = [], [], []
+            errors = 0
+            
+            for image_path in tqdm(sample_images, desc=label):
+                sent_path = preprocess_image(image_path, settings) if settings else image_path
+                sizes.append(sent_path.stat().st_size)
+                
+                response, time_taken, success, _ = self.process_single_request(image_path, prompt, preprocess=settings)
+                if not success:
+                    errors += 1
+                    continue
+                times.append(time_taken)
+                
+                attributes = parse_attributes(response)
+                if settings is None:
+                    reference[image_path.name] = attributes
+                elif image_path.name in reference:
+                    expected = reference[image_path.name]
+                    matches = sum(
+                        str(attributes.get(name, '')).lower() == str(expected.get(name, '')).lower()
+                        for name in ATTRIBUTE_NAMES
+                    )
+                    agreements.append(matches / len(ATTRIBUTE_NAMES))
+                    
+            results[label] = {
+                "samples": len(sample_images),
+                "errors": errors,
+                "average_response_time": statistics.mean(times) if times else 0.0,
+                "median_response_time": statistics.median(times) if times else 0.0,
+                "average_image_bytes": statistics.mean(sizes) if sizes else 0,
+                "attribute_agreement": statistics.mean(agreements) if agreements else (1.0 if settings is None else 0.0)
+            }
+            
+        print("\n" + "="*80)
+        print("🖼️  BENCHMARK DE RESOLUCIÓN")
+        print("="*80)
+        print(f"  {'Configuración':<24}{'Latencia prom.':>16}{'Tamaño prom.':>16}{'Concordancia':>16}")
+        for label, r in results.items():
+            print(f"  {label:<24}{r['average_response_time']:>15.2f}s{r['average_image_bytes']/1024:>13.1f} KB"
+                  f"{r['attribute_agreement']*100:>15.1f}%")
+            
+        filename = f"timing_resolucion_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+        with open(filename, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+        self.logger.info(f"📄 Benchmark guardado en: {filename}")
+        
+        return results
+        
+    def process_packed_request(
+        self,
+        image_paths: List[Path],
+        product_prompt: str,
+        static_prefix: str
+    ) -> Tuple[Dict[str, str], float, bool]:
+        """
+        Procesar varias imágenes en una sola request empaquetada
+        
+        Returns:
+            (atributos por nombre de imagen, time_taken, success)
+        """
+        items = []
+        for image_path in image_paths:
+            if self.IMAGE_PREPROCESS is not None:
+                image_path = preprocess_image(image_path, self.IMAGE_PREPROCESS)
+            items.append(PackedItem(
+                product_id=image_path.stem,
+                image_bytes=image_path.read_bytes(),
+                mime_type=self.get_mime_type(image_path),
+                product_prompt=product_prompt
+            ))
+        product_ids = [item.product_id for item in items]
+        contents = build_packed_contents(items, static_prefix)
+        options = profile_options(get_profile(self.GENERATION_PROFILE), self.GEMINI_MODEL, len(items))
+        options['response_mime_type'] = 'application/json'
+        generation_config = types.GenerateContentConfig(**options)
+        tokens = len(static_prefix) // 4 + len(items) * (len(product_prompt) // 4 + self.IMAGE_TOKENS_ESTIMATE)
+        
+        self.pace(tokens)
+        start_time = time.time()
+        for attempt in range(self.MAX_RETRIES):
+            if attempt:
+                self.pace(tokens)
+            try:
+                response = self.client.models.generate_content(
+                    model=self.GEMINI_MODEL,
+                    contents=contents,
+                    config=generation_config
+                )
+                results = split_packed_response(response.text, product_ids)
+                return results, time.time() - start_time, True
+            except Exception as e:
+                self.logger.warning(f"Paquete de {len(items)}: intento {attempt + 1} falló: {e}")
+                if attempt < self.MAX_RETRIES - 1:
+                    time.sleep(self.RETRY_POLICY.delay(classify_error(e), attempt))
+                    
+        return {pid: "ERROR_API" for pid in product_ids}, time.time() - start_time, False
+        
+    def run_packing_benchmark(
+        self,
+        num_samples: int = 8,
+        pack_sizes: Optional[List[int]] = None
+    ) -> Dict[int, Dict[str, Any]]:
+        """
+        Comparar modo de un producto por request contra modo empaquetado
+        
+        Con el mismo conjunto de muestras mide latencia por request, productos
+        por minuto medidos, productos por minuto bajo la cuota de requests y la
+        concordancia de atributos contra el modo de un producto.
+        """
+        if pack_sizes is None:
+            pack_sizes = self.PACK_BENCHMARK_SIZES
+            
+        prompt_parts = split_prompt(self.load_prompt())
+        sample_images = list(self.IMAGE_DIRECTORY.glob("*.jpg"))[:num_samples]
+        
+        reference: Dict[str, Dict[str, str]] = {}
+        results: Dict[int, Dict[str, Any]] = {}
+        
+        for pack_size in sorted(set(pack_sizes)):
+            self.logger.info(f"📦 Benchmark de empaquetado: {pack_size} producto(s) por request")
+            call_times = []
+            outputs: Dict[str, str] = {}
+            start = time.time()
+            
+            for i in tqdm(range(0, len(sample_images), pack_size), desc=f"paquete={pack_size}"):
+                chunk = sample_images[i:i + pack_size]
+                if pack_size == 1:
+                    response, time_taken, success, _ = self.process_single_request(
+                        chunk[0], prompt_parts.full_text, preprocess=self.IMAGE_PREPROCESS
+                    )
+                    chunk_outputs = {chunk[0].stem: response}
+                else:
+                    chunk_outputs, time_taken, success = self.process_packed_request(
+                        chunk, prompt_parts.product_suffix, prompt_parts.static_prefix
+                    )
+                call_times.append(time_taken)
+                outputs.update(chunk_outputs)
+                
+            total_time = time.time() - start
+            errors = sum(1 for text in outputs.values() if text.startswith('ERROR'))
+            
+            agreements = []
+            for stem, text in outputs.items():
+                attributes = parse_attributes(text)
+                if pack_size == 1:
+                    reference[stem] = attributes
+                elif stem in reference and attributes:
+                    matches = sum(
+                        str(attributes.get(name, '')).lower() == str(reference[stem].get(name, '')).lower()
+                        for name in ATTRIBUTE_NAMES
+                    )
+                    agreements.append(matches / len(ATTRIBUTE_NAMES))
+                    
+            average_call = statistics.mean(call_times) if call_times else 0.0
+            results[pack_size] = {
+                "requests": len(call_times),
+                "errors": errors,
+                "average_request_time": average_call,
+                "products_per_minute": len(outputs) / (total_time / 60) if total_time else 0.0,
+                "products_per_minute_at_quota": self.QUOTA_LIMIT_FREE_TIER * pack_size,
+                "attribute_agreement": statistics.mean(agreements) if agreements else (1.0 if pack_size == 1 else 0.0)
+            }
+            
+        print("\n" + "="*80)
+        print("📦 BENCHMARK DE EMPAQUETADO")
+        print("="*80)
+        print(f"  {'Productos/req':<14}{'Latencia req.':>15}{'Prod./min':>12}{'Prod./min (cuota)':>20}{'Concordancia':>15}{'Errores':>9}")
+        for pack_size, r in results.items():
+            print(f"  {pack_size:<14}{r['average_request_time']:>14.2f}s{r['products_per_minute']:>12.1f}"
+                  f"{r['products_per_minute_at_quota']:>20}{r['attribute_agreement']*100:>14.1f}%{r['errors']:>9}")
+            
+        filename = f"timing_empaquetado_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+        with open(filename, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+        self.logger.info(f"📄 Benchmark guardado en: {filename}")
+        
+        return results
+        
+    def run_profile_comparison(
+        self,
+        num_samples: int = 10,
+        profile_names: Optional[List[str]] = None
+    ) -> Dict[str, Dict[str, Any]]:
+        """
+        Ejecutar cada perfil de generación sobre las mismas muestras
+        
+        Reporta la distribución de latencia (p50/p90/p99) de cada perfil lado
+        a lado, junto con la concordancia de atributos contra el primero.
+        """
+        if profile_names is None:
+            profile_names = list(GENERATION_PROFILES)
+            
+        prompt = split_prompt(self.load_prompt()).full_text
+        sample_images = list(self.IMAGE_DIRECTORY.glob("*.jpg"))[:num_samples]
+        
+        reference: Dict[str, Dict[str, str]] = {}
+        results: Dict[str, Dict[str, Any]] = {}
+        
+        for profile_name in profile_names:
+            self.logger.info(f"🎛️  Perfil de generación: {profile_name}")
+            times, agreements = [], []
+            errors = 0
+            
+            for image_path in tqdm(sample_images, desc=profile_name):
+                response, time_taken, success, _ = self.process_single_request(
+                    image_path, prompt, preprocess=self.IMAGE_PREPROCESS, profile_name=profile_name
+                )
+                if not success:
+                    errors += 1
+                    continue
+                times.append(time_taken)
+                
+                attributes = parse_attributes(response)
+                if profile_name == profile_names[0]:
+                    reference[image_path.name] = attributes
+                elif image_path.name in reference:
+                    matches = sum(
+                        str(attributes.get(name, '')).lower() == str(reference[image_path.name].get(name, '')).lower()
+                        for name in ATTRIBUTE_NAMES
+                    )
+                    agreements.append(matches / len(ATTRIBUTE_NAMES))
+                    
+            results[profile_name] = {
+                "samples": len(sample_images),
+                "errors": errors,
+                "request_times": times,
+                "mean": statistics.mean(times) if times else 0.0,
+                "p50": percentile(times, 50),
+                "p90": percentile(times, 90),
+                "p99": percentile(times, 99),
+                "min": min(times) if times else 0.0,
+                "max": max(times) if times else 0.0,
+                "attribute_agreement": statistics.mean(agreements) if agreements else (1.0 if profile_name == profile_names[0] else 0.0)
+            }
             
-        # Ajustar por tiempo de respuesta (si es muy lento, esperar más)
-        if recent_avg > 3.0:  # Si toma más de 3 segundos
-            adaptive_delay *= 1.3
+        print("\n" + "="*80)
+        print("🎛️  COMPARACIÓN DE PERFILES DE GENERACIÓN")
+        print("="*80)
+        print(f"  {'Perfil':<12}{'Media':>9}{'p50':>9}{'p90':>9}{'p99':>9}{'Mín':>9}{'Máx':>9}{'Concord.':>10}{'Errores':>9}")
+        for profile_name, r in results.items():
+            print(f"  {profile_name:<12}{r['mean']:>8.2f}s{r['p50']:>8.2f}s{r['p90']:>8.2f}s{r['p99']:>8.2f}s"
+                  f"{r['min']:>8.2f}s{r['max']:>8.2f}s{r['attribute_agreement']*100:>9.1f}%{r['errors']:>9}")
             
-        return adaptive_delay
+        filename = f"timing_perfiles_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+        with open(filename, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+        self.logger.info(f"📄 Comparación guardada en: {filename}")
+        
+        return results
         
     def optimize_configuration(self, metrics: TimingMetrics) -> OptimizationConfig:
         """Generar configuración optimizada basada en métricas"""
@@ -323,7 +732,7 @@ class TimingOptimizer:
         return OptimizationConfig(
             optimal_delay=optimal_delay,
             batch_size=batch_size,
-            max_concurrent=1,  # Mantener secuencial para free tier
+            max_concurrent=max(1, int(metrics.concurrency_limit)),  # Límite alcanzado por el controlador AIMD
             checkpoint_frequency=checkpoint_freq,
             recommended_daily_limit=recommended_daily
         )
@@ -338,7 +747,7 @@ class TimingOptimizer:
         
         # Considerar tasa de errores para reintentos
         success_rate = metrics.success_count / (metrics.success_count + metrics.error_count)
-        effective_time_per_request = time_per_request / success_rate
+        effective_time_per_request = time_per_request / success_rate / max(1.0, metrics.concurrency_limit)
         
         # Cálculos de tiempo
         total_seconds = total_products * effective_time_per_request
@@ -346,13 +755,25 @@ class TimingOptimizer:
         total_hours = total_minutes / 60
         total_days = total_hours / 24
         
+        # Límite efectivo por minuto: requests o tokens de entrada, el que se agote primero
+        input_tokens = metrics.avg_prompt_tokens or metrics.preflight_prompt_tokens or 0
+        requests_by_tokens = self.TOKENS_PER_MINUTE_LIMIT / input_tokens if input_tokens else None
+        effective_rpm = self.QUOTA_LIMIT_FREE_TIER
+        limiting_factor = "requests por minuto"
+        if requests_by_tokens is not None and requests_by_tokens < effective_rpm:
+            effective_rpm = requests_by_tokens
+            limiting_factor = "tokens por minuto"
+        
         # Considerando límites de cuota
-        daily_limit = self.QUOTA_LIMIT_FREE_TIER * 60 * 24 * 0.8  # 80% del límite teórico
+        daily_limit = effective_rpm * 60 * 24 * 0.8  # 80% del límite teórico
         days_by_quota = total_products / daily_limit
         
         # El tiempo real será el mayor entre el tiempo de procesamiento y las restricciones de cuota
         realistic_days = max(total_days, days_by_quota)
         
+        # Costo con los tokens medidos (los reintentos fallidos casi no consumen tokens)
+        total_cost = metrics.cost_per_request * total_products if metrics.cost_per_request is not None else None
+        
         return {
             "total_products": total_products,
             "estimated_time": {
@@ -374,6 +795,18 @@ class TimingOptimizer:
                 "daily_processing_limit": int(daily_limit),
                 "optimal_batch_size": min(50, int(daily_limit / 20)),
                 "checkpoint_frequency": "cada 10 productos"
+            },
+            "token_usage": {
+                "input_tokens_per_request": input_tokens,
+                "output_tokens_per_request": metrics.avg_output_tokens + metrics.avg_thinking_tokens,
+                "tokens_per_minute_limit": self.TOKENS_PER_MINUTE_LIMIT,
+                "requests_per_minute_by_tokens": requests_by_tokens,
+                "effective_requests_per_minute": effective_rpm,
+                "limiting_factor": limiting_factor
+            },
+            "cost": {
+                "per_request_usd": metrics.cost_per_request,
+                "total_usd": total_cost
             }
         }
         
@@ -400,8 +833,23 @@ class TimingOptimizer:
         print(f"  Requests por minuto: {metrics.requests_per_minute:.1f}")
         print(f"  Tiempo estimado por 1000 productos: {metrics.estimated_time_per_1000:.1f} minutos")
         
+        print(f"\n🧊 CONTEXT CACHE:")
+        print(f"  Tasa de aciertos: {metrics.context_cache_hit_rate*100:.1f}% ({metrics.context_cache_hits} requests)")
+        print(f"  Tokens de entrada ahorrados: {metrics.cached_tokens_saved:,}")
+        
+        if metrics.avg_prompt_tokens or metrics.preflight_prompt_tokens:
+            print(f"\n🧾 TOKENS POR REQUEST:")
+            if metrics.preflight_prompt_tokens:
+                print(f"  count_tokens (previo): {metrics.preflight_prompt_tokens:,} de entrada")
+            print(f"  Entrada: {metrics.avg_prompt_tokens:,.0f} ({metrics.avg_image_tokens:,.0f} imagen, "
+                  f"{metrics.avg_cached_tokens:,.0f} desde caché)")
+            print(f"  Salida: {metrics.avg_output_tokens:,.0f} + {metrics.avg_thinking_tokens:,.0f} de thinking")
+            if metrics.cost_per_request is not None:
+                print(f"  Costo: ${metrics.cost_per_request:.5f} por request (${metrics.cost_per_request * 1000:.2f} por 1000)")
+        
         print(f"\n🔧 CONFIGURACIÓN OPTIMIZADA:")
         print(f"  Delay óptimo: {optimization.optimal_delay:.2f}s")
+        print(f"  Concurrencia (AIMD): {optimization.max_concurrent} requests en vuelo")
         print(f"  Tamaño de batch: {optimization.batch_size}")
         print(f"  Frecuencia de checkpoint: cada {optimization.checkpoint_frequency} productos")
         print(f"  Límite diario recomendado: {optimization.recommended_daily_limit:,} productos")
@@ -439,7 +887,10 @@ class TimingOptimizer:
             print(f"\n📦 VOLUMEN: {volume:,} productos")
             print(f"  ⏱️  Tiempo estimado: {estimation['estimated_time']['days']:.1f} días")
             print(f"  🚦 Tiempo realista (con cuotas): {estimation['quota_limited_time']['realistic_days']:.1f} días")
-            print(f"  📊 Límite diario recomendado: {estimation['recommendations']['daily_processing_limit']:,}")
+            print(f"  📊 Límite diario recomendado: {estimation['recommendations']['daily_processing_limit']:,} "
+                  f"(limitado por {estimation['token_usage']['limiting_factor']})")
+            if estimation['cost']['total_usd'] is not None:
+                print(f"  💵 Costo estimado: ${estimation['cost']['total_usd']:,.2f}")
             
     def save_metrics_report(self, filename: str = None):
         """Guardar reporte de métricas en JSON"""
@@ -468,13 +919,39 @@ class TimingOptimizer:
         self.logger.info(f"📄 Reporte guardado en: {filename}")
 
 
+def parse_args() -> argparse.Namespace:
+    """Argumentos de línea de comandos"""
+    parser = argparse.ArgumentParser(description="Optimizador de timing para extracción con Gemini")
+    parser.add_argument('--benchmark-resolucion', type=int, metavar='N', default=None,
+                        help="Comparar resoluciones de imagen sobre N muestras y salir")
+    parser.add_argument('--benchmark-empaquetado', type=int, metavar='N', default=None,
+                        help="Comparar modo individual contra empaquetado sobre N muestras y salir")
+    parser.add_argument('--comparar-perfiles', type=int, metavar='N', default=None,
+                        help="Ejecutar cada perfil de generación sobre N muestras y salir")
+    return parser.parse_args()
+
+
 def main():
     """Función principal del script"""
+    args = parse_args()
+    
     print("🚀 Iniciando Optimizador de Timing para Extracción de Atributos")
     print("="*80)
     
     optimizer = TimingOptimizer()
     
+    if args.benchmark_resolucion:
+        optimizer.run_resolution_benchmark(args.benchmark_resolucion)
+        return
+        
+    if args.benchmark_empaquetado:
+        optimizer.run_packing_benchmark(args.benchmark_empaquetado)
+        return
+        
+    if args.comparar_perfiles:
+        optimizer.run_profile_comparison(args.comparar_perfiles)
+        return
+    
     # Configurar número de muestras para el test
     sample_sizes = [5, 10, 20]  # Diferentes tamaños de muestra
     
@@ -0,0 +1,163 @@
+"""
+Contabilidad de tokens y costo a partir de `usage_metadata`
+Cada respuesta de Gemini trae los tokens de entrada (con el desglose por
+modalidad), los servidos desde el context cache, los de thinking y los de
+salida. Se acumulan por fila (un paquete se reparte entre sus productos) y
+por corrida y modelo, y con MODEL_PRICES se convierten en costo.
+"""
+
+import json
+import logging
+from pathlib import Path
+from datetime import datetime
+from types import SimpleNamespace
+from dataclasses import asdict, dataclass, fields
+from typing import Any, Dict, List, Optional
+
+from cascada_modelos import MODEL_PRICES
+
+
+logger = logging.getLogger(__name__)
+
+# Los tokens servidos desde el context cache se cobran a una fracción del precio de entrada
+CACHED_INPUT_PRICE_FACTOR = 0.25
+
+
+def _modality_tokens(details: Any, modality: str) -> int:
+    """Tokens de una modalidad en `prompt_tokens_details` (lista de ModalityTokenCount)."""
+    total = 0
+    for detail in details or []:
+        value = getattr(detail, 'modality', None)
+        if str(getattr(value, 'value', value)).upper() == modality:
+            total += getattr(detail, 'token_count', None) or 0
+    return total
+
+
+@dataclass
+class TokenUsage:
+    """Tokens de una o varias llamadas; `prompt_tokens` incluye imagen y caché"""
+    prompt_tokens: int = 0
+    image_tokens: int = 0
+    cached_tokens: int = 0
+    thinking_tokens: int = 0
+    output_tokens: int = 0
+    calls: int = 0
+
+    @classmethod
+    def from_metadata(cls, usage: Any) -> 'TokenUsage':
+        """Uso de una respuesta; sin `usage_metadata` cuenta solo la llamada."""
+        if usage is None:
+            return cls(calls=1)
+        return cls(
+            prompt_tokens=getattr(usage, 'prompt_token_count', None) or 0,
+            image_tokens=_modality_tokens(getattr(usage, 'prompt_tokens_details', None), 'IMAGE'),
+            cached_tokens=getattr(usage, 'cached_content_token_count', None) or 0,
+            thinking_tokens=getattr(usage, 'thoughts_token_count', None) or 0,
+            output_tokens=getattr(usage, 'candidates_token_count', None) or 0,
+            calls=1
+        )
+
+    @classmethod
+    def from_json(cls, usage: Optional[Dict[str, Any]]) -> 'TokenUsage':
+        """Uso de un `usageMetadata` en JSON (resultados de la Batch API, claves camelCase)."""
+        if not usage:
+            return cls(calls=1)
+        details = [
+            SimpleNamespace(modality=detail.get('modality'), token_count=detail.get('tokenCount'))
+            for detail in usage.get('promptTokensDetails') or []
+        ]
+        return cls(
+            prompt_tokens=usage.get('promptTokenCount') or 0,
+            image_tokens=_modality_tokens(details, 'IMAGE'),
+            cached_tokens=usage.get('cachedContentTokenCount') or 0,
+            thinking_tokens=usage.get('thoughtsTokenCount') or 0,
+            output_tokens=usage.get('candidatesTokenCount') or 0,
+            calls=1
+        )
+
+    def __add__(self, other: 'TokenUsage') -> 'TokenUsage':
+        return TokenUsage(*(getattr(self, f.name) + getattr(other, f.name) for f in fields(self)))
+
+    def split(self, parts: int) -> 'TokenUsage':
+        """Parte proporcional de una llamada empaquetada (`parts` productos)."""
+        if parts <= 1:
+            return self
+        return TokenUsage(*(getattr(self, f.name) / parts for f in fields(self)))
+
+    @property
+    def billed_output_tokens(self) -> float:
+        """Salida facturada: respuesta más thinking."""
+        return self.output_tokens + self.thinking_tokens
+
+    def as_record(self) -> Dict[str, float]:
+        """Campos no nulos, redondeados, para la bitácora."""
+        return {name: round(value, 1) for name, value in asdict(self).items() if value}
+
+
+def usage_cost(model_name: str, usage: TokenUsage) -> Optional[float]:
+    """Costo en USD según MODEL_PRICES (caché con descuento); None si el modelo no tiene precio."""
+    prices = MODEL_PRICES.get(model_name)
+    if prices is None:
+        return None
+    input_price, output_price = prices
+    fresh_input = usage.prompt_tokens - usage.cached_tokens
+    return (
+        fresh_input * input_price
+        + usage.cached_tokens * input_price * CACHED_INPUT_PRICE_FACTOR
+        + usage.billed_output_tokens * output_price
+    ) / 1_000_000
+
+
+class RunUsage:
+    """Uso acumulado de una corrida, por modelo"""
+
+    def __init__(self):
+        self.by_model: Dict[str, TokenUsage] = {}
+        self.rows = 0
+
+    def add(self, model_name: str, usage: TokenUsage):
+        self.by_model[model_name] = self.by_model.get(model_name, TokenUsage()) + usage
+
+    @property
+    def cost(self) -> Optional[float]:
+        """Costo total; None si algún modelo no tiene precio conocido."""
+        costs = [usage_cost(model_name, usage) for model_name, usage in self.by_model.items()]
+        if any(cost is None for cost in costs):
+            return None
+        return sum(costs)
+
+    def describe(self) -> List[str]:
+        """Una línea por modelo con tokens y costo."""
+        lines = []
+        for model_name, usage in self.by_model.items():
+            cost = usage_cost(model_name, usage)
+            cost_text = f"${cost:.4f}" if cost is not None else "costo desconocido"
+            lines.append(
+                f"{model_name}: {usage.calls:,.0f} llamadas, {usage.prompt_tokens:,.0f} entrada "
+                f"({usage.image_tokens:,.0f} imagen, {usage.cached_tokens:,.0f} caché), "
+                f"{usage.thinking_tokens:,.0f} thinking, {usage.output_tokens:,.0f} salida, {cost_text}"
+            )
+        return lines
+
+    def save(self, path: Path, **extra):
+        """Agrega el resumen de la corrida a un JSONL de corridas."""
+        record = {
+            'timestamp': datetime.now().isoformat(),
+            'rows': self.rows,
+            'models': {model_name: asdict(usage) for model_name, usage in self.by_model.items()},
+            'cost_usd': self.cost,
+            **{key: value for key, value in extra.items() if value is not None}
+        }
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+
+def count_prompt_tokens(client: Any, model_name: str, contents: List[Any]) -> Optional[int]:
+    """Tokens de entrada de `contents` según `count_tokens` (None si la llamada falla)."""
+    try:
+        return client.models.count_tokens(model=model_name, contents=contents).total_tokens
+    except Exception as e:
+        logger.warning(f"count_tokens no disponible ({e}); se usa la estimación local")
+        return None
@@ -0,0 +1,266 @@
+"""
+Validación y normalización de registros de atributos
+Revisa que los atributos de lista cerrada usen valores permitidos, que los
+atributos obligatorios estén presentes y que el resultado no contradiga los
+metadatos del producto (nombre, descripción, categoría). Los valores fuera de
+lista se reparan localmente (mayúsculas, acentos, coincidencia difusa) antes
+de marcar la fila para re-extracción.
+"""
+
+import re
+import difflib
+import unicodedata
+from typing import Dict, List, Optional, Tuple
+
+import pandas as pd
+
+from atributos import ATTRIBUTE_NAMES, MISSING_VALUE, format_attributes, is_missing, parse_attributes
+from esquema_respuesta import OPEN_ATTRIBUTES
+
+
+# Atributos que siempre se pueden determinar para ropa y artículos de bebé
+REQUIRED_ATTRIBUTES = ('Género', 'Tipo de producto')
+
+# Columnas de texto de productos.csv (y sus equivalentes en inglés)
+NAME_COLUMNS = ('nombre', 'name')
+TEXT_COLUMNS = NAME_COLUMNS + ('descripcion', 'description', 'categoria', 'category')
+
+
+def validate_record(record: Dict[str, str], closed_lists: Dict[str, List[str]]) -> List[str]:
+    """
+    Problemas de listas cerradas y atributos obligatorios.
+
+    Returns:
+        Lista de problemas encontrados (vacía si el registro es válido)
+    """
+    return [issue for _, issue in _record_issues(record, closed_lists)]
+
+
+def _record_issues(record: Dict[str, str], closed_lists: Dict[str, List[str]]) -> List[Tuple[str, str]]:
+    issues = []
+    for name in ATTRIBUTE_NAMES:
+        values = closed_lists.get(name)
+        value = record.get(name)
+        if not values or name in OPEN_ATTRIBUTES or is_missing(value):
+            continue
+        if value not in values:
+            issues.append((name, f"{name}: '{value}' fuera de la lista cerrada"))
+
+    for name in REQUIRED_ATTRIBUTES:
+        if is_missing(record.get(name)):
+            issues.append((name, f"{name}: falta atributo obligatorio"))
+    return issues
+
+
+def _contains_word(text: str, word: str) -> bool:
+    return re.search(r'(?<!\w)' + re.escape(word) + r'(?!\w)', text) is not None
+
+
+def check_metadata(
+    record: Dict[str, str],
+    metadata: Dict[str, str],
+    closed_lists: Dict[str, List[str]]
+) -> List[str]:
+    """
+    Desacuerdos entre el registro y los metadatos del producto.
+
+    Compara los atributos de lista cerrada que ya trae el CSV, el género
+    (niña/niño) del texto y el tipo de producto mencionado en el nombre.
+    """
+    return [issue for _, issue in _metadata_issues(record, metadata, closed_lists)]
+
+
+def _metadata_issues(
+    record: Dict[str, str],
+    metadata: Dict[str, str],
+    closed_lists: Dict[str, List[str]]
+) -> List[Tuple[str, str]]:
+    issues = []
+    for name in ATTRIBUTE_NAMES:
+        if name in OPEN_ATTRIBUTES or not closed_lists.get(name):
+            continue
+        known, value = metadata.get(name), record.get(name)
+        if not is_missing(known) and not is_missing(value) and str(known).lower() != value.lower():
+            issues.append((name, f"{name}: '{value}' contradice metadatos ('{known}')"))
+
+    text = ' '.join(
+        str(metadata[column]) for column in TEXT_COLUMNS if not is_missing(metadata.get(column))
+    ).lower()
+    gender = str(record.get('Género', '')).lower()
+    girl, boy = _contains_word(text, 'niña'), _contains_word(text, 'niño')
+    if girl and not boy and 'niño' in gender:
+        issues.append(('Género', f"Género: '{record['Género']}' contradice metadatos (niña)"))
+    elif boy and not girl and 'niña' in gender:
+        issues.append(('Género', f"Género: '{record['Género']}' contradice metadatos (niño)"))
+
+    product_name = ' '.join(
+        str(metadata[column]) for column in NAME_COLUMNS if not is_missing(metadata.get(column))
+    ).lower()
+    expected = _product_type_in(product_name, closed_lists.get('Tipo de producto', []))
+    value = record.get('Tipo de producto')
+    if expected and not is_missing(value) and value.lower() != expected.lower():
+        issues.append(('Tipo de producto', f"Tipo de producto: '{value}' contradice el nombre ('{expected}')"))
+    return issues
+
+
+def failing_attributes(
+    record: Dict[str, str],
+    metadata: Dict[str, str],
+    closed_lists: Dict[str, List[str]]
+) -> List[str]:
+    """Atributos con algún problema de validación o de metadatos, en el orden de salida."""
+    issues = _record_issues(record, closed_lists) + _metadata_issues(record, metadata, closed_lists)
+    failing = {name for name, _ in issues}
+    return [name for name in ATTRIBUTE_NAMES if name in failing]
+
+
+def _product_type_in(name: str, product_types: List[str]) -> Optional[str]:
+    """Tipo de producto de la lista cerrada mencionado en el nombre (el más largo)."""
+    for product_type in sorted(product_types, key=len, reverse=True):
+        if _contains_word(name, product_type.lower()):
+            return product_type
+    return None
+
+
+# Métodos de normalización, del más al menos confiable
+EXACT = 'exacto'
+NORMALIZED = 'normalizado'
+FUZZY = 'difuso'
+INVALID = 'invalido'
+EMPTY = 'vacio'
+
+_PARENTHESIS = re.compile(r'\s*\([^)]*\)')
+
+
+def normalize_text(value: str) -> str:
+    """Minúsculas, sin acentos y con espacios colapsados."""
+    decomposed = unicodedata.normalize('NFKD', str(value))
+    stripped = ''.join(char for char in decomposed if not unicodedata.combining(char))
+    return ' '.join(stripped.lower().split())
+
+
+class ClosedListIndex:
+    """
+    Índice en memoria de las listas cerradas.
+
+    Resuelve un valor con coincidencia exacta, luego sin mayúsculas/acentos
+    (también ignorando el código entre paréntesis de ColorAgrupador) y por
+    último con la coincidencia difusa más cercana. Los resultados se memorizan
+    por (atributo, valor), así que normalizar un DataFrame completo solo
+    evalúa cada valor distinto una vez.
+    """
+
+    def __init__(self, closed_lists: Dict[str, List[str]], fuzzy_cutoff: float = 0.8):
+        self.fuzzy_cutoff = fuzzy_cutoff
+        self.exact: Dict[str, set] = {}
+        self.normalized: Dict[str, Dict[str, str]] = {}
+        for name, values in closed_lists.items():
+            if name in OPEN_ATTRIBUTES or name not in ATTRIBUTE_NAMES or not values:
+                continue
+            self.exact[name] = set(values)
+            lookup: Dict[str, str] = {}
+            for value in values:
+                lookup.setdefault(normalize_text(value), value)
+                lookup.setdefault(normalize_text(_PARENTHESIS.sub('', value)), value)
+            self.normalized[name] = lookup
+        self._memo: Dict[Tuple[str, str], Tuple[str, str]] = {}
+
+    @property
+    def attributes(self) -> List[str]:
+        return list(self.exact)
+
+    def lookup(self, attribute: str, value) -> Tuple[str, str]:
+        """
+        Valor canónico de la lista cerrada.
+
+        Returns:
+            (valor, método); con método `invalido` el valor es el original
+        """
+        if is_missing(value):
+            return MISSING_VALUE, EMPTY
+        value = str(value).strip()
+        key = (attribute, value)
+        if key not in self._memo:
+            self._memo[key] = self._resolve(attribute, value)
+        return self._memo[key]
+
+    def _resolve(self, attribute: str, value: str) -> Tuple[str, str]:
+        if value in self.exact[attribute]:
+            return value, EXACT
+        normalized = normalize_text(value)
+        lookup = self.normalized[attribute]
+        if normalized in lookup:
+            return lookup[normalized], NORMALIZED
+        matches = difflib.get_close_matches(normalized, list(lookup), n=1, cutoff=self.fuzzy_cutoff)
+        if matches:
+            return lookup[matches[0]], FUZZY
+        return value, INVALID
+
+    def normalize_record(self, record: Dict[str, str]) -> Tuple[Dict[str, str], Dict[str, str]]:
+        """
+        Normaliza un registro.
+
+        Returns:
+            (registro normalizado con `nan` en lo irreparable, {atributo: valor irreparable})
+        """
+        normalized = dict(record)
+        invalid = {}
+        for name in self.attributes:
+            value, method = self.lookup(name, record.get(name))
+            if method == INVALID:
+                invalid[name] = value
+                value = MISSING_VALUE
+            normalized[name] = value
+        return normalized, invalid
+
+    def normalize_frame(self, records: pd.DataFrame) -> Tuple[pd.DataFrame, pd.DataFrame]:
+        """
+        Normaliza todas las columnas de lista cerrada de un DataFrame de registros.
+
+        Cada columna se resuelve sobre sus valores distintos y se mapea de vuelta.
+
+        Returns:
+            (registros normalizados, método aplicado por celda)
+        """
+        normalized = records.copy()
+        methods = pd.DataFrame(EMPTY, index=records.index, columns=self.attributes)
+        for name in self.attributes:
+            if name not in records.columns:
+                continue
+            resolved = {value: self.lookup(name, value) for value in records[name].dropna().unique()}
+            column_methods = records[name].map(lambda value: resolved.get(value, (None, EMPTY))[1])
+            methods[name] = column_methods.fillna(EMPTY)
+            normalized[name] = records[name].map(lambda value: resolved.get(value, (MISSING_VALUE, EMPTY))[0])
+            normalized.loc[methods[name] == INVALID, name] = MISSING_VALUE
+        return normalized, methods
+
+
+def normalize_attribute_column(
+    attributes: pd.Series,
+    index: ClosedListIndex
+) -> Tuple[pd.Series, pd.Series, pd.DataFrame]:
+    """
+    Normaliza una columna de atributos en formato `atributo: valor`.
+
+    Las filas con error se dejan intactas.
+
+    Returns:
+        (texto normalizado, lista de atributos irreparables por fila, métodos por celda)
+    """
+    valid = ~attributes.str.startswith('ERROR', na=True) & (attributes.str.len() > 0)
+    records = pd.DataFrame(
+        [parse_attributes(text) for text in attributes[valid]],
+        index=attributes[valid].index,
+        columns=ATTRIBUTE_NAMES
+    )
+    normalized, methods = index.normalize_frame(records)
+
+    text = attributes.copy()
+    text[valid] = pd.Series(
+        [format_attributes(record) for record in normalized.to_dict('records')], index=normalized.index, dtype=object
+    )
+    flags = methods == INVALID
+    invalid = pd.Series([[] for _ in attributes.index], index=attributes.index, dtype=object)
+    for idx, row in flags[flags.any(axis=1)].iterrows():
+        invalid[idx] = [name for name, flag in row.items() if flag]
+    return text, invalid, methods